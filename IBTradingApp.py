@@ -5,13 +5,20 @@ from ibapi.order import Order
 from ibapi.ticktype import TickTypeEnum
 from ibapi.execution import ExecutionFilter
 
-import numpy as np
-
+import os
 import time
+from collections import deque
 
-def avg(lst):
-    
-    return sum(lst)/len(lst)
+from instrument import Instrument
+from latency import LatencyMonitor
+from snapshot import SnapshotPublisher
+from recorder import Recorder
+from warmstart import WarmStart
+from orderbook import OrderBook, FILLED, CANCELLED
+from tradeledger import execution_time
+from risk import RiskBook
+from bars import BarBuilder
+from strategies import LONG, make_strategy, strategy_class
 
 """
 EWrapper is the class used for handling and processing the information
@@ -33,6 +40,35 @@ class TestClient(client.EClient):
     
         client.EClient.__init__(self,wrapper)
 
+"""
+Ways of coalescing ticks, see TradingApp.tickPrice:
+
+    None        every tick goes to the strategy as it comes in
+    "latest"    latest value wins, only the last price of each reqId since
+                the last flush is stored and handed to the strategy. An
+                instrument trading on bars still builds them from every
+                tick, like "batch"
+    "batch"     every tick is stored and folded into the averages, the
+                strategy runs once per instrument per flush
+"""
+COALESCE_MODES = (None, "latest", "batch")
+
+"""
+Builds a property on TradingApp that reads and writes the attribute of
+the same name on the first (primary) instrument. This keeps the single
+symbol attributes (self.prices, self.contract, self.long_window, ...)
+working for the GUI
+"""
+def _primary_attribute(name):
+    
+    def fget(self):
+        return getattr(self.instruments[0], name)
+    
+    def fset(self, value):
+        setattr(self.instruments[0], name, value)
+    
+    return property(fget, fset)
+
 """
 This is where the Trading Application is created. The class TradingApp
 is inheriting the EClient and EWrapper class to take advantage of the
@@ -41,12 +77,24 @@ full functionality of the IBAPI
 Functions from EWrapper get overridden to store critical information
 regarding price, volume, time, etc.
 
-The strategy currently being implemented here is a Moving Average
-Crossover Strategy
+The strategy is chosen per instrument (see strategies.py), by default
+the Moving Average Crossover Strategy. It only says which position it
+wants, run_strategy places the orders
+
+Any number of contracts can be traded over the one connection. Each one
+is an Instrument (see instrument.py) with its own strategy parameters
+and state, added with add_instrument. Callbacks are routed to their
+instrument in O(1) through dictionaries keyed by reqId, orderId and symbol
 """         
 class TradingApp(TestWrapper, TestClient):
     
-    def __init__(self, contract, long_window, short_window, quantity):
+    def __init__(self, contract, long_window, short_window, quantity, ma_type = "SMA",
+                 tick_retention = 100000, spill_dir = "tick_data", reconcile_interval = 300,
+                 publish_interval = 0.25, record_dir = None, warm_start = False,
+                 history_dir = "history", order_rate = 45, coalesce = None,
+                 coalesce_interval = 0.05, strategy = "crossover", max_position = None,
+                 max_loss = None, max_order_rate = None, bar_type = None, bar_size = 60,
+                 strategy_params = None):
         
         
         TestWrapper.__init__(self)
@@ -55,43 +103,307 @@ class TradingApp(TestWrapper, TestClient):
         #Keeps track of how long the object as been running for
         self.current_time = time.time()
         
-        #Take in user input for the length of the long window
-        #and the short window as well as the size of the trades
-        self.long_window = long_window
-        self.short_window = short_window
-        self.quantity = quantity
-        
-        #Create arrays to store price information as well as the 
-        #time that information comes in. Very useful for plots
-        self.prices = []
-        self.times = []
-        
-        #Create arrays to store the prices that buys and sells
-        #were placed at. Useful for tracking profit per trade
-        self.long_trades = np.array([[],[]])
-        self.short_trades = np.array([[],[]])
-        self.tradeDist = np.array([])
-        
-        #pos and noOpenOrders will both serve as a logical que
-        #orders can only be placed if noOpenOrders is True
-        self.pos = False
-        self.noOpenOrders = True
-        
-        #Stores the current order ID, status, and type
-        self.currentOrderStatus = ""
-        self.currentOrderType = ""
-        self.currentOrderId = int
-        
-        #Create array of all the executed order IDs. Useful for
-        #not entering duplicate entries in the long_trades
-        #and short_trades arrays
-        self.executedOrderIds = []
-        
-        #dummy variable to keep requesting executions made within the day
+        #Defaults for the instruments, at least tick_retention of the
+        #latest ticks of each instrument are kept in memory and older
+        #ticks are written to spill_dir, with epoch times. strategy_params
+        #are keyword arguments of the strategy (the entry and exit of
+        #"meanreversion" for instance)
+        self.ma_type = ma_type
+        self.strategy = strategy_class(strategy)
+        self.strategy_params = dict(strategy_params or {})
+        self.tick_retention = tick_retention
+        self.spill_dir = spill_dir
+        
+        #With bar_type set ("time", "tick" or "volume") the ticks are built
+        #into bars of bar_size seconds, ticks or shares and the strategy
+        #runs on the bar closes, see bars.py
+        self.bar_type = bar_type
+        self.bar_size = bar_size
+        
+        #Every traded contract and the tables used to route callbacks
+        #to them. bySymbol is rebuilt in subscribe in case a symbol was
+        #changed after the instrument was added
+        self.instruments = []
+        self.byReqId = {}
+        self.byOrderId = {}
+        self.bySymbol = {}
+        
+        #Take in user input for the contract being traded, the length
+        #of the long window and the short window as well as the size of
+        #the trades. This is the primary instrument, more can be added
+        self.add_instrument(contract, long_window, short_window, quantity)
+        
+        #Order IDs are handed out locally. TWS sends the first valid ID
+        #through nextValidId when connecting and every placed order
+        #takes the next one, so no reqIds is needed per order
+        self.nextOrderId = None
+        
+        #Positions and fills arrive through the position, orderStatus and
+        #execDetails callbacks. The day's executions are requested when
+        #subscribing, then again every reconcile_interval seconds in case
+        #one was missed
+        self.reconcile_interval = reconcile_interval
+        self.nextReconcile = time.monotonic() + reconcile_interval
+        
+        #How ticks are handed to the strategy when they come in faster
+        #than it keeps up with (see tickPrice and flush_ticks)
+        if coalesce not in COALESCE_MODES:
+            raise ValueError("unknown coalesce mode %r, expected one of %s"
+                             % (coalesce, ", ".join(map(str, COALESCE_MODES))))
+        
+        self.coalesce = coalesce
+        self.coalesce_interval = coalesce_interval
+        self.pendingTicks = {}
+        self.flushDeadline = None
+        
+        #Every order placed this session by orderId, with its state, fills
+        #and the exposure per symbol. At most order_rate orders a second
+        #are sent, the rest wait in the book (see orderbook.py)
+        self.orders = OrderBook(self._send_order, order_rate)
+        
+        #Position, average cost and P&L per symbol marked to every tick,
+        #and the limits every order is checked against (see risk.py)
+        self.risk = RiskBook(max_position, max_loss, max_order_rate)
+        
+        #dummy variable to give every execution request its own ID
         self.reqExecutionId = 0
         
-        #Store the contract details of what is being traded
-        self.contract = contract
+        #Stage timestamps and latency histograms from tick to fill,
+        #query with self.latency.snapshot() or write with self.latency.dump()
+        self.latency = LatencyMonitor()
+        
+        #Read-only copies of the state for the GUI thread, published at
+        #most every publish_interval seconds while messages come in and
+        #once more when the message queue goes quiet (see msgLoopRec)
+        self.snapshots = SnapshotPublisher(tick_retention)
+        self.publish_interval = publish_interval
+        self.nextPublish = 0.0
+        self.stale = False
+        self.publish()
+        
+        #Changes asked for by other threads (the GUI), run by the thread
+        #of the message loop that owns the instruments (see post)
+        self.commands = deque()
+        
+        #Every tick and new execution is also written to record_dir by a
+        #background thread when one is given (see recorder.py)
+        self.recorder = Recorder(record_dir).start() if record_dir else None
+        
+        #With warm_start each instrument is seeded with recent bars when
+        #it is subscribed, cached in history_dir (see warmstart.py)
+        self.warmStart = WarmStart(self, history_dir) if warm_start else None
+    
+    #The state of the primary instrument
+    contract = _primary_attribute("contract")
+    ticks = _primary_attribute("ticks")
+    ledger = _primary_attribute("ledger")
+    prices = _primary_attribute("prices")
+    times = _primary_attribute("times")
+    long_trades = _primary_attribute("long_trades")
+    short_trades = _primary_attribute("short_trades")
+    tradeDist = _primary_attribute("tradeDist")
+    long_window = _primary_attribute("long_window")
+    short_window = _primary_attribute("short_window")
+    long_ma = _primary_attribute("long_ma")
+    short_ma = _primary_attribute("short_ma")
+    quantity = _primary_attribute("quantity")
+    pos = _primary_attribute("pos")
+    noOpenOrders = _primary_attribute("noOpenOrders")
+    currentOrderStatus = _primary_attribute("currentOrderStatus")
+    currentOrderType = _primary_attribute("currentOrderType")
+    currentOrderId = _primary_attribute("currentOrderId")
+    
+    """
+    Self Made Function: add_instrument
+    
+    Adds a contract to trade with its own windows and trade size. The
+    instrument gets the next market data reqId (the first one is 1) and
+    is returned so its state can be read
+    
+    strategy_params default to the ones of the app when the instrument
+    runs the strategy of the app, and to none for any other strategy
+    """
+    def add_instrument(self, contract, long_window, short_window, quantity, ma_type = None,
+                       strategy = None, strategy_params = None):
+        
+        instrument = self.make_instrument(contract, long_window, short_window, quantity,
+                                          ma_type or self.ma_type)
+        instrument.ticks.origin = self.current_time
+        instrument.strategy = make_strategy(strategy or self.strategy, instrument,
+                                            **self._strategy_params(strategy, strategy_params))
+        
+        if self.bar_type is not None:
+            instrument.bars = BarBuilder(self.bar_type, self.bar_size, self.current_time,
+                                         self.tick_retention,
+                                         self._spill_path(contract, "_ohlcv.bin"))
+        
+        instrument.reqId = len(self.instruments) + 1
+        
+        self.instruments.append(instrument)
+        self.byReqId[instrument.reqId] = instrument
+        self.bySymbol[contract.symbol] = instrument
+        
+        return instrument
+    
+    """
+    Self Made Function: make_instrument
+    
+    The Instrument that keeps the ticks, averages and orders of a contract
+    """
+    def make_instrument(self, contract, long_window, short_window, quantity, ma_type):
+        
+        return Instrument(contract, long_window, short_window, quantity, ma_type,
+                          self.tick_retention, self._spill_path(contract))
+    
+    def _strategy_params(self, strategy, strategy_params):
+        
+        if strategy_params is not None:
+            return dict(strategy_params)
+        
+        if strategy is None or strategy_class(strategy) is self.strategy:
+            return dict(self.strategy_params)
+        
+        return {}
+    
+    def _spill_path(self, contract, suffix = "_ticks.bin"):
+        
+        if self.spill_dir is None:
+            return None
+        
+        return os.path.join(self.spill_dir, contract.symbol + suffix)
+    
+    """
+    Self Made Function: subscribe
+    
+    Requests market data for every instrument under its own reqId, and
+    the executions made over the day
+    """
+    def subscribe(self):
+        
+        self.run_commands()
+        
+        self.bySymbol = {}
+        
+        for instrument in self.instruments:
+            
+            self.bySymbol[instrument.contract.symbol] = instrument
+            instrument.ticks.spill_path = self._spill_path(instrument.contract)
+            
+            if self.warmStart is not None:
+                self.warmStart.start(instrument)
+            
+            self.reqMktData(instrument.reqId, instrument.contract, "", False, False, [])
+        
+        #Fills made earlier in the day go into the ledgers straight away
+        self.reconcile()
+    
+    """
+    Self Made Function: post
+    
+    Queues command(*args) to run on the thread of the message loop, the
+    only thread that changes the instruments, before the next message is
+    handled. Safe to call from any thread, e.g. from the GUI to change a
+    window:
+    
+        app.post(setattr, app, "short_window", 5)
+    """
+    def post(self, command, *args):
+        
+        self.commands.append((command, args))
+    
+    """
+    Self Made Function: run_commands
+    
+    Runs the commands queued by post, called by the message loop
+    """
+    def run_commands(self):
+        
+        if not self.commands:
+            return
+        
+        while self.commands:
+            command, args = self.commands.popleft()
+            command(*args)
+        
+        self.stale = True
+    
+    """
+    Self Made Function: publish
+    
+    Publishes a snapshot of every instrument, the P&L, the counters and
+    the latencies to self.snapshots. Only called from the thread running
+    the message loop
+    """
+    def publish(self):
+        
+        self.stale = False
+        self.nextPublish = time.monotonic() + self.publish_interval
+        
+        return self.snapshots.publish(self.instruments, self.risk,
+                                      {"latency": self.latency.counters,
+                                       "orders": self.orders.counters,
+                                       "risk": self.risk.counters},
+                                      self.latency)
+    
+    """
+    Overridden function: msgLoopRec
+    
+    Called by EClient.run after every message it processed. Runs the
+    commands posted by other threads, hands the coalesced ticks to the
+    strategy once the message queue is empty (or coalesce_interval has
+    passed since the first one), sends orders held back by the rate limit
+    and publishes a snapshot when the last one is older than
+    publish_interval
+    """
+    def msgLoopRec(self):
+        
+        self.stale = True
+        
+        if self.commands:
+            self.run_commands()
+        
+        if self.pendingTicks and (self.msg_queue.empty() or time.monotonic() >= self.flushDeadline):
+            self.flush_ticks()
+        
+        self.orders.pump()
+        
+        if time.monotonic() >= self.nextPublish:
+            self.close_bars()
+            self.publish()
+    
+    """
+    Overridden function: msgLoopTmo
+    
+    Called by EClient.run when no message came in for a while, runs the
+    commands posted by other threads, hands the coalesced ticks to the
+    strategy, sends orders held back by the rate limit and publishes
+    whatever changed since the last snapshot
+    """
+    def msgLoopTmo(self):
+        
+        self.run_commands()
+        
+        if self.pendingTicks:
+            self.flush_ticks()
+        
+        self.close_bars()
+        
+        self.orders.pump()
+        
+        if self.stale:
+            self.publish()
+    
+    """
+    Overridden function: disconnect
+    
+    Also makes sure everything recorded so far is on disk
+    """
+    def disconnect(self):
+        
+        TestClient.disconnect(self)
+        
+        if self.recorder is not None:
+            self.recorder.flush()
     
     """
     Overridden function: error
@@ -101,6 +413,27 @@ class TradingApp(TestWrapper, TestClient):
     def error(self, reqId, errorCode, errorString):
         
         print("Error: ", reqId, " ", errorCode, " ", errorString)
+        
+        #A failed history request still seeds whatever was cached, codes
+        #from 2100 to 2199 are only warnings
+        if (self.warmStart is not None and self.warmStart.owns(reqId)
+                and not 2100 <= errorCode < 2200):
+            self.warmStart.end(reqId)
+    
+    """
+    Overridden function: historicalData / historicalDataEnd
+    
+    Bars requested by self.warmStart, see warmstart.py
+    """
+    def historicalData(self, reqId, bar):
+        
+        if self.warmStart is not None and self.warmStart.owns(reqId):
+            self.warmStart.bar(reqId, bar)
+    
+    def historicalDataEnd(self, reqId, start, end):
+        
+        if self.warmStart is not None and self.warmStart.owns(reqId):
+            self.warmStart.end(reqId)
     
     """    
     Overridden function: marketDataType
@@ -115,129 +448,441 @@ class TradingApp(TestWrapper, TestClient):
     """
     Overridden function: tickPrice
     
-    After Market request in main, store price data and time data
-    into the "self.prices" and "self.times" arrays
+    After Market request in subscribe, store price data and time data
+    into the tick store of the instrument the reqId belongs to
+    
+    Runs the strategy of that instrument, positions and fills are kept up
+    to date by their own callbacks so nothing else is requested here.
+    Executions made over the day are only re-requested once
+    self.nextReconcile has passed
     
-    Request current positions, orderIds, executions made over the day
+    With self.coalesce set the strategy does not run here, the instrument
+    is marked as waiting and flush_ticks runs it on the freshest price
+    once the backlog of messages is worked through. A tick for an
+    instrument that is already waiting counts as merged in self.latency.
+    Only "latest" without bars holds back the tick itself, with bars every
+    tick goes into the open bar straight away so that none is left out
+    of the high, low and tick count
     
-    Finally, runs the strategy  
+    The time the tick arrived and the time the strategy finished with it
+    are recorded in self.latency
     """
     def tickPrice(self, reqId, tickType, price, attrib):
         
         #68 denotes the tickType of lastPrice
         if tickType == 68:
             
-            self.prices.append(price), self.times.append(time.time()-self.current_time)
-
-            self.reqPositions()
-            self.reqIds(-1)
-            self.run_strategy(self.prices, self.contract)
-            self.reqExecutions(self.reqExecutionId, ExecutionFilter())
-            self.reqExecutionId +=1
+            instrument = self.byReqId.get(reqId)
+            
+            if instrument is None:
+                self.latency.dropped()
+                return
+            
+            self.latency.tick(time.perf_counter_ns(), self.msg_queue.qsize())
+            
+            now = time.time()
+            
+            if self.recorder is not None:
+                self.recorder.tick(instrument.contract.symbol, now, price)
+            
+            self.risk.mark(instrument.contract.symbol, price)
+            
+            #Held until the history being loaded for the instrument is in
+            if instrument.warming:
+                instrument.pending.append((now-self.current_time, price))
+                return
+            
+            if self.coalesce is None:
+                
+                if self.store_tick(instrument, now-self.current_time, price):
+                    self.run_strategy(instrument)
+                
+                self.latency.decision(time.perf_counter_ns())
+                
+            else:
+                
+                if instrument in self.pendingTicks:
+                    self.latency.merged()
+                elif not self.pendingTicks:
+                    self.flushDeadline = time.monotonic() + self.coalesce_interval
+                
+                if self.coalesce == "latest" and instrument.bars is None:
+                    self.pendingTicks[instrument] = (now-self.current_time, price)
+                else:
+                    self.store_tick(instrument, now-self.current_time, price)
+                    self.pendingTicks[instrument] = None
+            
+            if time.monotonic() >= self.nextReconcile:
+                self.reconcile()
+    
+    """
+    Overridden function: tickSize
+    
+    TWS sends the size of each last price right after it. The size is
+    stored with its tick (a VWAP then weighs the price by it) or goes into
+    the open bar of the instrument, which closes a volume (or tick) bar
+    once it is complete. While the instrument is warming up the size is
+    held after its price, in "latest" mode it is held with its price
+    
+    When the size gives the strategy something new (a bar closed, a VWAP
+    moved) it runs straight away, or when coalescing the instrument is
+    queued in pendingTicks like tickPrice does and runs at the next flush
+    """
+    def tickSize(self, reqId, tickType, size):
+        
+        if tickType in (TickTypeEnum.LAST_SIZE, TickTypeEnum.DELAYED_LAST_SIZE):
+            
+            instrument = self.byReqId.get(reqId)
+            
+            if instrument is None:
+                return
+            
+            size = float(size)
+            
+            #Goes with the tick the recorder got from tickPrice
+            if self.recorder is not None:
+                self.recorder.size(instrument.contract.symbol, size)
+            
+            if instrument.warming:
+                instrument.pending.append((None, size))
+                return
+            
+            tick = self.pendingTicks.get(instrument)
+            
+            if tick is not None:
+                
+                self.pendingTicks[instrument] = (tick[0], tick[1], size)
+                
+            elif self.store_size(instrument, size):
+                
+                if self.coalesce is None:
+                    self.run_strategy(instrument)
+                elif instrument not in self.pendingTicks:
+                    if not self.pendingTicks:
+                        self.flushDeadline = time.monotonic() + self.coalesce_interval
+                    self.pendingTicks[instrument] = None
+    
+    """
+    Self Made Function: store_tick
+    
+    Stores a last price for the instrument. Without bars it goes straight
+    to the instrument, with bars into the open bar and only the close of
+    a bar that got completed goes to the instrument
+    
+    Returns True if the instrument got a new price for the strategy
+    """
+    def store_tick(self, instrument, t, price, size = 0.0):
+        
+        if instrument.bars is None:
+            self.feed(instrument, t, price, size)
+            return True
+        
+        bar = instrument.bars.price(t, price)
+        
+        if bar is None:
+            return False
+        
+        self.feed(instrument, bar[0], bar[4], bar[5])
+        
+        return True
+    
+    """
+    Self Made Function: store_size
+    
+    Sets the size of the last tick of the instrument, or adds it to the
+    open bar. Returns True if the strategy has something new to decide
+    on: a moving average that moved with the size (a VWAP), or a bar that
+    got completed and whose close went to the instrument
+    """
+    def store_size(self, instrument, size):
+        
+        if instrument.bars is None:
+            return instrument.add_size(size)
+        
+        bar = instrument.bars.volume_traded(size)
+        
+        if bar is None:
+            return False
+        
+        self.feed(instrument, bar[0], bar[4], bar[5])
+        
+        return True
+    
+    """
+    Self Made Function: feed
+    
+    Adds a price (a tick, or the close and volume of a bar) to the
+    instrument and its strategy
+    """
+    def feed(self, instrument, t, price, size = 0.0):
+        
+        instrument.add_tick(t, price, size)
+    
+    """
+    Self Made Function: seed
+    
+    Adds the history a warm start loaded in front of the live prices of
+    the instrument and its strategy (see warmstart.py)
+    """
+    def seed(self, instrument, times, prices, sizes = None):
+        
+        instrument.seed(times, prices, sizes)
+    
+    """
+    Self Made Function: close_bars
+    
+    Closes the time bars that ended without a tick coming in after them
+    """
+    def close_bars(self):
+        
+        if self.bar_type != "time":
+            return
+        
+        t = time.time() - self.current_time
+        
+        for instrument in self.instruments:
+            
+            if instrument.warming:
+                continue
+            
+            bar = instrument.bars.poll(t)
+            
+            if bar is not None:
+                self.feed(instrument, bar[0], bar[4], bar[5])
+                self.run_strategy(instrument)
+    
+    """
+    Self Made Function: flush_ticks
+    
+    Runs the strategy once for every instrument with coalesced ticks
+    waiting, in "latest" mode after storing the last price it got
+    """
+    def flush_ticks(self):
+        
+        pending, self.pendingTicks = self.pendingTicks, {}
+        self.flushDeadline = None
+        self.latency.flushed()
+        
+        for instrument, tick in pending.items():
+            
+            if tick is not None:
+                self.store_tick(instrument, *tick)
+            
+            self.run_strategy(instrument)
+        
+        self.latency.decision(time.perf_counter_ns())
+    
+    """
+    Self Made Function: reconcile
+    
+    Requests the executions made over the day so that any fill missed by
+    execDetails gets added to the ledger (already known execIds are ignored)
+    
+    Positions do not need this, the reqPositions subscription made on
+    connecting keeps sending updates to position, which checks the
+    position built from the fills
+    """
+    def reconcile(self):
+        
+        self.nextReconcile = time.monotonic() + self.reconcile_interval
+        
+        self.reqExecutions(self.reqExecutionId, ExecutionFilter())
+        self.reqExecutionId +=1
     
     """        
     Overridden function: position
     
     After requesting all positions, the application stores the 
-    position information as a boolean variable to "self.pos" and 
-    prints whether or not there is a long position
+    position information of the matching instrument as a boolean
+    variable to "pos"
+    
+    The position in self.risk is built from the fills, the one TWS
+    reports sets what was held before the session and corrects it if the
+    two disagree once every fill of the symbol has come in (see
+    RiskBook.report)
     """
     def position(self, account, contract, position, avgCost):
         
-        if contract.symbol == self.contract.symbol:
+        instrument = self.bySymbol.get(contract.symbol)
+        
+        self.risk.report(contract.symbol, position, avgCost,
+                         self.orders.settled(contract.symbol))
+        
+        if instrument is not None:
             
 #            print("Positions. Symbol:", contract.symbol, "Position:", position, "Avg cost:", avgCost)
             
             if position > 0:
-                self.pos = True
+                instrument.pos = True
             else:
-                self.pos = False
+                instrument.pos = False
             
-#            print("Long Position?: ", self.pos)
+#            print("Long Position?: ", instrument.pos)
     """
     Overridden function: nextValidId
     
-    After the orderID request, the self.nextOrderId gets declared
-    and stores the next valid order ID available to place orders with    
+    TWS sends the next valid order ID when connecting (or after reqIds).
+    self.nextOrderId stores it and is then counted up locally as orders
+    are placed. It never moves backwards past an ID already used
     """
     def nextValidId(self, orderId):
         
-        self.nextOrderId = orderId
+        if self.nextOrderId is None or orderId > self.nextOrderId:
+            self.nextOrderId = orderId
 #        print("NextValidId:", orderId)
     
     """
     Self Made Function: run_strategy
     
-    Preforms the Moving Average Crossover Strategy
+    Asks the strategy of the instrument which position it wants and places
+    a market order when that differs from the one held
+    
+    The strategy keeps its state up to date as ticks are stored (see
+    Instrument.add_tick), so no work here depends on the window size
+    
+    At first, checks that TWS has given a valid order ID and that no order
+    of the instrument is still open. An order that the rate limit still
+    holds back is cancelled before it goes out if the strategy wants to
+    keep the position held after all
+    """
+    def run_strategy( self, instrument ):
+        
+        if self.nextOrderId is None:
+            return
+        
+        target = instrument.strategy.target()
+        
+        if instrument.noOpenOrders:
+            
+            if target is not None and target != instrument.pos:
+                self.submitOrder(instrument, self.make_order(instrument, target))
+        
+        elif target == instrument.pos:
+            
+            state = self.orders.cancel_queued(instrument.currentOrderId)
+            
+            if state is not None:
+                self._order_changed(instrument, state)
+    
+    """
+    Self Made Function: make_order
+    
+    The market order that takes the instrument to the target position
+    """
+    def make_order(self, instrument, target):
+        
+        order = Order()
+        order.action = "BUY" if target == LONG else "SELL"
+        order.orderType = "MKT"
+        order.totalQuantity = instrument.quantity
+        
+        return order
     
-    At first, checks to make sure enough data is present to cover the long window
-    Then checks if there are any current orders already been placed
-    Then checks if there is already a long position held
-    Then undergoes the strategy      
     """
-    def run_strategy( self, prices, contract ):
+    Self Made Function: submitOrder
     
-        if len(prices)>=self.long_window and self.noOpenOrders:
+    Checks the order against the limits in self.risk and places it for
+    the instrument under the next local order ID, remembering which
+    instrument the order ID belongs to. The order goes into self.orders,
+    which sends it now or once the rate limit allows
+    
+    noOpenOrders is set to False straight away so that the ticks that
+    come in before the first orderStatus cannot place another order
+    
+    Returns the order ID, or None if a limit rejected the order
+    """
+    def submitOrder(self, instrument, order):
         
-            if self.pos:
-                
-                if avg(prices[-self.long_window:]) > avg(prices[-self.short_window:]):
-                    
-                    order = Order()
-                    order.action = "SELL"
-                    order.orderType = "MKT"
-                    order.totalQuantity = 100
-                    
-                    #self.currentOrderId gets updated to the orderId that gets placed
-                    self.currentOrderId = self.nextOrderId
-                    self.placeOrder(self.nextOrderId, contract, order)
-                    
+        symbol = instrument.contract.symbol
+        shares = float(order.totalQuantity) * (1 if order.action == "BUY" else -1)
+        
+        if self.risk.check(symbol, shares, self.orders.working.get(symbol, 0.0)) is not None:
+            return None
+        
+        orderId = self.nextOrderId
+        self.nextOrderId += 1
+        
+        #currentOrderId gets updated to the orderId that gets placed
+        instrument.currentOrderId = orderId
+        instrument.currentOrderType = order.action
+        instrument.currentOrderStatus = "Not Filled"
+        instrument.noOpenOrders = False
+        self.byOrderId[orderId] = instrument
+        
+        self.orders.submit(orderId, instrument.contract, order)
+        
+        return orderId
+    
+    def _send_order(self, orderId, contract, order):
+        
+        self.latency.submitted(orderId, time.perf_counter_ns())
+        self.placeOrder(orderId, contract, order)
+    
+    """
+    Self Made Function: _order_changed
+    
+    Updates the current order of the instrument from the state of the
+    order in self.orders, which only ever moves forward (a late status
+    cannot undo a fill)
+    
+    Once filled, pos is updated from the side of the order so the
+    strategy does not have to wait for the position callback
+    
+    An order that is done (of any instrument) is taken out of self.latency,
+    and out of byOrderId once self.orders has dropped it too
+    """
+    def _order_changed(self, instrument, state):
+        
+        if state is not None and state.done:
+            
+            if state.status == FILLED:
+                self.latency.fill(state.orderId, time.perf_counter_ns())
             else:
-                
-                if avg(prices[-self.long_window:]) < avg(prices[-self.short_window:]):
-                    
-                    order = Order()
-                    order.action = "BUY"
-                    order.orderType = "MKT"
-                    order.totalQuantity = 100
-                    
-                    #self.currentOrderId gets updated to the orderId that gets placed
-                    self.currentOrderId = self.nextOrderId
-                    self.placeOrder(self.nextOrderId, contract, order)
+                self.latency.closed(state.orderId)
+            
+            if self.orders.get(state.orderId) is None:
+                self.byOrderId.pop(state.orderId, None)
+        
+        if instrument is None or state is None or state.orderId != instrument.currentOrderId:
+            return
+        
+        if state.status == FILLED:
+            
+            instrument.noOpenOrders = True
+            instrument.currentOrderStatus = "Filled"
+            instrument.pos = state.action == "BUY"
+            
+        elif state.status == CANCELLED:
+            
+            instrument.noOpenOrders = True
+            instrument.currentOrderStatus = "Cancelled"
+            
+        else:
+            
+            instrument.noOpenOrders = False
+            instrument.currentOrderStatus = "Not Filled"
     """
     Overridden Function: orderStatus
     
     If an order gets placed in run_strategy then order status gets
     called and will print the following details
     
-    The orderId of this order is saved in the TradingApp's
-    attribute named self.currentOrderId
-    
-    Once checked, the status of the order can be analyzed
+    The status moves the order forward in self.orders
     
-    If it has not been filled, then self.noOpenOrders will remain False
-    until the status of that order is "Filled" 
-    
-    self.currentOrderStatus will be updated accordingly
+    If the order is the current order of its instrument (currentOrderId),
+    noOpenOrders will remain False until the order is filled (or it was
+    cancelled) and currentOrderStatus will be updated accordingly
     """              
     def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId,
                     parentId, lastFillPrice, clientId, whyHeld, mktCapPrice):
         
 #        print("OrderStatus. Id:", orderId, "Status:", status, "Filled:", filled)
         
-        if orderId == self.currentOrderId:
-            
-            if status != "Filled":
-                
-                self.noOpenOrders = False
-                self.currentOrderStatus = "Not Filled"
-                
-            else:
-                
-                self.noOpenOrders = True
-                self.currentOrderStatus = "Filled"
+        state = self.orders.on_status(orderId, status, filled, avgFillPrice)
         
-#        print("No Open Orders?: ", self.noOpenOrders)
+        self._order_changed(self.byOrderId.get(orderId), state)
+        
+#        print("No Open Orders?: ", instrument.noOpenOrders)
     
     """
     Overridden Function: openOrder
@@ -245,16 +890,22 @@ class TradingApp(TestWrapper, TestClient):
     If an order is made in run_strategy then openOrder gets called and
     prints the following information
     
-    self.currentOrderType is also stored to keep track of the most recent order
+    currentOrderType is also stored to keep track of the most recent order
+    and the first openOrder of an order is recorded as its ack in self.latency
     """
     def openOrder(self, orderId, contract, order, orderState):
         
 #        print("Open Order. orderId:", orderId, "Symbol:", contract.symbol,
 #              "Order Type:", order.action)
         
-        if orderId == self.currentOrderId:
+        self.latency.ack(orderId, time.perf_counter_ns())
+        self.orders.on_open(orderId)
+        
+        instrument = self.byOrderId.get(orderId)
+        
+        if instrument is not None and orderId == instrument.currentOrderId:
             
-            self.currentOrderType = order.action
+            instrument.currentOrderType = order.action
     
     """
     Overridden Function: execDetails
@@ -264,58 +915,56 @@ class TradingApp(TestWrapper, TestClient):
     details about the price executed at as well as whether it was a
     buy or sell.
     
-    In order to not create duplicate executions, self.executedOrderIds
-    stores all of the IDs of the executed orders. If the orderId of the
-    execution is already in the self.executedOrderIds array then that
-    information is ignored because it already has been stored
+    The execution goes to the instrument that placed the order, or for
+    orders from before this session to the instrument with that symbol
+    
+    The execution is added to the instrument's ledger, which ignores
+    execIds it has already seen so that requesting executions again does
+    not create duplicate entries. Partial fills of one order are averaged
+    into a single entry and the profit per trade is updated as fills come
+    in, pairing buys and sells by the time they were executed
+    
+    The execution is also added to its order in self.orders, an order
+    whose executions add up to its quantity counts as filled even if its
+    orderStatus has not come yet
+    
+    A new execution made this session is added to the position in
+    self.risk. Executions from before the session (replayed by
+    reconcile) only go into the ledger, they are already part of the
+    position TWS reported
+    
+    The first execution of an order is recorded as its fill in self.latency
     """
     def execDetails(self, reqId, contract, execution):
         
 #        print("ExecDetails. OrderId:", execution.orderId, 
 #              "Symbol:", contract.symbol, "Execution Price:", execution.price)
         
-        if (execution.orderId not in self.executedOrderIds):
-            
-            if (execution.side == "BOT") and (contract.symbol == self.contract.symbol):
-                
-                size = np.shape(self.long_trades)
-                
-                self.long_trades = np.insert(self.long_trades, size[1], 
-                                             [execution.price,execution.orderId], axis = 1)
-                self.executedOrderIds.append(execution.orderId)
-                
-            elif (execution.side == "SLD") and (contract.symbol == self.contract.symbol):
-                
-                size = np.shape(self.short_trades)
-                
-                self.short_trades = np.insert(self.short_trades, size[1], 
-                                              [execution.price,execution.orderId], axis = 1)
-                self.executedOrderIds.append(execution.orderId)
-                
-            
-            self.updateTradeDist()
-    
-    """
-    Self Made Function: updateTradeDist
-    
-    This keeps track of the profit per trade made. Calculates profit by 
-    taking the price sold minus the price bought
-    """ 
-    def updateTradeDist(self):
+        self.latency.fill(execution.orderId, time.perf_counter_ns())
         
-        lenS = np.shape(self.short_trades)[1]
-        lenL = np.shape(self.long_trades)[1]
+        instrument = self.byOrderId.get(execution.orderId)
         
-        if (lenS > 0) and (lenL > 0):
+        state = self.orders.on_execution(execution.orderId, execution.execId,
+                                         float(execution.shares), execution.price)
+        self._order_changed(instrument, state)
         
-            if lenL==lenS:
-                
-                self.tradeDist = self.short_trades[:][0]-self.long_trades[:][0]
+        if instrument is None:
+            instrument = self.bySymbol.get(contract.symbol)
+        
+        if instrument is not None and execution.side in ("BOT", "SLD"):
             
-            elif lenL>lenS:
-                
-                self.tradeDist = self.short_trades[:][0]-self.long_trades[:][0][:-1] 
-                
-            elif lenL<lenS:
-                
-                self.tradeDist = self.short_trades[:][0][1:]-self.long_trades[:][0]
\ No newline at end of file
+            executed = execution_time(execution.time)
+            added = instrument.ledger.add_execution(execution.side, execution.execId,
+                                                    execution.orderId, execution.price,
+                                                    float(execution.shares), executed)
+            
+            #Execution times are whole seconds
+            if added and (executed is None or executed >= int(self.current_time)):
+                self.risk.fill(instrument.contract.symbol,
+                               float(execution.shares) * (1 if execution.side == "BOT" else -1),
+                               execution.price)
+            
+            if added and self.recorder is not None:
+                self.recorder.execution(instrument.contract.symbol, time.time(), execution.orderId,
+                                        execution.execId, execution.side, execution.price,
+                                        float(execution.shares))
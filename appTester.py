@@ -3,17 +3,15 @@ from PyQt5 import QtWidgets, QtCore, QtGui, uic
 import pyqtgraph as pg
 from pyqtgraph import plot
 from IBTradingApp import TradingApp
+from chartseries import ChartSeries, BarSeries
+from tablemodels import ExecutionTableModel
+from histogram import ProfitHistogram
 import numpy as np
 
 import time
 
 from ibapi.contract import Contract
 
- 
-def moving_average(a, n=3) :
-    ret = np.cumsum(a, dtype=float)
-    ret[n:] = ret[n:] - ret[:-n]
-    return ret[n - 1:] / n
 
 qtCreatorFile = "IBTradingApp.ui" # Enter file here.
  
@@ -36,11 +34,14 @@ class TradingGUI( QtWidgets.QMainWindow, Ui_MainWindow ):
         self.longInput.returnPressed.connect(self.onLongPressed)
         
 
-        headerLabels = ["OrderID", "Stock", "Buy/Sell?", "Price", "Quantity"]
         orderHeaderLabels = ["OrderId", "Buy/Sell?", "Status"]
         
-        self.buyExecTable.setHorizontalHeaderLabels(headerLabels)
-        self.sellExecTable.setHorizontalHeaderLabels(headerLabels)
+        #The execution tables are views over models of the ledger, only
+        #fills that are new get rows added (see tablemodels.py)
+        self.longModel = ExecutionTableModel("BOUGHT")
+        self.shortModel = ExecutionTableModel("SOLD")
+        self.buyExecTable.setModel(self.longModel)
+        self.sellExecTable.setModel(self.shortModel)
         self.orderStatusTable.setHorizontalHeaderLabels(orderHeaderLabels)
         
         self.orderStatusTable.setRowCount(1)
@@ -55,23 +56,52 @@ class TradingGUI( QtWidgets.QMainWindow, Ui_MainWindow ):
         
         self.thread = WorkerThread(contract, 10, 3, 100)
         
+        #The GUI only reads the snapshots the trading thread publishes,
+        #never its live state. self.changed tells the timer callbacks if
+        #pullSnapshot got a new one this second
+        self.version = 0
+        self.changed = False
+        self.snapshot = self.thread.IBapp.snapshots.latest
+        state = self.snapshot.instruments[0]
+        
+        #Only new ticks are added to the chart each second, the averages
+        #and volatility are updated as they come in (see chartseries.py).
+        #pyqtgraph only draws what is in view, downsampled to the screen
+        self.chart = ChartSeries(state.long_window, state.short_window, state.ma_type)
+        self.chart.update(state)
         
         self.priceGraphWidget.addLegend(size = (10,10))
-        self.data_line = self.priceGraphWidget.plot(self.thread.IBapp.times, self.thread.IBapp.prices, 
+        self.priceGraphWidget.setClipToView(True)
+        self.priceGraphWidget.setDownsampling(auto = True, mode = 'peak')
+        self.data_line = self.priceGraphWidget.plot(self.chart.times, self.chart.prices, 
                                                     pen = 'b', name = 'Stock Price')
-        self.long_line = self.priceGraphWidget.plot(self.thread.IBapp.times[self.thread.IBapp.long_window-1:],
-                                                    moving_average(self.thread.IBapp.prices, self.thread.IBapp.long_window),
+        self.long_line = self.priceGraphWidget.plot(self.chart.times, self.chart.long, connect = 'finite',
                                                     pen = 'r', name = 'Long Moving Average')
-        self.small_line = self.priceGraphWidget.plot(self.thread.IBapp.times[self.thread.IBapp.short_window-1:],
-                                                    moving_average(self.thread.IBapp.prices, self.thread.IBapp.short_window),
+        self.small_line = self.priceGraphWidget.plot(self.chart.times, self.chart.short, connect = 'finite',
                                                     pen = 'g', name = 'Short Moving Average')
+        
+        #Trading on bars the chart prices are the bar closes, the range of
+        #every bar is drawn from its low to its high and the open bar is
+        #shown in the status bar
+        self.bars = BarSeries()
+        self.bar_ranges = pg.ErrorBarItem(pen = 'k', beam = 0)
+        self.priceGraphWidget.addItem(self.bar_ranges)
+        self.barLabel = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self.barLabel)
+        
+        #Bin counts are updated as trades close and the bars are blitted,
+        #the canvas is only redrawn in full when the bins change
+        self.histogram = ProfitHistogram(self.tradeDistWidget.canvas)
+        
         self.priceGraphWidget.setLabel('left', 'Price', color = 'grey')
         self.priceGraphWidget.setLabel('bottom', 'Time Elapsed (s)', color = 'grey')
         
         
         self.Timer = QtCore.QTimer()
         self.Timer.setInterval(1000)
+        self.Timer.timeout.connect(self.pullSnapshot)
         self.Timer.timeout.connect(self.update_plot_data)
+        self.Timer.timeout.connect(self.update_bars)
         self.Timer.timeout.connect(self.fillLongTable)
         self.Timer.timeout.connect(self.fillShortTable)
         self.Timer.timeout.connect(self.fillHistogram)
@@ -116,61 +146,88 @@ class TradingGUI( QtWidgets.QMainWindow, Ui_MainWindow ):
             self.statusBar().showMessage("Awaiting connection to TWS....")
         
     
+    #The inputs are changed by the trading thread, between two messages,
+    #so they never race with the callbacks using the instrument
     def onStockPressed(self):
         
-        self.thread.IBapp.contract.symbol = self.stockInput.text()
+        app = self.thread.IBapp
+        app.post(setattr, app.contract, "symbol", self.stockInput.text())
         self.statusBar().showMessage("Stock has been entered")
         
     def onShortPressed(self):
         
-        self.thread.IBapp.short_window = int(self.shortInput.text())
+        app = self.thread.IBapp
+        app.post(setattr, app, "short_window", int(self.shortInput.text()))
         self.statusBar().showMessage("Short Window has been entered")
         
     def onLongPressed(self):
         
-        self.thread.IBapp.long_window = int(self.longInput.text())
+        app = self.thread.IBapp
+        app.post(setattr, app, "long_window", int(self.longInput.text()))
         self.statusBar().showMessage("Long Window has been entered")
         
+    def pullSnapshot(self):
+        
+        snapshot = self.thread.IBapp.snapshots.pull(self.version)
+        self.changed = snapshot is not None
+        
+        if self.changed:
+            self.snapshot = snapshot
+            self.version = snapshot.version
+        
     def update_plot_data(self):
         
-        self.data_line.setData(self.thread.IBapp.times,self.thread.IBapp.prices)
-        self.long_line.setData(self.thread.IBapp.times[self.thread.IBapp.long_window-1:],
-                               moving_average(self.thread.IBapp.prices, self.thread.IBapp.long_window))
-        self.small_line.setData(self.thread.IBapp.times[self.thread.IBapp.short_window-1:],
-                                moving_average(self.thread.IBapp.prices, self.thread.IBapp.short_window))
+        if not self.changed or not self.chart.update(self.snapshot.instruments[0]):
+            return
         
-    def updateStats(self):
+        self.data_line.setData(self.chart.times,self.chart.prices)
+        self.long_line.setData(self.chart.times, self.chart.long, connect = 'finite')
+        self.small_line.setData(self.chart.times, self.chart.short, connect = 'finite')
         
-        tradeDist = self.thread.IBapp.tradeDist
-        initialTime = self.thread.IBapp.current_time
-        prices = np.asarray(self.thread.IBapp.prices)
-        long_window = self.thread.IBapp.long_window
-        short_window = self.thread.IBapp.short_window
+    def update_bars(self):
         
+        if not self.changed or not self.bars.update(self.snapshot.instruments[0]):
+            return
         
-        if len(prices) > 1 and len(prices) < short_window:
+        bars = self.bars.bars
         
-            self.currentPrice.setText(str(prices[-1]))
-            
-            mean_time_prices = (time.time()-initialTime)/len(prices)
-            self.vol.setText(str(np.std(np.log(prices[1:]/prices[:-1]))*np.sqrt(7711200/mean_time_prices)))
+        if len(bars) > 0:
             
-        elif len(prices) < long_window and len(prices) > short_window:
+            self.bar_ranges.setData(x = bars["time"], y = bars["low"], top = bars["high"] - bars["low"])
+        
+        bar = self.bars.current
+        
+        if bar is not None:
             
-            self.currentPrice.setText(str(prices[-1]))
-            self.shortMA.setText(str(moving_average(prices, short_window)[-1]))
+            self.barLabel.setText("Open bar  O: %.2f  H: %.2f  L: %.2f  C: %.2f  V: %g  Ticks: %d"
+                                  % bar[1:])
+        
+    def updateStats(self):
+        
+        if not self.changed:
+            return
+        
+        state = self.snapshot.instruments[0]
+        tradeDist = state.tradeDist
+        initialTime = self.thread.IBapp.current_time
+        chart = self.chart
+        
+        
+        if chart.total > 1:
+        
+            self.currentPrice.setText(str(chart.prices[-1]))
             
-            mean_time_prices = (time.time()-initialTime)/len(prices)
-            self.vol.setText(str(np.std(np.log(prices[1:]/prices[:-1]))*np.sqrt(7711200/mean_time_prices)))
+            mean_time_prices = (time.time()-initialTime)/chart.total
+            self.vol.setText(str(chart.volatility.value*np.sqrt(7711200/mean_time_prices)))
         
-        elif len(prices) > long_window:
+        #The averages the strategy trades on, None until they are ready
+        if state.short_ma is not None:
             
-            self.currentPrice.setText(str(prices[-1]))
-            self.shortMA.setText(str(moving_average(prices, short_window)[-1]))
-            self.longMA.setText(str(moving_average(prices, long_window)[-1]))
+            self.shortMA.setText(str(state.short_ma))
+        
+        if state.long_ma is not None:
             
-            mean_time_prices = (time.time()-initialTime)/len(prices)
-            self.vol.setText(str(np.std(np.log(prices[1:]/prices[:-1]))*np.sqrt(7711200/mean_time_prices)))
+            self.longMA.setText(str(state.long_ma))
         
         if len(tradeDist) > 0:
             
@@ -182,10 +239,14 @@ class TradingGUI( QtWidgets.QMainWindow, Ui_MainWindow ):
     
     def checkPosition(self):
         
+        if not self.changed:
+            return
+        
+        state = self.snapshot.instruments[0]
         
-        if self.thread.IBapp.pos:
+        if state.pos:
             
-            quantText = str(self.thread.IBapp.quantity)
+            quantText = str(state.quantity)
             self.posLabel.setText("LONG " + quantText)
             
         else:
@@ -194,64 +255,41 @@ class TradingGUI( QtWidgets.QMainWindow, Ui_MainWindow ):
         
     def fillHistogram(self):
         
-        tradeDist = self.thread.IBapp.tradeDist
-        
-        if len(tradeDist) > 0:
-            
-            bins = np.linspace(min(1.5*min(tradeDist),min(tradeDist) - 1.5*max(tradeDist)),
-                               max(1.5*max(tradeDist),max(tradeDist) - 1.5*min(tradeDist)),30) 
-            self.tradeDistWidget.canvas.axes.clear()
-            self.tradeDistWidget.canvas.axes.hist(tradeDist, bins)                
-            self.tradeDistWidget.canvas.axes.set_ylabel("Frequency")
-            self.tradeDistWidget.canvas.axes.set_xlabel("Trade Profit ($)")
-            self.tradeDistWidget.canvas.draw()
+        if not self.changed:
+            return
         
-        else:
+        if self.histogram.update(self.snapshot.instruments[0].tradeDist):
             
-            bins = np.linspace(-10,10,40)
-            self.tradeDistWidget.canvas.axes.clear()
-            self.tradeDistWidget.canvas.axes.hist(tradeDist, bins)                
-            self.tradeDistWidget.canvas.axes.set_ylabel("Frequency")
-            self.tradeDistWidget.canvas.axes.set_xlabel("Trade Profit ($)")
-            self.tradeDistWidget.canvas.draw()
-            
-
+            self.histogram.draw()
         
     def fillLongTable(self):
         
+        if not self.changed:
+            return
         
-        num_rows = np.shape(self.thread.IBapp.long_trades)[1]
+        state = self.snapshot.instruments[0]
         
-        self.buyExecTable.setRowCount(num_rows)
-        
-        for row in range(num_rows):
-            
-            self.buyExecTable.setItem(row, 0, QtGui.QTableWidgetItem(str(int(self.thread.IBapp.long_trades[1,row]))))
-            self.buyExecTable.setItem(row, 1, QtGui.QTableWidgetItem(self.thread.IBapp.contract.symbol))
-            self.buyExecTable.setItem(row, 2, QtGui.QTableWidgetItem("BOUGHT"))
-            self.buyExecTable.setItem(row, 3, QtGui.QTableWidgetItem(str(self.thread.IBapp.long_trades[0,row])))
-            self.buyExecTable.setItem(row, 4, QtGui.QTableWidgetItem(str(self.thread.IBapp.quantity)))
+        self.longModel.update(state.long_trades, state.symbol, state.quantity)
             
     def fillShortTable(self):
         
-        num_rows = np.shape(self.thread.IBapp.short_trades)[1]
+        if not self.changed:
+            return
         
-        self.sellExecTable.setRowCount(num_rows)
+        state = self.snapshot.instruments[0]
         
-        for row in range(num_rows):
-            
-            self.sellExecTable.setItem(row, 0, QtGui.QTableWidgetItem(str(int(self.thread.IBapp.short_trades[1,row]))))
-            self.sellExecTable.setItem(row, 1, QtGui.QTableWidgetItem(self.thread.IBapp.contract.symbol))
-            self.sellExecTable.setItem(row, 2, QtGui.QTableWidgetItem("SOLD"))
-            self.sellExecTable.setItem(row, 3, QtGui.QTableWidgetItem(str(self.thread.IBapp.short_trades[0,row])))
-            self.sellExecTable.setItem(row, 4, QtGui.QTableWidgetItem(str(self.thread.IBapp.quantity)))
+        self.shortModel.update(state.short_trades, state.symbol, state.quantity)
     
     def updateOrder(self):
         
+        if not self.changed:
+            return
+        
+        state = self.snapshot.instruments[0]
         
-        self.orderStatusTable.setItem(0,0, QtGui.QTableWidgetItem(str(self.thread.IBapp.currentOrderId)))
-        self.orderStatusTable.setItem(0,2, QtGui.QTableWidgetItem(self.thread.IBapp.currentOrderStatus))
-        self.orderStatusTable.setItem(0,1, QtGui.QTableWidgetItem(self.thread.IBapp.currentOrderType))
+        self.orderStatusTable.setItem(0,0, QtGui.QTableWidgetItem(str(state.currentOrderId)))
+        self.orderStatusTable.setItem(0,2, QtGui.QTableWidgetItem(state.currentOrderStatus))
+        self.orderStatusTable.setItem(0,1, QtGui.QTableWidgetItem(state.currentOrderType))
     
        
 class WorkerThread(QtCore.QThread):
@@ -259,14 +297,15 @@ class WorkerThread(QtCore.QThread):
     def __init__(self, contract, longwindow, shortwindow, quantity, parent = None):
         super(WorkerThread, self).__init__(parent)
         
-        self.IBapp = TradingApp(contract, longwindow, shortwindow, quantity)
+        self.IBapp = TradingApp(contract, longwindow, shortwindow, quantity, record_dir = "recordings",
+                                warm_start = True)
         
     def run(self):
         
         self.IBapp.connect("127.0.0.1", 7497, clientId=0)
 
         self.IBapp.reqMarketDataType(3)
-        self.IBapp.reqMktData(1, self.IBapp.contract, "", False, False, [])
+        self.IBapp.subscribe()
         self.IBapp.reqPositions()
         
         self.IBapp.run()
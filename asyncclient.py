@@ -0,0 +1,414 @@
+import argparse
+import asyncio
+import time
+from collections import namedtuple
+
+from ibapi import comm
+from ibapi import decoder
+from ibapi.client import EClient
+from ibapi.common import NO_VALID_ID
+from ibapi.contract import Contract
+from ibapi.errors import CONNECT_FAIL
+from ibapi.server_versions import MIN_CLIENT_VER, MAX_CLIENT_VER
+
+from IBTradingApp import TradingApp
+
+"""
+asyncio mode of the Trading Application
+
+EClient.connect starts a reader thread and EClient.run blocks a second
+thread decoding messages. AsyncTradingApp does both on an asyncio event
+loop instead: the socket is an asyncio stream, every message is decoded
+as soon as it is read and goes through the same TradingApp callbacks, so
+the strategy, ledger and latency code are shared with the threaded mode
+
+On top of the callbacks the app offers:
+
+    ticks(), fills(), order_statuses()
+        async iterators of the events as they arrive, any number of
+        coroutines can listen to each one
+    await next_order_id(), await positions()
+        request/response calls that resolve when TWS answers
+
+Many subscriptions, timers and coroutine strategies can then share one
+thread. Set builtin_strategy to False to leave the trading decisions to
+a coroutine reading ticks() and calling submitOrder
+"""
+
+TickEvent = namedtuple("TickEvent", ["symbol", "time", "price"])
+FillEvent = namedtuple("FillEvent", ["symbol", "orderId", "execId", "side", "price", "shares"])
+OrderStatusEvent = namedtuple("OrderStatusEvent", ["orderId", "status", "filled", "remaining",
+                                                   "avgFillPrice"])
+Position = namedtuple("Position", ["account", "contract", "position", "avgCost"])
+
+
+"""
+Stands in for ibapi.connection.Connection so the EClient request methods
+write to the asyncio stream. Writes are buffered by the transport and
+never block the loop
+"""
+class StreamConnection:
+
+    def __init__(self, reader, writer):
+
+        self.reader = reader
+        self.writer = writer
+
+    def isConnected(self):
+
+        return self.writer is not None
+
+    def sendMsg(self, msg):
+
+        if self.writer is None:
+            return 0
+
+        self.writer.write(msg)
+
+        return len(msg)
+
+    def disconnect(self):
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+"""
+Event stream with any number of listeners, each with its own queue. A
+listener that falls more than maxsize events behind loses the oldest
+ones, which are counted in "dropped", so a slow consumer can never hold
+up the callbacks
+"""
+class EventStream:
+
+    def __init__(self, maxsize = 10000):
+
+        self.maxsize = maxsize
+        self.queues = []
+        self.dropped = 0
+
+    def publish(self, event):
+
+        for queue in self.queues:
+
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+
+            queue.put_nowait(event)
+
+    async def listen(self):
+
+        queue = asyncio.Queue(self.maxsize)
+        self.queues.append(queue)
+
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.queues.remove(queue)
+
+
+"""
+TradingApp driven by an asyncio event loop, see the top of this file
+"""
+class AsyncTradingApp(TradingApp):
+
+    def __init__(self, contract, long_window, short_window, quantity, builtin_strategy = True,
+                 idle_interval = 0.2, **kwargs):
+
+        TradingApp.__init__(self, contract, long_window, short_window, quantity, **kwargs)
+
+        self.builtin_strategy = builtin_strategy
+        self.idle_interval = idle_interval
+
+        self.tickStream = EventStream()
+        self.fillStream = EventStream()
+        self.statusStream = EventStream()
+
+        #Futures waiting on nextValidId and positionEnd
+        self.orderIdWaiters = []
+        self.positionWaiters = []
+        self.positionList = []
+
+        self.tasks = []
+
+    """
+    Self Made Function: connect_async
+
+    Same handshake as EClient.connect over an asyncio stream, then starts
+    the tasks reading messages and calling msgLoopTmo when idle. A server
+    that accepts the connection but never answers the handshake fails it
+    after "timeout" seconds (None waits forever), like a refused one
+    """
+    async def connect_async(self, host, port, clientId, timeout = 10.0):
+
+        self.host = host
+        self.port = port
+        self.clientId = clientId
+
+        try:
+            await asyncio.wait_for(self._handshake(host, port), timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            self.wrapper.error(NO_VALID_ID, CONNECT_FAIL.code(), CONNECT_FAIL.msg())
+            self.disconnect()
+            return False
+
+        self.startApi()
+        self.wrapper.connectAck()
+
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self._read_loop()), loop.create_task(self._idle_loop())]
+
+        return True
+
+    async def _handshake(self, host, port):
+
+        reader, writer = await asyncio.open_connection(host, port)
+
+        self.conn = StreamConnection(reader, writer)
+        self.setConnState(EClient.CONNECTING)
+
+        version = "v%d..%d" % (MIN_CLIENT_VER, MAX_CLIENT_VER)
+        if self.connectionOptions:
+            version = version + " " + self.connectionOptions
+
+        writer.write(b"API\0" + comm.make_msg(version))
+
+        self.decoder = decoder.Decoder(self.wrapper, self.serverVersion())
+
+        #Messages can come before the server version and connection time
+        fields = []
+        while len(fields) != 2:
+            self.decoder.interpret(fields)
+            fields = await self._read_fields()
+
+        self.serverVersion_ = int(fields[0])
+        self.connTime = fields[1]
+        self.decoder.serverVersion = self.serverVersion()
+
+        self.setConnState(EClient.CONNECTED)
+
+    async def _read_fields(self):
+
+        size = int.from_bytes(await self.conn.reader.readexactly(4), "big")
+
+        return comm.read_fields(await self.conn.reader.readexactly(size))
+
+    async def _read_loop(self):
+
+        try:
+            while self.isConnected():
+                self.decoder.interpret(await self._read_fields())
+                self.msgLoopRec()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.disconnect()
+
+    async def _idle_loop(self):
+
+        while self.isConnected():
+            await asyncio.sleep(self.idle_interval)
+            self.msgLoopTmo()
+
+    """
+    Self Made Function: run_async
+
+    Waits until the connection is closed, the async counterpart of run
+    """
+    async def run_async(self):
+
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions = True)
+
+    def disconnect(self):
+
+        TradingApp.disconnect(self)
+
+        for future in self.orderIdWaiters + self.positionWaiters:
+            if not future.done():
+                future.cancel()
+
+        self.orderIdWaiters = []
+        self.positionWaiters = []
+
+        try:
+            current = asyncio.current_task()
+        except RuntimeError:
+            current = None
+
+        for task in self.tasks:
+            if task is not current:
+                task.cancel()
+
+    """
+    Async streams of ticks, fills and order statuses, use with async for
+    """
+    def ticks(self):
+
+        return self.tickStream.listen()
+
+    def fills(self):
+
+        return self.fillStream.listen()
+
+    def order_statuses(self):
+
+        return self.statusStream.listen()
+
+    """
+    Self Made Function: next_order_id
+
+    The next order ID, asked from TWS with reqIds if none was received yet
+    """
+    async def next_order_id(self):
+
+        if self.nextOrderId is not None:
+            return self.nextOrderId
+
+        future = asyncio.get_running_loop().create_future()
+        self.orderIdWaiters.append(future)
+        self.reqIds(-1)
+
+        return await future
+
+    """
+    Self Made Function: positions
+
+    Requests the positions and returns them as a list of Position once
+    TWS sent positionEnd. The subscription stays open so later updates
+    keep reaching the position callback
+    """
+    async def positions(self):
+
+        future = asyncio.get_running_loop().create_future()
+
+        if not self.positionWaiters:
+            self.positionList = []
+            self.reqPositions()
+
+        self.positionWaiters.append(future)
+
+        return await future
+
+    def run_strategy(self, instrument):
+
+        if self.builtin_strategy:
+            TradingApp.run_strategy(self, instrument)
+
+    """
+    The time of a TickEvent is when the tick arrived (seconds since the
+    app started, like the tick store), whether or not the tick was stored
+    right away (it is held while warming up or coalescing, and only bar
+    closes are stored when trading on bars)
+    """
+    def tickPrice(self, reqId, tickType, price, attrib):
+
+        now = time.time()
+
+        TradingApp.tickPrice(self, reqId, tickType, price, attrib)
+
+        if tickType == 68:
+
+            instrument = self.byReqId.get(reqId)
+
+            if instrument is not None:
+                self.tickStream.publish(TickEvent(instrument.contract.symbol,
+                                                  now - self.current_time, price))
+
+    def nextValidId(self, orderId):
+
+        TradingApp.nextValidId(self, orderId)
+
+        waiters, self.orderIdWaiters = self.orderIdWaiters, []
+
+        for future in waiters:
+            if not future.done():
+                future.set_result(self.nextOrderId)
+
+    def position(self, account, contract, position, avgCost):
+
+        TradingApp.position(self, account, contract, position, avgCost)
+
+        if self.positionWaiters:
+            self.positionList.append(Position(account, contract, position, avgCost))
+
+    def positionEnd(self):
+
+        waiters, self.positionWaiters = self.positionWaiters, []
+
+        for future in waiters:
+            if not future.done():
+                future.set_result(list(self.positionList))
+
+    def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId,
+                    parentId, lastFillPrice, clientId, whyHeld, mktCapPrice):
+
+        TradingApp.orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId,
+                               parentId, lastFillPrice, clientId, whyHeld, mktCapPrice)
+
+        self.statusStream.publish(OrderStatusEvent(orderId, status, filled, remaining, avgFillPrice))
+
+    def execDetails(self, reqId, contract, execution):
+
+        TradingApp.execDetails(self, reqId, contract, execution)
+
+        self.fillStream.publish(FillEvent(contract.symbol, execution.orderId, execution.execId,
+                                          execution.side, execution.price, execution.shares))
+
+
+async def _run(args):
+
+    contract = Contract()
+    contract.symbol = args.symbol
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+
+    app = AsyncTradingApp(contract, args.long, args.short, args.quantity)
+
+    if not await app.connect_async(args.host, args.port, args.clientId, args.timeout):
+        return 1
+
+    app.reqMarketDataType(3)
+    app.subscribe()
+
+    print("Next order ID:", await app.next_order_id())
+    print("Positions:", [(p.contract.symbol, p.position) for p in await app.positions()])
+
+    async def show(stream):
+        async for event in stream:
+            print(event)
+
+    printers = [asyncio.ensure_future(show(app.fills())),
+                asyncio.ensure_future(show(app.order_statuses()))]
+
+    await app.run_async()
+
+    for printer in printers:
+        printer.cancel()
+
+    return 0
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Run the trading application on asyncio")
+    parser.add_argument("--symbol", default = "AAPL", help = "stock to trade")
+    parser.add_argument("--long", type = int, default = 10, help = "long window")
+    parser.add_argument("--short", type = int, default = 3, help = "short window")
+    parser.add_argument("--quantity", type = int, default = 100, help = "shares per trade")
+    parser.add_argument("--host", default = "127.0.0.1", help = "TWS host")
+    parser.add_argument("--port", type = int, default = 7497, help = "TWS port")
+    parser.add_argument("--clientId", type = int, default = 0, help = "API client ID")
+    parser.add_argument("--timeout", type = float, default = 10.0,
+                        help = "seconds to wait for the TWS handshake")
+    args = parser.parse_args(argv)
+
+    return asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
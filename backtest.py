@@ -0,0 +1,265 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from ibapi.contract import Contract
+from ibapi.execution import Execution
+
+from IBTradingApp import TradingApp
+from tickstore import TICK_DTYPE
+from strategies import strategy_class
+
+"""
+Offline backtesting of the strategies in strategies.py, the Moving
+Average Crossover Strategy by default
+
+There are two ways of replaying a price series:
+
+    run_vectorized      makes the same decisions as TradingApp.run_strategy
+                        for the whole array at once with the batch mode of
+                        the strategy (Strategy.signals). Used for long
+                        histories and the parameter optimizer
+    run_event_driven    feeds every price through tickPrice of a real
+                        TradingApp whose orders are filled straight away,
+                        so it runs the exact live code path. Used as the
+                        reference to check run_vectorized against
+
+Both fill a market order at the price of the tick that triggered it and
+give the same long_trades, short_trades and tradeDist layout as TradingApp
+"""
+
+
+"""
+Reads a historical price series and returns (times, prices)
+
+Supported files:
+    .bin    tick records written by TickStore (or the recorder)
+    .npy    a 1D array of prices, or a TICK_DTYPE record array
+    .csv    a file with a header row, the price is taken from a "price"
+            or "close" column (ticks or bars) and the time from a
+            "time" column when there is one
+"""
+def load_prices(path):
+
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".bin":
+
+        records = np.memmap(path, dtype = TICK_DTYPE, mode = "r")
+        return records["time"], records["price"]
+
+    if ext == ".npy":
+
+        data = np.load(path, mmap_mode = "r")
+
+        if data.dtype.names:
+            return data["time"], data["price"]
+
+        return np.arange(len(data), dtype = np.float64), data
+
+    if ext == ".csv":
+
+        data = np.genfromtxt(path, delimiter = ",", names = True, dtype = np.float64)
+        names = [name.lower() for name in data.dtype.names]
+
+        for column in ("price", "close"):
+            if column in names:
+                prices = data[data.dtype.names[names.index(column)]]
+                break
+        else:
+            raise ValueError("%s has no price or close column" % path)
+
+        if "time" in names:
+            times = data[data.dtype.names[names.index("time")]]
+        else:
+            times = np.arange(len(prices), dtype = np.float64)
+
+        return times, prices
+
+    raise ValueError("unsupported price file %s" % path)
+
+
+"""
+Holds the outcome of a backtest in the same layout as TradingApp:
+long_trades and short_trades are 2xN arrays of [price, orderId] and
+tradeDist the profit of every closed round trip
+"""
+class BacktestResult:
+
+    def __init__(self, long_trades, short_trades, tradeDist, quantity):
+
+        self.long_trades = long_trades
+        self.short_trades = short_trades
+        self.tradeDist = tradeDist
+        self.quantity = quantity
+
+    """
+    Same statistics as TradingGUI.updateStats, per share
+    """
+    def stats(self):
+
+        tradeDist = self.tradeDist
+
+        if len(tradeDist) == 0:
+            return {"trades": 0, "total": 0.0, "avg": 0.0, "std": 0.0, "max": 0.0, "min": 0.0}
+
+        return {"trades": len(tradeDist),
+                "total": float(np.sum(tradeDist)),
+                "avg": float(np.mean(tradeDist)),
+                "std": float(np.std(tradeDist)),
+                "max": float(np.max(tradeDist)),
+                "min": float(np.min(tradeDist))}
+
+
+"""
+Returns the position (1 long, 0 flat) held after each tick by the
+Moving Average Crossover Strategy on simple averages
+"""
+def crossover_positions(prices, long_window, short_window):
+
+    return strategy_class("crossover").signals(prices, long_window, short_window)
+
+
+"""
+Vectorized backtest over a whole price array
+"""
+def run_vectorized(prices, long_window, short_window, quantity = 100, strategy = "crossover",
+                   ma_type = "SMA"):
+
+    prices = np.asarray(prices, dtype = np.float64)
+    positions = strategy_class(strategy).signals(prices, long_window, short_window, ma_type)
+
+    change = np.diff(positions, prepend = 0)
+    buys = np.flatnonzero(change == 1)
+    sells = np.flatnonzero(change == -1)
+
+    #Order IDs count up in the order the trades were made, like TWS does
+    orderIds = np.empty(len(buys) + len(sells), dtype = np.float64)
+    order = np.argsort(np.concatenate((buys, sells)), kind = "stable")
+    orderIds[order] = np.arange(1, len(orderIds) + 1)
+
+    long_trades = np.vstack((prices[buys], orderIds[:len(buys)]))
+    short_trades = np.vstack((prices[sells], orderIds[len(buys):]))
+
+    #Starting flat, the n-th sell always closes the n-th buy
+    tradeDist = prices[sells] - prices[buys[:len(sells)]]
+
+    return BacktestResult(long_trades, short_trades, tradeDist, quantity)
+
+
+"""
+TradingApp that never connects. Orders are filled straight away at the
+last price so run_strategy can be driven tick by tick offline, and are
+not rate limited
+"""
+class BacktestApp(TradingApp):
+
+    def __init__(self, contract, long_window, short_window, quantity, ma_type = "SMA",
+                 strategy = "crossover"):
+
+        TradingApp.__init__(self, contract, long_window, short_window, quantity, ma_type,
+                            spill_dir = None, reconcile_interval = float("inf"),
+                            order_rate = None, strategy = strategy)
+
+        self.nextValidId(1)
+        self.lastPrice = float("nan")
+
+    def placeOrder(self, orderId, contract, order):
+
+        self.orderStatus(orderId, "Filled", order.totalQuantity, 0, self.lastPrice, 0,
+                         0, self.lastPrice, 0, "", 0.0)
+
+        execution = Execution()
+        execution.execId = str(orderId)
+        execution.orderId = orderId
+        execution.side = "BOT" if order.action == "BUY" else "SLD"
+        execution.price = self.lastPrice
+        execution.shares = order.totalQuantity
+
+        self.execDetails(-1, contract, execution)
+
+    def tickPrice(self, reqId, tickType, price, attrib):
+
+        self.lastPrice = price
+        TradingApp.tickPrice(self, reqId, tickType, price, attrib)
+
+
+"""
+Reference backtest that replays every price through TradingApp.tickPrice
+"""
+def run_event_driven(prices, long_window, short_window, quantity = 100, ma_type = "SMA",
+                     strategy = "crossover"):
+
+    contract = Contract()
+    contract.symbol = "BACKTEST"
+
+    app = BacktestApp(contract, long_window, short_window, quantity, ma_type, strategy)
+
+    for price in prices:
+        app.tickPrice(1, 68, float(price), None)
+
+    return BacktestResult(app.long_trades.copy(), app.short_trades.copy(),
+                          app.tradeDist.copy(), quantity)
+
+
+"""
+Runs both backtests and checks that they made the same trades
+
+Returns (matches, vectorized result, event driven result). The two can
+only disagree on a tick where the strategy sits exactly on a threshold
+(both averages equal) up to rounding
+"""
+def compare(prices, long_window, short_window, quantity = 100, strategy = "crossover",
+            ma_type = "SMA"):
+
+    fast = run_vectorized(prices, long_window, short_window, quantity, strategy, ma_type)
+    reference = run_event_driven(prices, long_window, short_window, quantity, ma_type, strategy)
+
+    matches = (np.array_equal(fast.long_trades, reference.long_trades)
+               and np.array_equal(fast.short_trades, reference.short_trades)
+               and np.allclose(fast.tradeDist, reference.tradeDist))
+
+    return matches, fast, reference
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Backtest a trading strategy")
+    parser.add_argument("path", help = "historical tick or bar file (.csv, .npy or .bin)")
+    parser.add_argument("--long", type = int, default = 10, help = "long window")
+    parser.add_argument("--short", type = int, default = 3, help = "short window")
+    parser.add_argument("--quantity", type = int, default = 100, help = "shares per trade")
+    parser.add_argument("--strategy", default = "crossover",
+                        help = "crossover, breakout or meanreversion")
+    parser.add_argument("--ma-type", default = "SMA", help = "moving average, SMA, EMA or VWAP")
+    parser.add_argument("--check", action = "store_true",
+                        help = "also run the event driven backtest and compare the trades")
+    args = parser.parse_args(argv)
+
+    times, prices = load_prices(args.path)
+
+    start = time.perf_counter()
+    result = run_vectorized(prices, args.long, args.short, args.quantity, args.strategy,
+                            args.ma_type)
+    elapsed = time.perf_counter() - start
+
+    print("Replayed %d prices in %.3f s" % (len(prices), elapsed))
+
+    for name, value in result.stats().items():
+        print("%-6s %s" % (name, value))
+
+    if args.check:
+
+        matches, fast, reference = compare(prices, args.long, args.short, args.quantity,
+                                           args.strategy, args.ma_type)
+        print("Event driven backtest matches:", matches)
+
+        return 0 if matches else 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,214 @@
+import math
+import os
+
+import numpy as np
+
+"""
+Bars built from the ticks of an instrument
+
+With bars turned on (bar_type of TradingApp) the strategy and the GUI see
+one price per bar, its close, instead of every tick. That makes the
+windows of the strategy a number of bars (of a fixed length of time,
+number of trades or traded volume) so they mean the same however busy
+the market is, and cuts the strategy calls and chart points by the
+number of ticks in a bar
+
+    "time"      a bar every bar_size seconds, aligned to the clock
+    "tick"      a bar every bar_size last price ticks
+    "volume"    a bar every bar_size shares traded
+
+The volume comes from tickSize: TWS follows every last price with the
+size of that trade (LAST_SIZE, or DELAYED_LAST_SIZE for delayed data),
+which is added to the open bar. Because the size comes after its price,
+tick and volume bars are closed by the size that completes them, or by
+the next price when no size is sent. Time bars are closed by the first
+price after their end, or by poll when no price comes in
+
+Closed bars are kept in a BarStore as BAR_DTYPE records, which works
+like TickStore: a fixed memory footprint, the oldest bars spilled to a
+file that can be memory mapped with load_bars
+"""
+
+BAR_DTYPE = np.dtype([("time", "f8"), ("open", "f8"), ("high", "f8"), ("low", "f8"),
+                      ("close", "f8"), ("volume", "f8"), ("ticks", "i8")])
+
+BAR_TYPES = ("time", "tick", "volume")
+
+
+class BarStore:
+
+    def __init__(self, retention = 100000, spill_path = None):
+
+        self.retention = retention
+        self.spill_path = spill_path
+        self.records = np.empty(2 * retention, dtype = BAR_DTYPE)
+
+        self.count = 0
+        self.spilled = 0
+
+    def __len__(self):
+
+        return self.count
+
+    @property
+    def total(self):
+
+        return self.spilled + self.count
+
+    """
+    View of every bar still held in memory
+    """
+    @property
+    def bars(self):
+
+        return self.records[:self.count]
+
+    def append(self, bar):
+
+        if self.count == len(self.records):
+            self._spill()
+
+        self.records[self.count] = bar
+        self.count += 1
+
+    def _spill(self):
+
+        n = self.count - self.retention
+
+        if self.spill_path is not None:
+
+            directory = os.path.dirname(self.spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok = True)
+
+            with open(self.spill_path, "ab") as f:
+                self.records[:n].tofile(f)
+
+        self.records[:self.retention] = self.records[n:self.count]
+        self.count = self.retention
+        self.spilled += n
+
+
+"""
+BarBuilder turns the ticks of one instrument into bars, see the top of
+this file. price, volume_traded and poll return the bar they closed as a
+tuple in BAR_DTYPE order, or None
+"""
+class BarBuilder:
+
+    def __init__(self, bar_type, bar_size, origin = 0.0, retention = 100000, spill_path = None):
+
+        if bar_type not in BAR_TYPES:
+            raise ValueError("unknown bar type %r, expected one of %s"
+                             % (bar_type, ", ".join(BAR_TYPES)))
+
+        if not bar_size > 0:
+            raise ValueError("bar size must be above 0, got %r" % (bar_size,))
+
+        self.bar_type = bar_type
+        self.bar_size = bar_size
+
+        #Added to the tick times to align time bars, TradingApp passes the
+        #epoch time its tick times are measured from
+        self.origin = origin
+
+        self.store = BarStore(retention, spill_path)
+
+        #The open bar
+        self.open = None
+        self.time = self.end = 0.0
+        self.high = self.low = self.close = 0.0
+        self.volume = 0.0
+        self.ticks = 0
+
+    """
+    The bar that is still open, None before the first price
+    """
+    @property
+    def current(self):
+
+        if self.open is None:
+            return None
+
+        return (self.time, self.open, self.high, self.low, self.close, self.volume, self.ticks)
+
+    @property
+    def complete(self):
+
+        if self.bar_type == "tick":
+            return self.ticks >= self.bar_size
+
+        if self.bar_type == "volume":
+            return self.volume >= self.bar_size
+
+        return False
+
+    def price(self, t, price):
+
+        closed = None
+
+        if self.open is not None and (self.complete or (self.bar_type == "time" and t >= self.end)):
+            closed = self._close()
+
+        if self.open is None:
+
+            self.open = self.high = self.low = price
+            self.volume = 0.0
+            self.ticks = 0
+
+            if self.bar_type == "time":
+                start = math.floor((t + self.origin) / self.bar_size) * self.bar_size
+                self.time = start - self.origin
+                self.end = self.time + self.bar_size
+            else:
+                self.time = t
+
+        elif price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+
+        self.close = price
+        self.ticks += 1
+
+        return closed
+
+    def volume_traded(self, size):
+
+        if self.open is None:
+            return None
+
+        self.volume += size
+
+        return self._close() if self.complete else None
+
+    """
+    Closes a time bar once "t" is past its end
+    """
+    def poll(self, t):
+
+        if self.open is not None and self.bar_type == "time" and t >= self.end:
+            return self._close()
+
+        return None
+
+    def _close(self):
+
+        bar = self.current
+
+        self.store.append(bar)
+        self.open = None
+
+        return bar
+
+
+"""
+Memory maps a bar file spilled by BarStore
+"""
+def load_bars(path):
+
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.empty(0, dtype = BAR_DTYPE)
+
+    return np.memmap(path, dtype = BAR_DTYPE, mode = "r",
+                     shape = (os.path.getsize(path) // BAR_DTYPE.itemsize,))
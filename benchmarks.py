@@ -0,0 +1,280 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from ibapi.contract import Contract
+from ibapi.execution import Execution
+from ibapi.order import Order
+
+from backtest import BacktestApp
+from latency import LatencyHistogram
+
+"""
+Benchmarks for the TradingApp callback hot paths
+
+Synthetic callback streams are fed straight into a TradingApp whose
+client side is stubbed out (backtest.BacktestApp, orders are filled
+in-process) so no socket or TWS is needed. For every handler and size
+the suite reports:
+
+    calls_per_s     throughput of an untimed loop over all the events
+    p50/p99/max_ns  per-call latency, every call of a second pass timed
+                    with perf_counter_ns (capped at --latency-calls calls)
+    mem_bytes       memory still allocated after the run (tracemalloc),
+                    to catch structures that grow without bound
+
+Run it in CI with --compare against a saved --save file, the exit code
+is 1 when a benchmark got slower or grew more than --tolerance allows:
+
+    python benchmarks.py --sizes 1e3,1e4,1e5 --save baseline.json
+    python benchmarks.py --sizes 1e3,1e4,1e5 --compare baseline.json
+"""
+
+
+def make_app(long_window = 10, short_window = 3):
+
+    contract = Contract()
+    contract.symbol = "BENCH"
+
+    return BacktestApp(contract, long_window, short_window, 100)
+
+
+def random_walk(n, seed = 0):
+
+    rng = np.random.default_rng(seed)
+
+    return np.round(100 + np.cumsum(rng.normal(0, 0.05, n)), 2).tolist()
+
+
+"""
+Each bench_* function builds its own app and events and returns
+(handler, list of argument tuples) to be called as handler(*args)
+"""
+def bench_tickPrice(n):
+
+    app = make_app()
+
+    return app.tickPrice, [(1, 68, price, None) for price in random_walk(n)]
+
+
+def bench_run_strategy(n):
+
+    app = make_app()
+
+    for price in random_walk(1000):
+        app.tickPrice(1, 68, price, None)
+
+    instrument = app.instruments[0]
+
+    return app.run_strategy, [(instrument,)] * n
+
+
+def bench_execDetails(n):
+
+    app = make_app()
+    contract = app.contract
+    prices = random_walk(n, seed = 1)
+    events = []
+
+    #Alternating buys and sells, each order filled in three executions
+    for i in range(n):
+
+        execution = Execution()
+        orderId = i // 3
+        execution.orderId = orderId
+        execution.execId = "%d.%d" % (orderId, i % 3)
+        execution.side = "BOT" if orderId % 2 == 0 else "SLD"
+        execution.price = prices[i]
+        execution.shares = 100
+
+        events.append((-1, contract, execution))
+
+    return app.execDetails, events
+
+
+def bench_orderStatus(n):
+
+    app = make_app()
+    instrument = app.instruments[0]
+    events = []
+
+    #Orders are put in the book without being filled, so that every
+    #status has an order to update
+    app.orders.send = lambda orderId, contract, order: None
+
+    for i in range(n):
+
+        orderId = i // 2
+        status = "Submitted" if i % 2 == 0 else "Filled"
+
+        if i % 2 == 0:
+            order = Order()
+            order.action = "BUY" if orderId % 2 == 0 else "SELL"
+            order.totalQuantity = 100
+            app.orders.submit(orderId, app.contract, order)
+            app.byOrderId[orderId] = instrument
+
+        events.append((orderId, status, 0, 100, 0.0, 0, 0, 0.0, 0, "", 0.0))
+
+    instrument.currentOrderId = 0
+
+    return app.orderStatus, events
+
+
+BENCHMARKS = {"tickPrice": bench_tickPrice,
+              "run_strategy": bench_run_strategy,
+              "execDetails": bench_execDetails,
+              "orderStatus": bench_orderStatus}
+
+
+def throughput(handler, events):
+
+    start = time.perf_counter()
+
+    for args in events:
+        handler(*args)
+
+    elapsed = time.perf_counter() - start
+
+    return len(events) / elapsed if elapsed > 0 else float("inf")
+
+
+def latency(handler, events):
+
+    histogram = LatencyHistogram()
+    clock = time.perf_counter_ns
+
+    for args in events:
+        start = clock()
+        handler(*args)
+        histogram.record(clock() - start)
+
+    return histogram
+
+
+def memory(handler, events):
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    for args in events:
+        handler(*args)
+
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return after - before, peak - before
+
+
+def run(names, sizes, latency_calls = 100000, measure_memory = True):
+
+    results = []
+
+    for name in names:
+
+        bench = BENCHMARKS[name]
+
+        for n in sizes:
+
+            handler, events = bench(n)
+            rate = throughput(handler, events)
+
+            handler, events = bench(min(n, latency_calls))
+            histogram = latency(handler, events)
+
+            row = {"name": name, "n": n, "calls_per_s": rate,
+                   "p50_ns": histogram.percentile(50), "p99_ns": histogram.percentile(99),
+                   "max_ns": histogram.max}
+
+            if measure_memory:
+                handler, events = bench(n)
+                row["mem_bytes"], row["peak_bytes"] = memory(handler, events)
+
+            results.append(row)
+            del handler, events
+
+    return results
+
+
+"""
+Compares results with a baseline from --save. Returns the list of
+regressions: throughput down, or memory up, by more than tolerance
+"""
+def regressions(results, baseline, tolerance):
+
+    old = {(row["name"], row["n"]): row for row in baseline}
+    found = []
+
+    for row in results:
+
+        before = old.get((row["name"], row["n"]))
+
+        if before is None:
+            continue
+
+        if row["calls_per_s"] < before["calls_per_s"] * (1 - tolerance):
+            found.append("%s n=%d: %.0f calls/s, was %.0f"
+                         % (row["name"], row["n"], row["calls_per_s"], before["calls_per_s"]))
+
+        #Small absolute growth is allocator noise, only flag real growth
+        if ("mem_bytes" in row and "mem_bytes" in before
+                and row["mem_bytes"] > max(before["mem_bytes"] * (1 + tolerance),
+                                           before["mem_bytes"] + (1 << 20))):
+            found.append("%s n=%d: %d bytes retained, was %d"
+                         % (row["name"], row["n"], row["mem_bytes"], before["mem_bytes"]))
+
+    return found
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Benchmark the TradingApp callback handlers")
+    parser.add_argument("--bench", default = ",".join(BENCHMARKS),
+                        help = "comma separated benchmarks, from %s" % ", ".join(BENCHMARKS))
+    parser.add_argument("--sizes", default = "1e3,1e4,1e5",
+                        help = "comma separated event counts, up to 1e7")
+    parser.add_argument("--latency-calls", type = float, default = 1e5,
+                        help = "most calls timed one by one for the latency percentiles")
+    parser.add_argument("--no-memory", action = "store_true", help = "skip the tracemalloc pass")
+    parser.add_argument("--save", default = None, help = "write the results to this json file")
+    parser.add_argument("--compare", default = None, help = "baseline json file to compare with")
+    parser.add_argument("--tolerance", type = float, default = 0.25,
+                        help = "allowed slowdown / growth against the baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    names = args.bench.split(",")
+    sizes = [int(float(size)) for size in args.sizes.split(",")]
+
+    results = run(names, sizes, int(args.latency_calls), not args.no_memory)
+
+    print("%-14s %10s %14s %10s %10s %12s %14s"
+          % ("benchmark", "n", "calls/s", "p50 ns", "p99 ns", "max ns", "retained B"))
+
+    for row in results:
+        print("%-14s %10d %14.0f %10d %10d %12d %14s"
+              % (row["name"], row["n"], row["calls_per_s"], row["p50_ns"], row["p99_ns"],
+                 row["max_ns"], row.get("mem_bytes", "-")))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent = 2)
+
+    if args.compare:
+
+        with open(args.compare) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+
+        for line in found:
+            print("REGRESSION", line, file = sys.stderr)
+
+        return 1 if found else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
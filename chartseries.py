@@ -0,0 +1,201 @@
+import numpy as np
+
+from bars import BAR_DTYPE
+from indicators import RunningVolatility, make_indicator
+
+"""
+Data behind the price chart of the GUI, kept up to date incrementally
+
+Every refresh only the ticks that arrived since the last one are taken
+from the Delta chain of the snapshot (its "total" tick count tells how
+many are new, see snapshot.py). They are folded into streaming moving
+averages of the kind the strategy trades on (the ma_type of the
+instrument, weighted by the trade sizes for a VWAP) and a running log
+return volatility, and appended to the plotted series. The averages and the
+volatility cover the whole session, while the plotted series keep only
+the latest max_points points, so the cost of a frame does not grow with
+the length of the session
+
+The series are stored like TickStore does: arrays twice max_points long
+that get compacted when full, so times, prices, long and short are
+always contiguous views that can be passed straight to setData
+"""
+class ChartSeries:
+
+    COLUMNS = ("times", "prices", "long", "short", "sizes")
+
+    def __init__(self, long_window, short_window, ma_type = "SMA", max_points = 20000):
+
+        self.max_points = max_points
+        self.data = np.full((len(self.COLUMNS), 2 * max_points), np.nan)
+        self.count = 0
+
+        #Ticks taken from snapshots so far
+        self.total = 0
+
+        self.volatility = RunningVolatility()
+        self.set_windows(long_window, short_window, ma_type)
+
+    @property
+    def times(self):
+
+        return self.data[0, :self.count]
+
+    @property
+    def prices(self):
+
+        return self.data[1, :self.count]
+
+    @property
+    def long(self):
+
+        return self.data[2, :self.count]
+
+    @property
+    def short(self):
+
+        return self.data[3, :self.count]
+
+    @property
+    def sizes(self):
+
+        return self.data[4, :self.count]
+
+    """
+    Starts new averages for the given windows and kind of average and
+    recomputes the average series over the points still held, only needed
+    when one of them changes
+    """
+    def set_windows(self, long_window, short_window, ma_type = "SMA"):
+
+        self.long_window = long_window
+        self.short_window = short_window
+        self.ma_type = ma_type
+        self.long_ma = make_indicator(ma_type, long_window)
+        self.short_ma = make_indicator(ma_type, short_window)
+
+        for i, (price, size) in enumerate(zip(self.prices.tolist(), self.sizes.tolist())):
+            self.data[2, i], self.data[3, i] = self._averages(price, size)
+
+    """
+    Takes the new ticks of an InstrumentSnapshot. Returns False when there
+    was nothing new to draw
+
+    If more ticks arrived than the snapshot still holds, the ones in the
+    gap are skipped
+    """
+    def update(self, state):
+
+        changed = False
+
+        if (state.long_window != self.long_window or state.short_window != self.short_window
+                or state.ma_type != self.ma_type):
+            self.set_windows(state.long_window, state.short_window, state.ma_type)
+            changed = True
+
+        if state.ticks is None or state.total <= self.total:
+            return changed
+
+        records = state.ticks.since(self.total)
+        self.total = state.total
+
+        new = len(records)
+
+        if new == 0:
+            return changed
+
+        times = records["time"]
+        prices = records["price"]
+        sizes = records["size"]
+
+        #Only the latest max_points of this block can end up plotted
+        if new > self.max_points:
+            for price, size in zip(prices[:-self.max_points].tolist(),
+                                   sizes[:-self.max_points].tolist()):
+                self._update_stats(price, size)
+            times = times[-self.max_points:]
+            prices = prices[-self.max_points:]
+            sizes = sizes[-self.max_points:]
+            new = self.max_points
+
+        if self.count + new > self.data.shape[1]:
+            keep = self.max_points - new
+            self.data[:, :keep] = self.data[:, self.count - keep:self.count]
+            self.count = keep
+
+        start = self.count
+        self.data[0, start:start + new] = times
+        self.data[1, start:start + new] = prices
+        self.data[4, start:start + new] = sizes
+
+        for i, (price, size) in enumerate(zip(prices.tolist(), sizes.tolist()), start):
+            self.data[2, i], self.data[3, i] = self._update_stats(price, size)
+
+        self.count = start + new
+
+        return True
+
+    def _averages(self, price, size):
+
+        long_ma = self.long_ma.update(price, size)
+        short_ma = self.short_ma.update(price, size)
+
+        return (long_ma if self.long_ma.ready else np.nan,
+                short_ma if self.short_ma.ready else np.nan)
+
+    def _update_stats(self, price, size):
+
+        self.volatility.update(price)
+
+        return self._averages(price, size)
+
+
+"""
+The bars behind the chart when the app trades on bars: the closed bars
+taken from the bar Delta chain of the snapshot, kept like ChartSeries
+keeps its points (at most max_points, in an array twice that long), and
+the bar that is still open
+"""
+class BarSeries:
+
+    def __init__(self, max_points = 20000):
+
+        self.max_points = max_points
+        self.records = np.zeros(2 * max_points, dtype = BAR_DTYPE)
+        self.count = 0
+
+        #Bars taken from snapshots so far, and the open one
+        self.total = 0
+        self.current = None
+
+    @property
+    def bars(self):
+
+        return self.records[:self.count]
+
+    """
+    Takes the new bars of an InstrumentSnapshot. Returns False when there
+    was nothing new to draw
+    """
+    def update(self, state):
+
+        changed = state.bar != self.current
+        self.current = state.bar
+
+        if state.bars is None or state.bars.end <= self.total:
+            return changed
+
+        records = state.bars.since(self.total)[-self.max_points:]
+        self.total = state.bars.end
+
+        new = len(records)
+
+        if self.count + new > len(self.records):
+            keep = self.max_points - new
+            self.records[:keep] = self.records[self.count - keep:self.count]
+            self.count = keep
+
+        self.records[self.count:self.count + new] = records
+        self.count += new
+
+        return True
@@ -0,0 +1,383 @@
+import argparse
+import json
+import math
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from ibapi.contract import Contract
+
+from IBTradingApp import TradingApp
+from bars import BAR_DTYPE
+from strategies import make_strategy
+
+"""
+Headless mode of the Trading Application
+
+Runs TradingApp without the GUI: no PyQt5, pyqtgraph or matplotlib is
+imported, only the IB API and NumPy. The instruments, connection and app
+options come from a JSON config file, and any of them can be overridden
+on the command line:
+
+    {
+        "host": "127.0.0.1", "port": 7497, "clientId": 0, "marketDataType": 3,
+        "instruments": [{"symbol": "AAPL", "long": 10, "short": 3, "quantity": 100},
+                        {"symbol": "MSFT", "long": 20, "short": 5, "quantity": 50,
+                         "strategy": "meanreversion",
+                         "strategy_params": {"entry": 1.5, "exit": 0.5}}],
+        "app": {"strategy": "crossover", "warm_start": true, "max_position": 500},
+        "http": {"host": "127.0.0.1", "port": 8080}
+    }
+
+--symbol trades that one symbol instead of the instruments of the config,
+--long, --short and --quantity change every instrument that is traded
+
+"app" holds keyword arguments of TradingApp, "strategy_params" in it or
+in an instrument are keyword arguments of the strategy (see
+TradingApp.add_instrument for which apply). The state and metrics are
+served over HTTP on the local interface, read from the snapshots the
+trading thread publishes, so a request never touches the live state:
+
+    GET /state      json of every instrument (add ?points=N for the last
+                    N prices, and bars when trading on bars), the totals of
+                    the risk book and the counters
+    GET /metrics    the same numbers in the Prometheus text format
+    GET /latency    LatencyMonitor.snapshot() of the tick to fill path,
+                    as of the latest snapshot
+
+A GUI or dashboard can attach as a client of these endpoints. Port 0 in
+the http section turns the server off
+"""
+
+DEFAULTS = {"host": "127.0.0.1", "port": 7497, "clientId": 0, "marketDataType": 3,
+            "secType": "STK", "exchange": "SMART", "currency": "USD",
+            "instruments": [{"symbol": "AAPL", "long": 10, "short": 3, "quantity": 100}],
+            "app": {},
+            "http": {"host": "127.0.0.1", "port": 8080}}
+
+
+"""
+Reads the config file (if any) over the defaults and applies the command
+line overrides
+"""
+def load_config(path = None, overrides = None):
+
+    config = dict(DEFAULTS)
+
+    if path:
+        with open(path) as f:
+            config.update(json.load(f))
+
+    config["app"] = dict(config["app"])
+    config["http"] = dict(DEFAULTS["http"], **config["http"])
+    config["instruments"] = [dict(spec) for spec in config["instruments"]]
+
+    overrides = {key: value for key, value in (overrides or {}).items() if value is not None}
+
+    #A symbol on the command line replaces the list, keeping the settings
+    #of the first instrument
+    if "symbol" in overrides:
+        first = config["instruments"][0] if config["instruments"] else {}
+        first["symbol"] = overrides.pop("symbol")
+        config["instruments"] = [first]
+
+    for key, value in overrides.items():
+
+        if key in ("long", "short", "quantity"):
+            for spec in config["instruments"]:
+                spec[key] = value
+        elif key in ("http_host", "http_port"):
+            config["http"][key[5:]] = value
+        elif key in DEFAULTS:
+            config[key] = value
+        else:
+            config["app"][key] = value
+
+    return config
+
+
+def make_contract(config, spec):
+
+    contract = Contract()
+    contract.symbol = spec["symbol"]
+    contract.secType = spec.get("secType", config["secType"])
+    contract.exchange = spec.get("exchange", config["exchange"])
+    contract.currency = spec.get("currency", config["currency"])
+
+    if spec.get("primaryExchange"):
+        contract.primaryExchange = spec["primaryExchange"]
+
+    return contract
+
+
+"""
+TradingApp with every instrument of the config. The ma_type, strategy
+and strategy_params of an instrument default to the ones in "app"
+"""
+def build_app(config):
+
+    first, others = config["instruments"][0], config["instruments"][1:]
+
+    app = TradingApp(make_contract(config, first), first["long"], first["short"],
+                     first["quantity"], **config["app"])
+
+    #The primary instrument is built by TradingApp with the defaults
+    primary = app.instruments[0]
+
+    if first.get("ma_type"):
+        primary.ma_type = first["ma_type"]
+
+    if first.get("strategy") or first.get("strategy_params") is not None:
+        primary.strategy = make_strategy(first.get("strategy") or app.strategy, primary,
+                                         **app._strategy_params(first.get("strategy"),
+                                                                first.get("strategy_params")))
+
+    for spec in others:
+        app.add_instrument(make_contract(config, spec), spec["long"], spec["short"],
+                           spec["quantity"], spec.get("ma_type"), spec.get("strategy"),
+                           spec.get("strategy_params"))
+
+    return app
+
+
+def _number(value):
+
+    if value is None or (isinstance(value, float) and not math.isfinite(value)):
+        return None
+
+    return value
+
+
+"""
+json state of the latest snapshot (or the one given), with the last
+"points" prices of each instrument. Only whether the app is connected is
+read from the app itself
+"""
+def state(app, points = 0, snapshot = None):
+
+    snapshot = snapshot or app.snapshots.latest
+    instruments = []
+
+    for s in snapshot.instruments:
+
+        entry = {"symbol": s.symbol, "ticks": s.total,
+                 "last": float(s.ticks.records["price"][-1]) if s.ticks is not None else None,
+                 "long_window": s.long_window, "short_window": s.short_window,
+                 "ma_type": s.ma_type,
+                 "long_ma": _number(s.long_ma), "short_ma": _number(s.short_ma),
+                 "quantity": s.quantity, "pos": s.pos, "position": s.position,
+                 "avgCost": s.avgCost, "realizedPnl": s.realizedPnl,
+                 "unrealizedPnl": s.unrealizedPnl,
+                 "currentOrderId": s.currentOrderId if isinstance(s.currentOrderId, int) else None,
+                 "currentOrderStatus": s.currentOrderStatus,
+                 "currentOrderType": s.currentOrderType,
+                 "trades": len(s.tradeDist), "tradeProfit": float(s.tradeDist.sum()),
+                 "bars": s.bars.end if s.bars is not None else 0,
+                 "bar": dict(zip(BAR_DTYPE.names, s.bar)) if s.bar is not None else None}
+
+        if points:
+            records = s.ticks.latest(points) if s.ticks is not None else None
+            entry["times"] = records["time"].tolist() if records is not None else []
+            entry["prices"] = records["price"].tolist() if records is not None else []
+
+            if s.bars is not None:
+                bars = s.bars.latest(points)
+                entry["ohlcv"] = {name: bars[name].tolist() for name in BAR_DTYPE.names}
+
+        instruments.append(entry)
+
+    return {"version": snapshot.version, "published": snapshot.published,
+            "connected": app.isConnected(),
+            "pnl": snapshot.pnl, "counters": snapshot.counters,
+            "instruments": instruments}
+
+
+"""
+The numbers of state in the Prometheus text format
+"""
+def metrics(app):
+
+    snapshot = app.snapshots.latest
+    current = state(app, snapshot = snapshot)
+    lines = []
+    typed = set()
+
+    def add(name, value, kind = "gauge", labels = None):
+
+        if value is None:
+            return
+
+        if name not in typed:
+            typed.add(name)
+            lines.append("# TYPE tradingapp_%s %s" % (name, kind))
+
+        label = ""
+        if labels:
+            label = "{" + ",".join('%s="%s"' % item for item in labels.items()) + "}"
+
+        lines.append("tradingapp_%s%s %s" % (name, label, float(value)))
+
+    add("connected", current["connected"])
+    add("snapshot_version", current["version"], "counter")
+
+    for name, value in current["pnl"].items():
+        add("pnl_" + name, value)
+
+    for group, counters in current["counters"].items():
+        for name, value in counters.items():
+            add("%s_%s" % (group, name), value, "gauge" if name in ("queued", "max_queued") else "counter")
+
+    #Every sample of a metric has to follow its TYPE line
+    for name in ("ticks", "last", "long_ma", "short_ma", "position", "avgCost",
+                 "realizedPnl", "unrealizedPnl", "trades"):
+        for entry in current["instruments"]:
+            add("instrument_" + name, entry[name], labels = {"symbol": entry["symbol"]})
+
+    latency = snapshot.latency["latency"]
+
+    for name in ("count", "p50_ns", "p99_ns", "max_ns"):
+        for stage, summary in latency.items():
+            add("latency_" + name, summary.get(name), labels = {"stage": stage})
+
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    #Set on the subclass made by serve
+    app = None
+
+    def do_GET(self):
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        try:
+
+            if url.path == "/state":
+                points = int(query.get("points", ["0"])[0])
+                self._send(json.dumps(state(self.app, points)), "application/json")
+            elif url.path == "/metrics":
+                self._send(metrics(self.app), "text/plain; version=0.0.4")
+            elif url.path == "/latency":
+                self._send(json.dumps(self.app.snapshots.latest.latency), "application/json")
+            else:
+                self.send_error(404)
+
+        except ValueError as e:
+            self.send_error(400, str(e))
+
+    def _send(self, body, content_type):
+
+        body = body.encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+
+        pass
+
+
+"""
+Starts the HTTP server on a daemon thread and returns it, or None when
+the port is 0
+"""
+def serve(app, host = "127.0.0.1", port = 8080):
+
+    if not port:
+        return None
+
+    handler = type("Handler", (_Handler,), {"app": app})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    threading.Thread(target = server.serve_forever, name = "HTTP", daemon = True).start()
+
+    return server
+
+
+"""
+Connects, subscribes and runs the message loop on a thread, the same
+steps as the GUI worker thread
+"""
+def run(app, config):
+
+    app.connect(config["host"], config["port"], clientId = config["clientId"])
+
+    if not app.isConnected():
+        return False
+
+    app.reqMarketDataType(config["marketDataType"])
+    app.subscribe()
+    app.reqPositions()
+
+    thread = threading.Thread(target = app.run, name = "TradingApp", daemon = True)
+    thread.start()
+
+    return thread
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Run the trading application without a GUI")
+    parser.add_argument("--config", default = None, help = "json config file")
+    parser.add_argument("--symbol", default = None, help = "stock to trade")
+    parser.add_argument("--long", type = int, default = None, help = "long window")
+    parser.add_argument("--short", type = int, default = None, help = "short window")
+    parser.add_argument("--quantity", type = int, default = None, help = "shares per trade")
+    parser.add_argument("--strategy", default = None,
+                        help = "crossover, breakout or meanreversion")
+    parser.add_argument("--strategy-params", dest = "strategy_params", type = json.loads,
+                        default = None, help = "keyword arguments of the strategy, a json object")
+    parser.add_argument("--bar-type", dest = "bar_type", default = None,
+                        choices = ["time", "tick", "volume"], help = "trade on bars of this kind")
+    parser.add_argument("--bar-size", dest = "bar_size", type = float, default = None,
+                        help = "seconds, ticks or shares per bar")
+    parser.add_argument("--host", default = None, help = "TWS host")
+    parser.add_argument("--port", type = int, default = None, help = "TWS port")
+    parser.add_argument("--clientId", type = int, default = None, help = "API client ID")
+    parser.add_argument("--http-host", dest = "http_host", default = None,
+                        help = "interface of the state and metrics server")
+    parser.add_argument("--http-port", dest = "http_port", type = int, default = None,
+                        help = "port of the state and metrics server, 0 turns it off")
+    args = parser.parse_args(argv)
+
+    overrides = vars(args)
+    config = load_config(overrides.pop("config"), overrides)
+
+    app = build_app(config)
+    server = serve(app, config["http"]["host"], config["http"]["port"])
+
+    thread = run(app, config)
+
+    if not thread:
+        print("Could not connect to TWS at %s:%s" % (config["host"], config["port"]))
+        return 1
+
+    if server is not None:
+        print("Serving state and metrics on http://%s:%d" % server.server_address[:2])
+
+    stop = threading.Event()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    while thread.is_alive() and not stop.wait(1.0):
+        pass
+
+    app.disconnect()
+    thread.join(5)
+
+    if server is not None:
+        server.shutdown()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
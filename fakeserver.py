@@ -0,0 +1,666 @@
+import argparse
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+"""
+A local stand-in for TWS that replays recorded ticks
+
+FakeTWS speaks enough of the IB API socket protocol to drive TradingApp
+without a live TWS: the connection handshake, nextValidId, market data
+(tickPrice, with the size of each tick), orders (openOrder/orderStatus),
+fills (execDetails), positions and historical bars. Market orders are
+filled at the last replayed price of their symbol after fill_delay
+seconds
+
+The ticks are replayed at "rate" ticks per second, or as fast as the
+client reads them when rate is None. Replay is deterministic: the same
+ticks always go out in the same order with the same order IDs and
+execution IDs, so runs can be compared with each other
+
+The server timestamps every tick it sends and every order it receives
+with time.perf_counter_ns, which gives the tick-to-order latency of the
+real client code end to end (see FakeTWS.stats)
+"""
+
+#The server version reported to the client. All messages below are laid
+#out for this version, it is new enough that the client sends orders
+#without complaining about unsupported fields. 137 is
+#MIN_SERVER_VER_TICK_BY_TICK of ibapi 9.81.1, the message layouts and raw
+#field indices below are the ones its decoder.py reads at that version
+SERVER_VERSION = 137
+
+#Incoming message IDs (client -> server)
+REQ_MKT_DATA = 1
+CANCEL_MKT_DATA = 2
+PLACE_ORDER = 3
+CANCEL_ORDER = 4
+REQ_EXECUTIONS = 7
+REQ_IDS = 8
+REQ_HISTORICAL_DATA = 20
+REQ_GLOBAL_CANCEL = 58
+REQ_MARKET_DATA_TYPE = 59
+REQ_POSITIONS = 61
+START_API = 71
+
+#Outgoing message IDs (server -> client)
+TICK_PRICE = 1
+ORDER_STATUS = 3
+OPEN_ORDER = 5
+NEXT_VALID_ID = 9
+EXECUTION_DATA = 11
+MANAGED_ACCTS = 15
+HISTORICAL_DATA = 17
+EXECUTION_DATA_END = 55
+MARKET_DATA_TYPE = 58
+POSITION_DATA = 61
+POSITION_END = 62
+
+ACCOUNT = "DU0000000"
+
+#Number of fields in an openOrder message at SERVER_VERSION and the
+#position of the fields that are filled in, everything else is empty.
+#This is Decoder.processOpenOrder of ibapi 9.81.1 with message version 34
+OPEN_ORDER_FIELDS = 111
+OPEN_ORDER_STATUS_FIELD = 87
+
+
+def _message(*fields):
+
+    text = "".join(str(field) + "\0" for field in fields).encode()
+
+    return struct.pack("!I", len(text)) + text
+
+
+"""
+An order received from the client
+"""
+class FakeOrder:
+
+    def __init__(self, orderId, symbol, action, quantity, orderType, received):
+
+        self.orderId = orderId
+        self.symbol = symbol
+        self.action = action
+        self.quantity = quantity
+        self.orderType = orderType
+        self.received = received
+        self.status = "Submitted"
+        self.fillPrice = 0.0
+
+
+"""
+State of one client connection
+"""
+class FakeSession:
+
+    def __init__(self, server, sock):
+
+        self.server = server
+        self.sock = sock
+        self.sendLock = threading.Lock()
+        self.closed = threading.Event()
+
+        self.marketDataType = 1
+        self.subscriptions = {}
+        self.lastPrice = {}
+        self.orders = {}
+        self.executions = list(server.executions)
+        self.positions = dict(server.positions)
+        self.nextOrderId = max([1] + [execution[0] + 1 for execution in self.executions])
+        self.replayer = None
+
+    def send(self, *fields):
+
+        data = _message(*fields)
+
+        with self.sendLock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.closed.set()
+
+    def run(self):
+
+        try:
+            if self._handshake():
+                self._read_loop()
+        finally:
+            self.closed.set()
+            self.sock.close()
+
+    def _recv_exact(self, n):
+
+        data = b""
+
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("client closed the connection")
+            data += chunk
+
+        return data
+
+    def _read_message(self):
+
+        size = struct.unpack("!I", self._recv_exact(4))[0]
+
+        return self._recv_exact(size).split(b"\0")[:-1]
+
+    def _handshake(self):
+
+        if self._recv_exact(4) != b"API\0":
+            return False
+
+        size = struct.unpack("!I", self._recv_exact(4))[0]
+        versions = self._recv_exact(size).decode().split()[0]
+        low, high = (int(v) for v in versions.lstrip("v").split(".."))
+
+        if not low <= SERVER_VERSION <= high:
+            return False
+
+        with self.sendLock:
+            self.sock.sendall(_message(SERVER_VERSION, time.strftime("%Y%m%d %H:%M:%S EST")))
+
+        return True
+
+    def _read_loop(self):
+
+        handlers = {START_API: self._start_api,
+                    REQ_MARKET_DATA_TYPE: self._req_market_data_type,
+                    REQ_MKT_DATA: self._req_mkt_data,
+                    CANCEL_MKT_DATA: self._cancel_mkt_data,
+                    PLACE_ORDER: self._place_order,
+                    CANCEL_ORDER: self._cancel_order,
+                    REQ_GLOBAL_CANCEL: self._global_cancel,
+                    REQ_IDS: self._req_ids,
+                    REQ_POSITIONS: self._req_positions,
+                    REQ_EXECUTIONS: self._req_executions,
+                    REQ_HISTORICAL_DATA: self._req_historical_data}
+
+        while not self.closed.is_set():
+
+            try:
+                fields = self._read_message()
+            except (ConnectionError, OSError):
+                return
+
+            handler = handlers.get(int(fields[0]))
+
+            if handler is not None:
+                handler(fields)
+
+    def _start_api(self, fields):
+
+        self.send(NEXT_VALID_ID, 1, self.nextOrderId)
+        self.send(MANAGED_ACCTS, 1, ACCOUNT)
+
+    def _req_market_data_type(self, fields):
+
+        self.marketDataType = int(fields[2])
+
+    def _req_mkt_data(self, fields):
+
+        reqId = int(fields[2])
+        symbol = fields[4].decode()
+
+        self.subscriptions[reqId] = symbol
+
+        if self.marketDataType != 1:
+            self.send(MARKET_DATA_TYPE, 1, reqId, self.marketDataType)
+
+        if self.replayer is None:
+            self.replayer = threading.Thread(target = self.server.replay, args = (self,),
+                                             daemon = True)
+            self.replayer.start()
+
+    def _cancel_mkt_data(self, fields):
+
+        self.subscriptions.pop(int(fields[2]), None)
+
+    def _place_order(self, fields):
+
+        received = time.perf_counter_ns()
+
+        quantity = float(fields[18] or 0)
+        quantity = int(quantity) if quantity.is_integer() else quantity
+
+        order = FakeOrder(int(fields[2]), fields[4].decode(), fields[17].decode(),
+                          quantity, fields[19].decode(), received)
+
+        self.orders[order.orderId] = order
+        self.nextOrderId = max(self.nextOrderId, order.orderId + 1)
+        self.server.order_received(order)
+
+        self._send_open_order(order)
+        self._send_order_status(order)
+
+        if self.server.fill_delay > 0:
+            timer = threading.Timer(self.server.fill_delay, self._fill, args = (order,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._fill(order)
+
+    def _fill(self, order):
+
+        if order.status != "Submitted" or self.closed.is_set():
+            return
+
+        order.fillPrice = self.lastPrice.get(order.symbol, 0.0)
+        order.status = "Filled"
+
+        side = "BOT" if order.action == "BUY" else "SLD"
+        signed = order.quantity if side == "BOT" else -order.quantity
+
+        position, cost = self.positions.get(order.symbol, (0.0, 0.0))
+        if position + signed != 0:
+            cost = (position * cost + signed * order.fillPrice) / (position + signed)
+        self.positions[order.symbol] = (position + signed, cost)
+
+        execution = (order.orderId, order.symbol, "%08d.01" % order.orderId,
+                     time.strftime("%Y%m%d  %H:%M:%S"), side, order.quantity, order.fillPrice)
+        self.executions.append(execution)
+
+        #TWS does not promise an order, the position can come first
+        if self.server.position_first:
+            self._send_position(order.symbol)
+
+        self._send_execution(-1, execution)
+        self._send_order_status(order)
+        self._send_open_order(order)
+
+        if not self.server.position_first:
+            self._send_position(order.symbol)
+
+        self.server.order_filled(order)
+
+    def _cancel_order(self, fields):
+
+        order = self.orders.get(int(fields[2]))
+
+        if order is not None and order.status == "Submitted":
+            order.status = "Cancelled"
+            self._send_order_status(order)
+
+    def _global_cancel(self, fields):
+
+        for order in self.orders.values():
+            if order.status == "Submitted":
+                order.status = "Cancelled"
+                self._send_order_status(order)
+
+    def _req_ids(self, fields):
+
+        self.send(NEXT_VALID_ID, 1, self.nextOrderId)
+
+    def _req_positions(self, fields):
+
+        for symbol in self.positions:
+            self._send_position(symbol)
+
+        self.send(POSITION_END, 1)
+
+    def _req_executions(self, fields):
+
+        reqId = int(fields[2])
+
+        for execution in self.executions:
+            self._send_execution(reqId, execution)
+
+        self.send(EXECUTION_DATA_END, 1, reqId)
+
+    """
+    Sends the bars of the history series that fall inside of the
+    requested duration ("N S" or "N D"), one bar a minute up to now
+    """
+    def _req_historical_data(self, fields):
+
+        reqId = int(fields[1])
+        symbol = fields[3].decode()
+        number, unit = fields[17].decode().split()
+        seconds = int(number) * (86400 if unit == "D" else 1)
+
+        bars = self.server.history_bars(symbol, seconds)
+        message = [HISTORICAL_DATA, reqId, "", "", len(bars)]
+
+        for stamp, price in bars:
+            message += [stamp, price, price, price, price, 100, price, 1]
+
+        self.server.historyRequests += 1
+        self.send(*message)
+
+    def _send_open_order(self, order):
+
+        fields = [""] * OPEN_ORDER_FIELDS
+        fields[0] = OPEN_ORDER
+        fields[1] = 34
+        fields[2] = order.orderId
+        fields[4] = order.symbol
+        fields[5] = "STK"
+        fields[10] = "SMART"
+        fields[11] = "USD"
+        fields[14] = order.action
+        fields[15] = order.quantity
+        fields[16] = order.orderType
+        fields[19] = "DAY"
+        fields[21] = ACCOUNT
+        fields[25] = 0
+        fields[26] = order.orderId
+        fields[OPEN_ORDER_STATUS_FIELD] = order.status
+
+        self.send(*fields)
+
+    def _send_order_status(self, order):
+
+        filled = order.quantity if order.status == "Filled" else 0
+
+        self.send(ORDER_STATUS, order.orderId, order.status, filled, order.quantity - filled,
+                  order.fillPrice, order.orderId, 0, order.fillPrice, 0, "", "")
+
+    def _send_execution(self, reqId, execution):
+
+        orderId, symbol, execId, stamp, side, shares, price = execution
+
+        self.send(EXECUTION_DATA, reqId, orderId, 0, symbol, "STK", "", 0.0, "", "",
+                  "SMART", "USD", symbol, symbol, execId, stamp, ACCOUNT, "ISLAND", side,
+                  shares, price, orderId, 0, 0, shares, price, "", "", "", "", 0)
+
+    def _send_position(self, symbol):
+
+        position, cost = self.positions[symbol]
+
+        self.send(POSITION_DATA, 3, ACCOUNT, 0, symbol, "STK", "", 0.0, "", "", "SMART",
+                  "USD", symbol, symbol, position, cost)
+
+
+"""
+FakeTWS: the server. "prices" (and optionally "sizes") is the tick series
+that is replayed for every market data subscription, or a dictionary of
+symbol -> prices to replay a different series per symbol
+
+"positions" (symbol -> (shares, average cost)) and "executions" (tuples
+of orderId, symbol, execId, time stamp, side, shares, price) are what
+the account held and executed before the session, reported by
+reqPositions and reqExecutions. With position_first the position update
+of a fill is sent before its execution instead of after it
+
+Only one client is expected at a time, which is all TradingApp needs
+"""
+class FakeTWS:
+
+    def __init__(self, prices, sizes = None, host = "127.0.0.1", port = 7497,
+                 rate = None, fill_delay = 0.0, history = None, positions = None,
+                 executions = None, position_first = False):
+
+        if isinstance(prices, dict):
+            self.series = {symbol: np.asarray(p, dtype = np.float64) for symbol, p in prices.items()}
+        else:
+            self.series = {None: np.asarray(prices, dtype = np.float64)}
+
+        self.sizes = None if sizes is None else np.asarray(sizes, dtype = np.float64)
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.fill_delay = fill_delay
+
+        #Closes of one minute bars ending now, served to reqHistoricalData
+        if isinstance(history, dict):
+            self.history = {symbol: np.asarray(p, dtype = np.float64) for symbol, p in history.items()}
+        elif history is not None:
+            self.history = {None: np.asarray(history, dtype = np.float64)}
+        else:
+            self.history = {}
+        self.historyRequests = 0
+
+        self.positions = dict(positions or {})
+        self.executions = list(executions or [])
+        self.position_first = position_first
+
+        self.listener = None
+        self.thread = None
+        self.sessions = []
+        self.done = threading.Event()
+
+        #Measurements, perf_counter_ns of the last tick sent per symbol
+        self.lastTickSent = {}
+        self.ticksSent = 0
+        self.replayStart = None
+        self.replayEnd = None
+        self.tickToOrder = []
+        self.orderToFill = []
+        self.ordersReceived = 0
+
+    def start(self):
+
+        self.listener = socket.create_server((self.host, self.port))
+        self.port = self.listener.getsockname()[1]
+
+        self.thread = threading.Thread(target = self._accept_loop, daemon = True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+
+        if self.listener is not None:
+            self.listener.close()
+
+        for session in self.sessions:
+            session.closed.set()
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _accept_loop(self):
+
+        while True:
+
+            try:
+                sock, address = self.listener.accept()
+            except OSError:
+                return
+
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            session = FakeSession(self, sock)
+            self.sessions.append(session)
+            threading.Thread(target = session.run, daemon = True).start()
+
+    """
+    Sends the ticks of every subscription of a session, interleaved tick
+    by tick, at self.rate ticks per second (or as fast as possible)
+    """
+    def replay(self, session):
+
+        tickType = 68 if session.marketDataType in (3, 4) else 4
+        interval = 0 if not self.rate else 1e9 / self.rate
+
+        self.replayStart = time.perf_counter_ns()
+        next_send = self.replayStart
+        length = max(len(series) for series in self.series.values())
+
+        for i in range(length):
+
+            for reqId, symbol in list(session.subscriptions.items()):
+
+                series = self.series.get(symbol, self.series.get(None))
+
+                if series is None or i >= len(series):
+                    continue
+
+                if interval:
+                    while time.perf_counter_ns() < next_send:
+                        time.sleep(0)
+                    next_send += interval
+
+                if session.closed.is_set():
+                    return
+
+                price = float(series[i])
+                size = int(self.sizes[i]) if self.sizes is not None and i < len(self.sizes) else 100
+
+                session.lastPrice[symbol] = price
+                session.send(TICK_PRICE, 6, reqId, tickType, price, size, 0)
+
+                self.lastTickSent[symbol] = time.perf_counter_ns()
+                self.ticksSent += 1
+
+        self.replayEnd = time.perf_counter_ns()
+        self.done.set()
+
+    """
+    (epoch time, close) of the history bars of the last "seconds" seconds
+    """
+    def history_bars(self, symbol, seconds):
+
+        closes = self.history.get(symbol, self.history.get(None))
+
+        if closes is None:
+            return []
+
+        end = int(time.time()) // 60 * 60
+        start = end - 60 * (len(closes) - 1)
+
+        return [(start + 60 * i, float(price)) for i, price in enumerate(closes)
+                if start + 60 * i > end - seconds]
+
+    def order_received(self, order):
+
+        self.ordersReceived += 1
+        sent = self.lastTickSent.get(order.symbol)
+
+        if sent is not None:
+            self.tickToOrder.append(order.received - sent)
+
+    def order_filled(self, order):
+
+        self.orderToFill.append(time.perf_counter_ns() - order.received)
+
+    """
+    Throughput of the replay and the tick-to-order latency percentiles
+    (in microseconds). The latency is measured from the last tick sent
+    for the symbol to the arrival of the order, so it is exact when the
+    rate is low enough that no tick is sent while an order is on its way
+    """
+    def stats(self):
+
+        end = self.replayEnd or time.perf_counter_ns()
+        elapsed = (end - self.replayStart) / 1e9 if self.replayStart else 0.0
+
+        result = {"ticks_sent": self.ticksSent,
+                  "orders_received": self.ordersReceived,
+                  "elapsed_s": elapsed,
+                  "ticks_per_s": self.ticksSent / elapsed if elapsed else 0.0}
+
+        for name, samples in (("tick_to_order_us", self.tickToOrder),
+                              ("order_to_fill_us", self.orderToFill)):
+
+            if samples:
+                us = np.asarray(samples) / 1e3
+                result[name] = {"p50": float(np.percentile(us, 50)),
+                                "p99": float(np.percentile(us, 99)),
+                                "max": float(us.max())}
+
+        return result
+
+
+"""
+Starts a FakeTWS on a free port and runs a TradingApp against it until
+every tick has been replayed. Returns (app, server stats)
+"""
+def drive(prices, long_window = 10, short_window = 3, quantity = 100, rate = None,
+          fill_delay = 0.0, timeout = 600, coalesce = None):
+
+    from ibapi.contract import Contract
+    from IBTradingApp import TradingApp
+
+    server = FakeTWS(prices, port = 0, rate = rate, fill_delay = fill_delay).start()
+
+    contract = Contract()
+    contract.symbol = "FAKE"
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+
+    app = TradingApp(contract, long_window, short_window, quantity, spill_dir = None,
+                     coalesce = coalesce)
+    app.connect(server.host, server.port, clientId = 0)
+
+    reader = threading.Thread(target = app.run, daemon = True)
+    reader.start()
+
+    app.reqMarketDataType(3)
+    app.subscribe()
+    app.reqPositions()
+
+    server.done.wait(timeout)
+
+    #Let the client work through what is still queued
+    while app.msg_queue.qsize() > 0:
+        time.sleep(0.01)
+    time.sleep(0.1 + fill_delay)
+
+    app.disconnect()
+    server.stop()
+
+    return app, server.stats()
+
+
+def main(argv = None):
+
+    from backtest import load_prices
+
+    parser = argparse.ArgumentParser(description = "Replay recorded ticks as a fake TWS")
+    parser.add_argument("path", help = "tick or bar file (.csv, .npy or .bin)")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 7497)
+    parser.add_argument("--rate", type = float, default = None,
+                        help = "ticks per second, as fast as possible when left out")
+    parser.add_argument("--fill-delay", type = float, default = 0.0,
+                        help = "seconds between receiving an order and filling it")
+    parser.add_argument("--drive", action = "store_true",
+                        help = "run a TradingApp against the server and print the measurements")
+    parser.add_argument("--long", type = int, default = 10, help = "long window for --drive")
+    parser.add_argument("--short", type = int, default = 3, help = "short window for --drive")
+    parser.add_argument("--coalesce", choices = ["latest", "batch"], default = None,
+                        help = "tick coalescing mode of the TradingApp for --drive")
+    args = parser.parse_args(argv)
+
+    times, prices = load_prices(args.path)
+
+    if args.drive:
+
+        app, stats = drive(prices, args.long, args.short, rate = args.rate,
+                           fill_delay = args.fill_delay, coalesce = args.coalesce)
+
+        for name, value in stats.items():
+            print("%-18s %s" % (name, value))
+
+        print("%-18s %s" % ("trades", len(app.tradeDist)))
+        print("%-18s %s" % ("pnl", {name: round(getattr(app.risk, name), 2) for name in
+                                    ("realized", "unrealized", "pnl")}))
+        print("%-18s %s" % ("client", {name: app.latency.counters[name] for name in
+                                       ("ticks", "merged", "flushes", "max_queued")}))
+        return 0
+
+    server = FakeTWS(prices, host = args.host, port = args.port, rate = args.rate,
+                     fill_delay = args.fill_delay).start()
+
+    print("Fake TWS listening on %s:%d" % (server.host, server.port))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
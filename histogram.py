@@ -0,0 +1,144 @@
+import numpy as np
+
+"""
+ProfitHistogram draws the distribution of trade profits on the canvas of
+an MplWidget without redrawing the figure every second
+
+The bin counts are kept up to date as trades close: only profits that are
+new (or that changed, a partial fill moves the profit of its trade) are
+added to their bins. The bins only change when a profit falls outside of
+them, then they are recomputed from every profit with the same range the
+GUI always used. The bars are animated artists drawn with blitting, so
+when only the counts change just the bars are repainted over a cached
+background of the axes. A full canvas.draw happens only when the axes
+themselves change (new bins, or a count above the y limit), and nothing
+is drawn at all when no trade closed
+"""
+class ProfitHistogram:
+
+    def __init__(self, canvas, bins = 30):
+
+        self.canvas = canvas
+        self.axes = canvas.axes
+        self.bins = bins
+
+        self.values = np.empty(0, dtype = np.float64)
+        self.counts = np.zeros(bins, dtype = np.int64)
+        self.edges = np.linspace(-10, 10, bins + 1)
+
+        self.background = None
+        self.full = True
+        self.stale = False
+
+        self.axes.set_ylabel("Frequency")
+        self.axes.set_xlabel("Trade Profit ($)")
+        self.bars = self.axes.bar(self.edges[:-1], self.counts, width = np.diff(self.edges),
+                                  align = "edge", animated = True)
+        self.axes.set_xlim(self.edges[0], self.edges[-1])
+        self.axes.set_ylim(0, 1)
+
+        canvas.mpl_connect("draw_event", self._on_draw)
+
+    """
+    Takes the latest tradeDist. Returns True if the histogram changed
+    """
+    def update(self, tradeDist):
+
+        old = self.values
+        n = min(len(old), len(tradeDist))
+
+        if len(tradeDist) == len(old) and np.array_equal(old, tradeDist):
+            return False
+
+        #Profits already counted that changed since, and the new ones
+        changed = np.flatnonzero(old[:n] != tradeDist[:n])
+        added = np.concatenate((np.asarray(tradeDist[changed]), np.asarray(tradeDist[n:])))
+
+        self.values = np.array(tradeDist, dtype = np.float64)
+
+        #The first profits, a ledger that was replaced, or a profit outside
+        #of the bins all need the bins worked out again
+        if (len(old) == 0 or len(tradeDist) < len(old)
+                or (len(added) and (added.min() < self.edges[0] or added.max() > self.edges[-1]))):
+            self._rebin()
+        else:
+            np.subtract.at(self.counts, self._bin(old[changed]), 1)
+            np.add.at(self.counts, self._bin(added), 1)
+
+        self._set_bars()
+
+        return True
+
+    """
+    Repaints whatever changed since the last call
+    """
+    def draw(self):
+
+        if self.full or self.background is None:
+            self.canvas.draw()
+        elif self.stale:
+            self.canvas.restore_region(self.background)
+            self._draw_bars()
+            self.canvas.blit(self.axes.bbox)
+
+        self.full = False
+        self.stale = False
+
+    def _bin(self, values):
+
+        width = (self.edges[-1] - self.edges[0]) / self.bins
+        index = ((np.asarray(values) - self.edges[0]) / width).astype(np.int64)
+
+        return np.clip(index, 0, self.bins - 1)
+
+    def _rebin(self):
+
+        values = self.values
+
+        if len(values) == 0:
+            start, stop = -10, 10
+        else:
+            low, high = values.min(), values.max()
+            start = min(1.5*low, low - 1.5*high)
+            stop = max(1.5*high, high - 1.5*low)
+
+        if stop <= start:
+            start, stop = start - 1, stop + 1
+
+        self.edges = np.linspace(start, stop, self.bins + 1)
+        self.counts = np.bincount(self._bin(values), minlength = self.bins)
+
+        self.axes.set_xlim(start, stop)
+        self.full = True
+
+    def _set_bars(self):
+
+        width = self.edges[1] - self.edges[0]
+
+        for bar, left, count in zip(self.bars, self.edges[:-1], self.counts):
+            bar.set_x(left)
+            bar.set_width(width)
+            bar.set_height(count)
+
+        top = self.counts.max()
+
+        #Headroom above the tallest bar so the axes do not change every time
+        if top > self.axes.get_ylim()[1]:
+            self.axes.set_ylim(0, int(top * 1.25) + 1)
+            self.full = True
+
+        self.stale = True
+
+    def _draw_bars(self):
+
+        for bar in self.bars:
+            self.axes.draw_artist(bar)
+
+    """
+    After every full draw (including resizes) the axes without the bars
+    are cached as the background, then the bars are drawn on top
+    """
+    def _on_draw(self, event):
+
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self._draw_bars()
@@ -0,0 +1,253 @@
+import math
+
+"""
+Rolling window indicators used by the Trading Application
+
+Each indicator keeps the values inside of its window in a preallocated
+ring buffer along with running sums, so that a new price is folded in
+with O(1) work no matter how large the window is. This replaces
+slicing the whole price list and summing it on every tick
+
+The running sums use compensated (Neumaier) summation so that adding
+and removing prices for an entire session does not let floating point
+error build up and flip a crossover decision
+
+update(price, size) takes the size traded at the price, which only the
+VWAP uses. TWS sends the size of a trade right after its price, so
+resize(size) sets the size of the last price folded in once it comes
+and returns True if that changed the value
+"""
+
+
+"""
+Two averages closer than this (relative to the long average) are treated
+as equal by the crossover strategy. Averages that are mathematically equal
+can come out a few ulps apart depending on how they were summed, this keeps
+the live strategy and the vectorized backtest making the same decisions
+"""
+TIE_TOLERANCE = 1e-9
+
+
+"""
+RollingSMA: Simple Moving Average over the last "window" prices
+
+"value" holds the current average and "ready" is True once the window
+has been filled, which matches the old len(prices) >= window check
+"""
+class RollingSMA:
+
+    def __init__(self, window):
+
+        if window < 1:
+            raise ValueError("window must be at least 1, got %r" % (window,))
+
+        self.window = window
+
+        #Ring buffer of the prices currently inside of the window
+        self.buffer = [0.0] * window
+        self.index = 0
+        self.count = 0
+
+        #Running sum and its compensation term
+        self.total = 0.0
+        self.comp = 0.0
+
+        self.value = float("nan")
+        self.ready = False
+
+    def _add(self, x):
+
+        t = self.total + x
+
+        if abs(self.total) >= abs(x):
+            self.comp += (self.total - t) + x
+        else:
+            self.comp += (x - t) + self.total
+
+        self.total = t
+
+    def update(self, price, size = 1.0):
+
+        i = self.index
+
+        if self.ready:
+            self._add(-self.buffer[i])
+        else:
+            self.count += 1
+            self.ready = self.count == self.window
+
+        self.buffer[i] = price
+        self._add(price)
+
+        i += 1
+        self.index = 0 if i == self.window else i
+
+        self.value = (self.total + self.comp) / self.count
+
+        return self.value
+
+    def resize(self, size):
+
+        return False
+
+    """
+    Replaces the value added last, the window does not move
+    """
+    def _replace(self, x):
+
+        i = (self.index - 1) % self.window
+
+        self._add(x - self.buffer[i])
+        self.buffer[i] = x
+
+        self.value = (self.total + self.comp) / self.count
+
+
+"""
+RollingEMA: Exponential Moving Average with a span of "window" prices
+
+The average is seeded with the simple average of the first "window"
+prices and is only "ready" after that, so it needs the same amount of
+data as the SMA before the strategy starts trading on it
+"""
+class RollingEMA:
+
+    def __init__(self, window):
+
+        if window < 1:
+            raise ValueError("window must be at least 1, got %r" % (window,))
+
+        self.window = window
+        self.alpha = 2.0 / (window + 1)
+        self.count = 0
+        self.total = 0.0
+
+        self.value = float("nan")
+        self.ready = False
+
+    def update(self, price, size = 1.0):
+
+        if self.ready:
+            self.value += self.alpha * (price - self.value)
+        else:
+            self.count += 1
+            self.total += price
+            self.value = self.total / self.count
+            self.ready = self.count == self.window
+
+        return self.value
+
+    def resize(self, size):
+
+        return False
+
+
+"""
+RollingVWAP: Volume Weighted Average Price over the last "window" ticks
+
+Keeps ring buffers of price*size and size with running sums of each.
+While no volume at all was traded in the window (ticks stored without a
+size, history without volume) the value is the simple average of the
+prices instead, so it never divides by zero
+"""
+class RollingVWAP:
+
+    def __init__(self, window):
+
+        if window < 1:
+            raise ValueError("window must be at least 1, got %r" % (window,))
+
+        self.window = window
+        self.notional = RollingSMA(window)
+        self.volume = RollingSMA(window)
+        self.prices = RollingSMA(window)
+        self.last = 0.0
+
+        self.value = float("nan")
+        self.ready = False
+
+    def update(self, price, size = 1.0):
+
+        self.notional.update(price * size)
+        self.volume.update(size)
+        self.prices.update(price)
+        self.last = price
+        self.ready = self.volume.ready
+
+        return self._value()
+
+    def resize(self, size):
+
+        if self.volume.count == 0:
+            return False
+
+        self.notional._replace(self.last * size)
+        self.volume._replace(size)
+
+        old = self.value
+        self._value()
+
+        return self.value != old
+
+    def _value(self):
+
+        volume = self.volume.total + self.volume.comp
+
+        if volume > 0:
+            self.value = (self.notional.total + self.notional.comp) / volume
+        else:
+            self.value = self.prices.value
+
+        return self.value
+
+
+"""
+RunningVolatility: standard deviation of the log returns of every price
+seen so far, updated with Welford's algorithm
+
+Gives the same result as np.std(np.log(prices[1:]/prices[:-1])) over the
+whole session without keeping the prices or summing them again
+"""
+class RunningVolatility:
+
+    def __init__(self):
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last = None
+
+    @property
+    def value(self):
+
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def update(self, price, size = 1.0):
+
+        if self.last is not None and self.last > 0 and price > 0:
+
+            r = math.log(price / self.last)
+            self.count += 1
+            delta = r - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (r - self.mean)
+
+        self.last = price
+
+        return self.value
+
+
+INDICATORS = {"SMA": RollingSMA, "EMA": RollingEMA, "VWAP": RollingVWAP}
+
+"""
+Build one of the indicators above from its name ("SMA", "EMA" or "VWAP")
+"""
+def make_indicator(kind, window):
+
+    try:
+        indicator = INDICATORS[kind.upper()]
+    except KeyError:
+        raise ValueError("unknown indicator %r, expected one of %s"
+                         % (kind, ", ".join(INDICATORS))) from None
+
+    return indicator(window)
@@ -0,0 +1,194 @@
+from tickstore import TickStore
+from tradeledger import TradeLedger
+from indicators import make_indicator
+
+"""
+Instrument holds everything the Trading Application keeps for one
+contract: its strategy parameters, tick store, moving averages, trade
+ledger, and the state of its position and current order
+
+TradingApp keeps one Instrument per subscribed contract and routes every
+callback to the right one by reqId, orderId or symbol
+"""
+class Instrument:
+
+    def __init__(self, contract, long_window, short_window, quantity, ma_type = "SMA",
+                 tick_retention = 100000, spill_path = None):
+
+        #Store the contract details of what is being traded. reqId is
+        #given by TradingApp.add_instrument
+        self.contract = contract
+        self.reqId = None
+
+        #Fixed size store of the latest ticks, older ticks are spilled
+        #to spill_path. self.prices and self.times are views into it,
+        #which a spill moves other ticks under
+        self.ticks = TickStore(tick_retention, spill_path)
+
+        #Decides the position to hold, set by TradingApp.add_instrument
+        #(see strategies.py). Every stored price is passed to it
+        self.strategy = None
+
+        #Setting a window builds a rolling indicator (SMA, EMA or VWAP)
+        #that is updated in O(1) on every tick, see indicators.py
+        self._ma_type = ma_type
+        self.long_window = long_window
+        self.short_window = short_window
+        self.quantity = quantity
+
+        #Buys, sells and profit per trade
+        self.ledger = TradeLedger()
+
+        #pos and noOpenOrders will both serve as a logical que
+        #orders can only be placed if noOpenOrders is True
+        self.pos = False
+        self.noOpenOrders = True
+
+        #Stores the current order ID, status, and type
+        self.currentOrderStatus = ""
+        self.currentOrderType = ""
+        self.currentOrderId = int
+
+        #Builds bars out of the ticks when TradingApp is set to trade on
+        #bars, then only the bar closes are added (see bars.py)
+        self.bars = None
+
+        #While history is being loaded (see warmstart.py) live ticks (and
+        #trade sizes, as (None, size)) are held in pending and added after
+        #it, so they stay in time order
+        self.warming = False
+        self.pending = []
+
+    """
+    Views of the prices and times of the ticks held in memory
+    """
+    @property
+    def prices(self):
+
+        return self.ticks.prices
+
+    @property
+    def times(self):
+
+        return self.ticks.times
+
+    """
+    Views of the executed buys and sells ([price, orderId] by order)
+    and the profit of every closed trade, kept by self.ledger
+    """
+    @property
+    def long_trades(self):
+
+        return self.ledger.long_trades
+
+    @property
+    def short_trades(self):
+
+        return self.ledger.short_trades
+
+    @property
+    def tradeDist(self):
+
+        return self.ledger.trade_dist
+
+    """
+    The windows and the kind of average are properties so that changing
+    one (the GUI does this while running) rebuilds the indicators from
+    the stored prices
+    """
+    @property
+    def ma_type(self):
+
+        return self._ma_type
+
+    @ma_type.setter
+    def ma_type(self, ma_type):
+
+        self._ma_type = ma_type
+        self.long_ma = self._build_indicator(self.long_window)
+        self.short_ma = self._build_indicator(self.short_window)
+        self._reset_strategy()
+
+    @property
+    def long_window(self):
+
+        return self._long_window
+
+    @long_window.setter
+    def long_window(self, window):
+
+        self._long_window = window
+        self.long_ma = self._build_indicator(window)
+        self._reset_strategy()
+
+    @property
+    def short_window(self):
+
+        return self._short_window
+
+    @short_window.setter
+    def short_window(self, window):
+
+        self._short_window = window
+        self.short_ma = self._build_indicator(window)
+        self._reset_strategy()
+
+    def _build_indicator(self, window):
+
+        indicator = make_indicator(self.ma_type, window)
+
+        for price, size in zip(self.prices.tolist(), self.ticks.sizes.tolist()):
+            indicator.update(price, size)
+
+        return indicator
+
+    def _reset_strategy(self):
+
+        if self.strategy is not None:
+            self.strategy.reset()
+
+    """
+    Adds a block of historical prices in front of the live ones and
+    folds them into the moving averages
+    """
+    def seed(self, times, prices, sizes = None):
+
+        if sizes is None:
+            sizes = [0.0] * len(prices)
+
+        for t, price, size in zip(times, prices, sizes):
+            self.ticks.append(t, price, size)
+            self.long_ma.update(price, size)
+            self.short_ma.update(price, size)
+
+            if self.strategy is not None:
+                self.strategy.update(price)
+
+    """
+    Stores a last price tick (or the close of a bar and its volume) and
+    folds it into the moving averages
+    """
+    def add_tick(self, t, price, size = 0.0):
+
+        self.ticks.append(t, price, size)
+        self.long_ma.update(price, size)
+        self.short_ma.update(price, size)
+
+        if self.strategy is not None:
+            self.strategy.update(price)
+
+    """
+    Sets the size of the last tick, which TWS sends right after its
+    price. Returns True if that moved a moving average (a VWAP)
+    """
+    def add_size(self, size):
+
+        if self.ticks.count == 0:
+            return False
+
+        self.ticks.size[self.ticks.count - 1] = size
+
+        long_changed = self.long_ma.resize(size)
+        short_changed = self.short_ma.resize(size)
+
+        return long_changed or short_changed
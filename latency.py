@@ -0,0 +1,256 @@
+import json
+import time
+
+"""
+Low overhead latency instrumentation for the Trading Application
+
+Timestamps are taken with time.perf_counter_ns (monotonic, nanoseconds)
+at each stage an order goes through:
+
+    tick        tickPrice received
+    decision    run_strategy finished with the tick
+    submit      placeOrder called
+    ack         first openOrder for the order
+    fill        first execDetails (or Filled orderStatus) for the order
+
+and the time between stages is recorded into HDR style histograms. A
+record is a few integer operations and a list increment, so it can stay
+on in the callback thread
+"""
+
+
+"""
+LatencyHistogram: log-linear histogram of nanosecond values
+
+Values below 2**sub_bits get their own bucket. Above that every power of
+two is split into 2**(sub_bits-1) buckets, which keeps the relative error
+of a reported value under 1/2**(sub_bits-1) (under 1.6% with the default
+of 7) whatever the magnitude, like HdrHistogram does
+"""
+class LatencyHistogram:
+
+    def __init__(self, sub_bits = 7, max_bits = 40):
+
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.half = self.sub_count >> 1
+        self.max_value = (1 << max_bits) - 1
+
+        self.counts = [0] * self._index(self.max_value) + [0]
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+
+        if value < self.sub_count:
+            return value
+
+        shift = value.bit_length() - self.sub_bits
+
+        return self.sub_count + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def _lower_bound(self, index):
+
+        if index < self.sub_count:
+            return index
+
+        shift = (index - self.sub_count) // self.half + 1
+        top = (index - self.sub_count) % self.half + self.half
+
+        return top << shift
+
+    def record(self, value):
+
+        if value < 0:
+            value = 0
+        elif value > self.max_value:
+            value = self.max_value
+
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    """
+    Value at the given percentile (0-100), reported as the lower bound of
+    the bucket it falls in
+    """
+    def percentile(self, p):
+
+        return self.percentiles(p)[0]
+
+    """
+    Values at several percentiles, found in one pass over the buckets
+    (summary is taken with every published snapshot)
+    """
+    def percentiles(self, *ps):
+
+        if self.count == 0:
+            return [0] * len(ps)
+
+        targets = sorted((max(1, int(round(self.count * p / 100.0))), i) for i, p in enumerate(ps))
+        values = [self.max] * len(ps)
+        seen = 0
+        k = 0
+
+        for index, n in enumerate(self.counts):
+
+            if not n:
+                continue
+
+            seen += n
+
+            while k < len(targets) and seen >= targets[k][0]:
+                values[targets[k][1]] = self._lower_bound(index)
+                k += 1
+
+            if k == len(targets):
+                break
+
+        return values
+
+    def summary(self):
+
+        if self.count == 0:
+            return {"count": 0}
+
+        p50, p90, p99, p999 = self.percentiles(50, 90, 99, 99.9)
+
+        return {"count": self.count,
+                "mean_ns": self.total / self.count,
+                "min_ns": self.min,
+                "p50_ns": p50,
+                "p90_ns": p90,
+                "p99_ns": p99,
+                "p999_ns": p999,
+                "max_ns": self.max}
+
+
+"""
+LatencyMonitor keeps the stage histograms and counters of one TradingApp
+
+Order stamps are kept in a dictionary keyed by orderId and removed once
+the order is filled, cancelled or rejected, so it does not grow over a
+session
+"""
+class LatencyMonitor:
+
+    STAGES = ("tick_to_decision", "tick_to_submit", "submit_to_ack", "submit_to_fill")
+
+    def __init__(self):
+
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.counters = {"ticks": 0, "orders": 0, "acks": 0, "fills": 0,
+                         "cancelled": 0, "dropped": 0, "merged": 0, "flushes": 0,
+                         "queued": 0, "max_queued": 0}
+
+        self.started = time.perf_counter_ns()
+        self.lastTick = 0
+        self.pending = {}
+        self.acked = set()
+
+    """
+    Called when a tick arrives, "queued" is the number of messages still
+    waiting behind it in the client's message queue
+    """
+    def tick(self, now, queued = 0):
+
+        self.lastTick = now
+        counters = self.counters
+        counters["ticks"] += 1
+        counters["queued"] = queued
+
+        if queued > counters["max_queued"]:
+            counters["max_queued"] = queued
+
+    def decision(self, now):
+
+        self.histograms["tick_to_decision"].record(now - self.lastTick)
+
+    def submitted(self, orderId, now):
+
+        self.counters["orders"] += 1
+        self.pending[orderId] = now
+        self.histograms["tick_to_submit"].record(now - self.lastTick)
+
+    def ack(self, orderId, now):
+
+        submitted = self.pending.get(orderId)
+
+        if submitted is not None and orderId not in self.acked:
+            self.acked.add(orderId)
+            self.counters["acks"] += 1
+            self.histograms["submit_to_ack"].record(now - submitted)
+
+    def fill(self, orderId, now):
+
+        submitted = self.pending.pop(orderId, None)
+
+        if submitted is not None:
+            self.acked.discard(orderId)
+            self.counters["fills"] += 1
+            self.histograms["submit_to_fill"].record(now - submitted)
+
+    """
+    An order that ended without a fill (cancelled, or rejected by TWS)
+    """
+    def closed(self, orderId):
+
+        if self.pending.pop(orderId, None) is not None:
+            self.acked.discard(orderId)
+            self.counters["cancelled"] += 1
+
+    def dropped(self):
+
+        self.counters["dropped"] += 1
+
+    """
+    Tick coalescing: a tick folded into one already waiting for the
+    strategy, and a batch of waiting ticks handed to the strategy
+    """
+    def merged(self):
+
+        self.counters["merged"] += 1
+
+    def flushed(self):
+
+        self.counters["flushes"] += 1
+
+    """
+    Counters, rates per second since the monitor was created and a
+    summary of every histogram
+    """
+    def snapshot(self):
+
+        elapsed = (time.perf_counter_ns() - self.started) / 1e9
+
+        result = dict(self.counters)
+        result["uptime_s"] = elapsed
+        result["ticks_per_s"] = self.counters["ticks"] / elapsed if elapsed else 0.0
+        result["orders_per_s"] = self.counters["orders"] / elapsed if elapsed else 0.0
+        result["open_orders"] = len(self.pending)
+        result["latency"] = {stage: h.summary() for stage, h in self.histograms.items()}
+
+        return result
+
+    """
+    Writes the snapshot, plus the raw bucket counts when buckets is
+    True, to a json file
+    """
+    def dump(self, path, buckets = False):
+
+        result = self.snapshot()
+
+        if buckets:
+            result["buckets"] = {stage: {str(h._lower_bound(i)): n
+                                         for i, n in enumerate(h.counts) if n}
+                                 for stage, h in self.histograms.items()}
+
+        with open(path, "w") as f:
+            json.dump(result, f, indent = 2)
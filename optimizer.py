@@ -0,0 +1,174 @@
+import argparse
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest import load_prices, run_vectorized
+
+"""
+Parameter sweep for the strategies in strategies.py, the Moving Average
+Crossover Strategy by default
+
+Every (long_window, short_window, quantity) combination is backtested
+with backtest.run_vectorized on a process pool. The price array is
+copied once into shared memory and every worker maps it from there, so
+it is never pickled to the workers. The quantity only scales the profit,
+so each (long, short) pair is backtested once for all quantities
+
+The result is a table ranked by total profit with the same statistics
+TradingGUI.updateStats shows (total, average, std, max and min profit)
+"""
+
+RESULT_DTYPE = np.dtype([("long", "i8"), ("short", "i8"), ("quantity", "i8"),
+                         ("trades", "i8"), ("total", "f8"), ("avg", "f8"),
+                         ("std", "f8"), ("max", "f8"), ("min", "f8")])
+
+#Set in every worker by _attach
+_prices = None
+_shm = None
+_strategy = "crossover"
+
+
+def _attach(name, length, strategy = "crossover"):
+
+    global _prices, _shm, _strategy
+
+    _shm = shared_memory.SharedMemory(name = name)
+    _prices = np.ndarray((length,), dtype = np.float64, buffer = _shm.buf)
+    _strategy = strategy
+
+
+def _evaluate(task):
+
+    long_window, short_window, quantities = task
+    stats = run_vectorized(_prices, long_window, short_window, strategy = _strategy).stats()
+
+    rows = []
+
+    for quantity in quantities:
+        rows.append((long_window, short_window, quantity, stats["trades"],
+                     stats["total"] * quantity, stats["avg"] * quantity,
+                     stats["std"] * quantity, stats["max"] * quantity,
+                     stats["min"] * quantity))
+
+    return rows
+
+
+"""
+Grid of every combination with the short window below the long window
+"""
+def grid(longs, shorts, quantities):
+
+    return [(l, s, q) for l, s, q in itertools.product(longs, shorts, quantities) if s < l]
+
+
+"""
+n combinations drawn at random (without repeats) from the same grid
+"""
+def random_sample(longs, shorts, quantities, n, seed = None):
+
+    combos = grid(longs, shorts, quantities)
+
+    return random.Random(seed).sample(combos, min(n, len(combos)))
+
+
+"""
+Backtests every (long, short, quantity) combination over the prices on
+"processes" worker processes (all cores by default)
+
+Returns a RESULT_DTYPE array sorted by total profit, best first
+"""
+def optimize(prices, combos, processes = None, strategy = "crossover"):
+
+    prices = np.ascontiguousarray(prices, dtype = np.float64)
+
+    #One task per window pair, carrying all the quantities for that pair
+    tasks = {}
+    for long_window, short_window, quantity in combos:
+        tasks.setdefault((long_window, short_window), []).append(quantity)
+    tasks = [(l, s, q) for (l, s), q in tasks.items()]
+
+    shm = shared_memory.SharedMemory(create = True, size = max(prices.nbytes, 1))
+
+    try:
+
+        np.ndarray(prices.shape, dtype = np.float64, buffer = shm.buf)[:] = prices
+
+        processes = processes or os.cpu_count()
+        chunksize = max(1, len(tasks) // (4 * processes))
+
+        with ProcessPoolExecutor(processes, initializer = _attach,
+                                 initargs = (shm.name, len(prices), strategy)) as pool:
+
+            rows = [row for result in pool.map(_evaluate, tasks, chunksize = chunksize)
+                    for row in result]
+
+    finally:
+
+        shm.close()
+        shm.unlink()
+
+    table = np.array(rows, dtype = RESULT_DTYPE)
+
+    return table[np.argsort(-table["total"], kind = "stable")]
+
+
+"""
+Parses "start:stop:step" (stop included) or a comma separated list
+"""
+def parse_range(text):
+
+    if ":" in text:
+        parts = [int(p) for p in text.split(":")]
+        step = parts[2] if len(parts) > 2 else 1
+        return list(range(parts[0], parts[1] + 1, step))
+
+    return [int(p) for p in text.split(",")]
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Optimize the windows of a trading strategy")
+    parser.add_argument("path", help = "historical tick or bar file (.csv, .npy or .bin)")
+    parser.add_argument("--long", default = "5:100:5", help = "long windows, start:stop:step or a,b,c")
+    parser.add_argument("--short", default = "2:30:1", help = "short windows, start:stop:step or a,b,c")
+    parser.add_argument("--quantity", default = "100", help = "trade sizes, start:stop:step or a,b,c")
+    parser.add_argument("--strategy", default = "crossover",
+                        help = "crossover, breakout or meanreversion")
+    parser.add_argument("--random", type = int, default = 0,
+                        help = "evaluate this many random combinations instead of the full grid")
+    parser.add_argument("--seed", type = int, default = None, help = "seed for --random")
+    parser.add_argument("--processes", type = int, default = None, help = "worker processes")
+    parser.add_argument("--top", type = int, default = 20, help = "rows to print")
+    parser.add_argument("--out", default = None, help = "write the full table to this csv file")
+    args = parser.parse_args(argv)
+
+    times, prices = load_prices(args.path)
+    longs, shorts, quantities = (parse_range(args.long), parse_range(args.short),
+                                 parse_range(args.quantity))
+
+    if args.random:
+        combos = random_sample(longs, shorts, quantities, args.random, args.seed)
+    else:
+        combos = grid(longs, shorts, quantities)
+
+    table = optimize(prices, combos, args.processes, args.strategy)
+
+    print("%6s %6s %8s %7s %12s %10s %10s %10s %10s" % RESULT_DTYPE.names)
+
+    for row in table[:args.top]:
+        print("%6d %6d %8d %7d %12.2f %10.4f %10.4f %10.4f %10.4f" % tuple(row))
+
+    if args.out:
+        np.savetxt(args.out, table, delimiter = ",", header = ",".join(RESULT_DTYPE.names),
+                   comments = "", fmt = ["%d"] * 4 + ["%.6f"] * 5)
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
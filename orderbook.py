@@ -0,0 +1,330 @@
+import time
+from collections import deque
+
+"""
+Order management for the Trading Application
+
+OrderBook keeps the orders of the session in a dictionary keyed by
+orderId, so each orderStatus, openOrder and execDetails callback finds
+its order in O(1). Each order moves through a small state machine:
+
+    Queued      waiting for the rate limit, not sent yet
+    Sent        placeOrder was called
+    Working     TWS acknowledged it (openOrder or a Submitted status)
+    PartiallyFilled
+    Filled      terminal
+    Cancelled   terminal, also for Inactive or orders cancelled while Queued
+
+Updates only ever move an order forward, so a late or repeated status
+(TWS sends several) cannot undo a fill. Executions are added up per
+order (de-duplicated by execId) with their average price, and the filled
+and still open quantity of every symbol is kept up to date as they come
+in, so the exposure of a symbol is a dictionary lookup
+
+TWS can report a fill in orderStatus (or in the position) before its
+execution arrives. The shares reported filled but not executed yet are
+kept per symbol too, a symbol is "settled" when it has none of those and
+no open order, so every share TWS counts has been seen as an execution
+
+An order is dropped from the book once it is done and all of its shares
+have come as executions, after that nothing can change it. The filled
+and open totals per symbol stay, so a long session does not hold on to
+every order it ever placed. Callbacks that still come for a dropped
+order (a repeated status, executions requested again) are ignored
+
+Orders are sent through a token bucket so that no more than "rate"
+orders a second go out (TWS rejects clients above 50 messages a second).
+Orders over the limit are queued and sent in batches by pump, which
+TradingApp calls from its message loop. A queued order can still be
+cancelled before it goes out (cancel_queued)
+"""
+
+QUEUED = "Queued"
+SENT = "Sent"
+WORKING = "Working"
+PARTIAL = "PartiallyFilled"
+FILLED = "Filled"
+CANCELLED = "Cancelled"
+
+_RANK = {QUEUED: 0, SENT: 1, WORKING: 2, PARTIAL: 3, FILLED: 4, CANCELLED: 4}
+_TERMINAL = (FILLED, CANCELLED)
+
+#TWS order statuses and the state they move an order to
+_TWS_STATUS = {"ApiPending": SENT, "PendingSubmit": SENT, "PreSubmitted": WORKING,
+               "Submitted": WORKING, "PendingCancel": WORKING, "Filled": FILLED,
+               "Cancelled": CANCELLED, "ApiCancelled": CANCELLED, "Inactive": CANCELLED}
+
+
+"""
+TokenBucket: allows "rate" events a second on average with bursts of up
+to "burst" events
+"""
+class TokenBucket:
+
+    def __init__(self, rate, burst = None):
+
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def take(self):
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+
+        return False
+
+
+"""
+State of one order
+"""
+class OrderState:
+
+    def __init__(self, orderId, contract, order):
+
+        self.orderId = orderId
+        self.contract = contract
+        self.order = order
+        self.symbol = contract.symbol
+        self.action = order.action
+        self.quantity = float(order.totalQuantity)
+        self.sign = 1 if order.action == "BUY" else -1
+
+        self.status = QUEUED
+        self.twsStatus = ""
+        self.filled = 0.0
+        self.avgFillPrice = 0.0
+        self.execIds = set()
+        self.created = time.monotonic()
+
+        #Shares TWS reported filled that no execution has come for yet
+        self.unexecuted = 0.0
+
+    @property
+    def remaining(self):
+
+        return max(self.quantity - self.filled, 0.0)
+
+    @property
+    def done(self):
+
+        return self.status in _TERMINAL
+
+
+class OrderBook:
+
+    def __init__(self, send, rate = 45, burst = None):
+
+        #send(orderId, contract, order) places the order with TWS
+        self.send = send
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+        self.orders = {}
+        self.queue = deque()
+
+        #Signed shares per symbol: filled this session, and still open
+        self.filled = {}
+        self.working = {}
+        self.openCount = {}
+        self.unexecuted = {}
+
+        self.counters = {"submitted": 0, "sent": 0, "throttled": 0, "max_queued": 0,
+                         "filled": 0, "cancelled": 0}
+
+    def get(self, orderId):
+
+        return self.orders.get(orderId)
+
+    """
+    Net shares filled for the symbol this session, plus the shares of
+    its open orders when include_open is True
+    """
+    def exposure(self, symbol, include_open = False):
+
+        exposure = self.filled.get(symbol, 0.0)
+
+        if include_open:
+            exposure += self.working.get(symbol, 0.0)
+
+        return exposure
+
+    def open_orders(self, symbol):
+
+        return self.openCount.get(symbol, 0)
+
+    """
+    True when the symbol has no open order and every share TWS reported
+    filled has come as an execution
+    """
+    def settled(self, symbol):
+
+        return self.openCount.get(symbol, 0) == 0 and self.unexecuted.get(symbol, 0.0) == 0
+
+    """
+    Adds an order and sends it, or queues it if the rate limit is reached
+    """
+    def submit(self, orderId, contract, order):
+
+        state = OrderState(orderId, contract, order)
+
+        self.orders[orderId] = state
+        self.working[state.symbol] = self.working.get(state.symbol, 0.0) + state.sign * state.quantity
+        self.openCount[state.symbol] = self.openCount.get(state.symbol, 0) + 1
+        self.counters["submitted"] += 1
+
+        self.queue.append(state)
+        self.pump()
+
+        if state.status == QUEUED:
+            self.counters["throttled"] += 1
+
+        if len(self.queue) > self.counters["max_queued"]:
+            self.counters["max_queued"] = len(self.queue)
+
+        return state
+
+    """
+    Sends as many queued orders as the rate limit allows. Returns True if
+    the queue is empty afterwards
+    """
+    def pump(self):
+
+        queue = self.queue
+
+        while queue:
+
+            state = queue[0]
+
+            if state.status != QUEUED:
+                queue.popleft()
+                continue
+
+            if self.bucket is not None and not self.bucket.take():
+                return False
+
+            queue.popleft()
+            state.status = SENT
+            self.counters["sent"] += 1
+            self.send(state.orderId, state.contract, state.order)
+
+        return True
+
+    """
+    Cancels an order that has not been sent yet and returns it. Returns
+    None if it was already sent, then it has to be cancelled with TWS
+    """
+    def cancel_queued(self, orderId):
+
+        state = self.orders.get(orderId)
+
+        if state is None or state.status != QUEUED:
+            return None
+
+        self._advance(state, CANCELLED)
+        self._retire(state)
+
+        return state
+
+    def on_open(self, orderId):
+
+        state = self.orders.get(orderId)
+
+        if state is not None:
+            self._advance(state, WORKING)
+
+        return state
+
+    def on_status(self, orderId, status, filled, avgFillPrice):
+
+        state = self.orders.get(orderId)
+
+        if state is None:
+            return None
+
+        state.twsStatus = status
+
+        if filled > state.filled and not state.execIds:
+            state.avgFillPrice = avgFillPrice
+
+        self._unexecuted(state, filled)
+
+        target = _TWS_STATUS.get(status)
+
+        if target is not None:
+            self._advance(state, target)
+
+        self._retire(state)
+
+        return state
+
+    """
+    Adds an execution to its order. Returns the order, or None if the
+    order is unknown or the execution was already counted
+    """
+    def on_execution(self, orderId, execId, shares, price):
+
+        state = self.orders.get(orderId)
+
+        if state is None or execId in state.execIds:
+            return None
+
+        state.execIds.add(execId)
+
+        total = state.filled + shares
+        if total > 0:
+            state.avgFillPrice = (state.avgFillPrice * state.filled + price * shares) / total
+        state.filled = total
+
+        signed = state.sign * shares
+        self.filled[state.symbol] = self.filled.get(state.symbol, 0.0) + signed
+
+        self._unexecuted(state, state.filled + state.unexecuted - shares)
+
+        if not state.done:
+            self.working[state.symbol] -= signed
+
+        self._advance(state, FILLED if state.remaining <= 0 else PARTIAL)
+        self._retire(state)
+
+        return state
+
+    """
+    Updates the shares of the order that TWS counts as filled ("filled",
+    which only ever grows) but that have no execution yet
+    """
+    def _unexecuted(self, state, filled):
+
+        unexecuted = max(filled - state.filled, 0.0)
+
+        if unexecuted != state.unexecuted:
+            self.unexecuted[state.symbol] = (self.unexecuted.get(state.symbol, 0.0)
+                                             + unexecuted - state.unexecuted)
+            state.unexecuted = unexecuted
+
+    """
+    Drops the order from the book once nothing can change it any more
+    """
+    def _retire(self, state):
+
+        if state.done and state.unexecuted == 0:
+            self.orders.pop(state.orderId, None)
+
+    def _advance(self, state, status):
+
+        if state.done or _RANK[status] < _RANK[state.status]:
+            return
+
+        state.status = status
+
+        if status in _TERMINAL:
+
+            #Whatever was not filled is no longer open
+            self.working[state.symbol] -= state.sign * state.remaining
+            self.openCount[state.symbol] -= 1
+            self.counters["filled" if status == FILLED else "cancelled"] += 1
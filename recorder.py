@@ -0,0 +1,247 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from tickstore import TICK_DTYPE, append_records
+
+"""
+Recorder: writes every tick and execution of a session to disk so they
+outlive the process
+
+Records are fixed width and appended to one file per symbol and kind:
+
+    <directory>/<symbol>_ticks.bin    TICK_DTYPE (time, price, size)
+    <directory>/<symbol>_execs.bin    EXEC_DTYPE
+
+Times are epoch seconds. A file is just the records one after another,
+so it can be memory mapped with load_ticks / load_executions and every
+field read as a column without parsing or copying. The tick files have
+the same layout as the TickStore spill files and can be passed straight
+to backtest.py and optimizer.py
+
+The callback thread only puts a tuple on a queue. A background thread
+takes everything that is queued, writes it in one block per file and
+fsyncs the files every fsync_interval seconds, so disk writes never hold
+up the callbacks
+
+TWS sends the size of a trade right after its price, so the writer holds
+the last tick of each symbol until its size (or the next tick) comes. A
+file is opened cut back to whole records, so a record torn by a crash
+does not shift the ones appended after it. If the writer fails, flush
+and close raise its error instead of waiting for it
+"""
+
+EXEC_DTYPE = np.dtype([("time", "f8"), ("orderId", "i8"), ("execId", "S32"),
+                       ("side", "S3"), ("price", "f8"), ("shares", "f8")])
+
+_TICKS = "ticks"
+_EXECS = "execs"
+_SIZES = "sizes"
+_DTYPES = {_TICKS: TICK_DTYPE, _EXECS: EXEC_DTYPE}
+
+
+class Recorder:
+
+    def __init__(self, directory, fsync_interval = 1.0):
+
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+
+        self.queue = queue.SimpleQueue()
+        self.files = {}
+        self.written = 0
+        self.nextSync = time.monotonic() + fsync_interval
+
+        #Last tick of each symbol, waiting for its size
+        self.held = {}
+
+        self.thread = None
+        self.error = None
+
+    def path(self, symbol, kind = _TICKS):
+
+        return os.path.join(self.directory, "%s_%s.bin" % (symbol, kind))
+
+    def start(self):
+
+        if self.thread is None:
+            os.makedirs(self.directory, exist_ok = True)
+            self.thread = threading.Thread(target = self._run, name = "Recorder", daemon = True)
+            self.thread.start()
+
+        return self
+
+    """
+    Called from the callback thread, these only queue the record
+    """
+    def tick(self, symbol, t, price, size = 0.0):
+
+        self.queue.put((_TICKS, symbol, (t, price, size)))
+
+    def size(self, symbol, size):
+
+        self.queue.put((_SIZES, symbol, size))
+
+    def execution(self, symbol, t, orderId, execId, side, price, shares):
+
+        self.queue.put((_EXECS, symbol, (t, orderId, execId.encode()[:32], side.encode()[:3],
+                                         price, shares)))
+
+    """
+    Blocks until everything queued so far is written and synced to disk.
+    Raises the error of the writer if it failed, or TimeoutError if it
+    did not get there within "timeout" seconds
+    """
+    def flush(self, timeout = 10.0):
+
+        if self.thread is None:
+            return
+
+        done = threading.Event()
+        self.queue.put(("flush", done, None))
+
+        deadline = time.monotonic() + timeout
+
+        while not done.wait(0.1):
+
+            if not self.thread.is_alive():
+                raise RuntimeError("the recorder stopped writing") from self.error
+
+            if time.monotonic() >= deadline:
+                raise TimeoutError("the recorder did not write within %s seconds" % timeout)
+
+    """
+    Writes what is left and stops the writer thread, raises like flush
+    """
+    def close(self, timeout = 10.0):
+
+        if self.thread is None:
+            return
+
+        self.queue.put(("close", None, None))
+
+        thread, self.thread = self.thread, None
+        thread.join(timeout)
+
+        if thread.is_alive():
+            raise TimeoutError("the recorder did not write within %s seconds" % timeout)
+
+        if self.error is not None:
+            raise RuntimeError("the recorder stopped writing") from self.error
+
+    def _run(self):
+
+        try:
+            self._write()
+        except BaseException as e:
+            self.error = e
+
+    def _write(self):
+
+        while True:
+
+            try:
+                items = [self.queue.get(timeout = self.fsync_interval)]
+            except queue.Empty:
+                items = []
+
+            #Take everything else already waiting
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batches = {}
+            control = []
+
+            for kind, symbol, record in items:
+
+                if kind == _TICKS:
+                    held = self.held.pop(symbol, None)
+                    if held is not None:
+                        batches.setdefault((_TICKS, symbol), []).append(held)
+                    self.held[symbol] = record
+
+                elif kind == _SIZES:
+                    held = self.held.pop(symbol, None)
+                    if held is not None:
+                        batches.setdefault((_TICKS, symbol), []).append(held[:2] + (record,))
+
+                elif kind in _DTYPES:
+                    batches.setdefault((kind, symbol), []).append(record)
+
+                else:
+                    control.append((kind, symbol))
+
+            #Nothing is held back from a flush or close
+            if control:
+                for symbol, held in self.held.items():
+                    batches.setdefault((_TICKS, symbol), []).append(held)
+                self.held = {}
+
+            for (kind, symbol), records in batches.items():
+                self._file(kind, symbol).write(np.array(records, dtype = _DTYPES[kind]).tobytes())
+                self.written += len(records)
+
+            if control or time.monotonic() >= self.nextSync:
+                self._sync()
+
+            for kind, done in control:
+
+                if kind == "flush":
+                    done.set()
+                else:
+                    for f in self.files.values():
+                        f.close()
+                    self.files = {}
+                    return
+
+    def _file(self, kind, symbol):
+
+        f = self.files.get((kind, symbol))
+
+        if f is None:
+            f = append_records(self.path(symbol, kind), _DTYPES[kind])
+            self.files[(kind, symbol)] = f
+
+        return f
+
+    def _sync(self):
+
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.nextSync = time.monotonic() + self.fsync_interval
+
+
+def _load(path, dtype):
+
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    count = size // dtype.itemsize
+
+    if count == 0:
+        return np.empty(0, dtype = dtype)
+
+    #A record cut short by a crash at the end of the file is left out
+    return np.memmap(path, dtype = dtype, mode = "r", shape = (count,))
+
+
+"""
+Memory maps a recorded tick file, fields "time", "price" and "size"
+"""
+def load_ticks(path):
+
+    return _load(path, TICK_DTYPE)
+
+
+"""
+Memory maps a recorded execution file, see EXEC_DTYPE for the fields
+"""
+def load_executions(path):
+
+    return _load(path, EXEC_DTYPE)
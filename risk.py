@@ -0,0 +1,232 @@
+from orderbook import TokenBucket
+
+"""
+Risk and P&L of the Trading Application
+
+RiskBook keeps one Position per symbol: the signed shares held, their
+average cost, the P&L realized by closing shares and the unrealized P&L
+of what is held at the last price. Fills and prices only touch their own
+symbol, and the totals over every symbol are kept as running sums that
+are moved by the change of that one symbol, so both a tick and a fill
+are O(1) however many symbols are traded
+
+Average cost follows the usual rules: adding to a position averages the
+price in, reducing it realizes (price - avgCost) per share closed and
+leaves the average cost alone, and going through flat starts the new
+position at the fill price
+
+Positions are built from fills only. The positions TWS reports are used
+to check them: the first report of a symbol sets the shares held from
+before the session, and a later one that disagrees corrects them (the
+realized P&L is kept, see report). Fills made before the session are
+already part of that first report and must not be passed to fill
+
+check is the pre-trade check in front of every order. An order is
+rejected, with the reason returned, if it would take the shares held
+plus the ones still open above max_position, if the total P&L is down
+max_loss or more and the order does not reduce the position, or if more
+than max_order_rate orders a second were checked. Limits left as None
+are not checked
+"""
+
+MAX_POSITION = "max_position"
+MAX_LOSS = "max_loss"
+ORDER_RATE = "order_rate"
+
+
+class Position:
+
+    def __init__(self, symbol):
+
+        self.symbol = symbol
+        self.shares = 0.0
+        self.avgCost = 0.0
+        self.realized = 0.0
+        self.unrealized = 0.0
+        self.last = None
+
+        #Whether a position from TWS was compared with this one yet
+        self.reported = False
+
+    @property
+    def pnl(self):
+
+        return self.realized + self.unrealized
+
+    def _mark(self):
+
+        if self.last is None or self.shares == 0:
+            self.unrealized = 0.0
+        else:
+            self.unrealized = (self.last - self.avgCost) * self.shares
+
+
+class RiskBook:
+
+    def __init__(self, max_position = None, max_loss = None, max_order_rate = None):
+
+        self.max_position = max_position
+        self.max_loss = max_loss
+        self.bucket = TokenBucket(max_order_rate) if max_order_rate else None
+
+        self.positions = {}
+
+        #Sums over every position, moved by the change of one at a time
+        self.realized = 0.0
+        self.unrealized = 0.0
+
+        self.counters = {"checked": 0, "rejected": 0, MAX_POSITION: 0, MAX_LOSS: 0,
+                         ORDER_RATE: 0, "corrected": 0}
+
+    @property
+    def pnl(self):
+
+        return self.realized + self.unrealized
+
+    def get(self, symbol):
+
+        position = self.positions.get(symbol)
+
+        if position is None:
+            position = self.positions[symbol] = Position(symbol)
+
+        return position
+
+    def shares(self, symbol):
+
+        position = self.positions.get(symbol)
+
+        return position.shares if position is not None else 0.0
+
+    """
+    New last price of the symbol
+    """
+    def mark(self, symbol, price):
+
+        position = self.get(symbol)
+        position.last = price
+
+        if position.shares:
+            self._remark(position)
+
+    """
+    Adds a fill of "shares" shares, positive for a buy and negative for
+    a sell
+    """
+    def fill(self, symbol, shares, price):
+
+        position = self.get(symbol)
+        held = position.shares
+        total = held + shares
+
+        if held == 0 or (held > 0) == (shares > 0):
+
+            #Opening or adding to the position
+            position.avgCost = (position.avgCost * held + price * shares) / total if total else 0.0
+
+        else:
+
+            #Reducing, closing or going through flat
+            closed = min(abs(shares), abs(held))
+            realized = (price - position.avgCost) * closed * (1 if held > 0 else -1)
+
+            position.realized += realized
+            self.realized += realized
+
+            if total == 0:
+                position.avgCost = 0.0
+            elif (total > 0) != (held > 0):
+                position.avgCost = price
+
+        position.shares = total
+
+        if position.last is None:
+            position.last = price
+
+        self._remark(position)
+
+    """
+    Position and average cost as reported by TWS. It is only compared
+    with the fills when "settled", i.e. when every fill TWS counted in it
+    has come through fill and no order of the symbol is open (see
+    OrderBook.settled); a report sent before the execution of its fill
+    is ignored. If the shares differ they are replaced by the reported
+    ones, which is counted as "corrected" unless it is the first report
+    of the symbol. Returns True if the position was changed
+    """
+    def report(self, symbol, shares, avgCost, settled = True):
+
+        if not settled:
+            return False
+
+        position = self.get(symbol)
+        shares = float(shares)
+        first = not position.reported
+        position.reported = True
+
+        if shares == position.shares:
+            return False
+
+        if not first:
+            self.counters["corrected"] += 1
+
+        position.shares = shares
+        position.avgCost = float(avgCost) if shares else 0.0
+
+        self._remark(position)
+
+        return True
+
+    def _remark(self, position):
+
+        old = position.unrealized
+        position._mark()
+        self.unrealized += position.unrealized - old
+
+    """
+    Pre-trade check of an order for "shares" shares (negative to sell) of
+    the symbol, with "working" shares of the symbol already in open
+    orders. Returns None if the order may be placed, otherwise the limit
+    it breaks
+    """
+    def check(self, symbol, shares, working = 0.0):
+
+        self.counters["checked"] += 1
+
+        held = self.shares(symbol)
+        after = held + working + shares
+
+        #An order that reduces the position is never held back by these
+        reduces = abs(after) < abs(held + working)
+
+        if self.max_position is not None and abs(after) > self.max_position and not reduces:
+            return self._reject(MAX_POSITION)
+
+        if self.max_loss is not None and self.pnl <= -self.max_loss and not reduces:
+            return self._reject(MAX_LOSS)
+
+        if self.bucket is not None and not self.bucket.take():
+            return self._reject(ORDER_RATE)
+
+        return None
+
+    def _reject(self, reason):
+
+        self.counters["rejected"] += 1
+        self.counters[reason] += 1
+
+        return reason
+
+    """
+    P&L of every symbol and the totals, as plain dictionaries
+    """
+    def summary(self):
+
+        return {"realized": self.realized,
+                "unrealized": self.unrealized,
+                "pnl": self.pnl,
+                "positions": {symbol: {"shares": p.shares, "avgCost": p.avgCost,
+                                       "last": p.last, "realized": p.realized,
+                                       "unrealized": p.unrealized}
+                              for symbol, p in self.positions.items()},
+                "counters": dict(self.counters)}
@@ -0,0 +1,616 @@
+import argparse
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ibapi.contract import Contract
+
+from IBTradingApp import TradingApp
+from indicators import INDICATORS
+from instrument import Instrument
+from strategies import Strategy, make_strategy
+
+"""
+Strategies sharded over worker processes
+
+The callbacks of TradingApp all run on one thread under one GIL, so the
+strategy CPU of every symbol adds up on one core. GatewayApp keeps the
+one connection to TWS, the tick stores, order book and risk book, and
+hands the strategy work to "workers" processes instead:
+
+    gateway     decodes every message. A last price tick (or bar close)
+                is stored in the tick store as it is, without updating
+                any average or strategy, and written to the TickRing of
+                the worker that owns the symbol (symbols are dealt out
+                round robin). So are the trade sizes and any change of
+                the windows or the kind of average
+    worker      reads its ring in batches, feeds the ticks to its own
+                Instrument and strategy per symbol and, after each batch,
+                writes the averages of every symbol it touched to the
+                ring and sends the target of every symbol that changed
+                it back on the intent queue
+    gateway     takes the intents from its message loop and places the
+                orders through run_strategy, with the usual risk checks
+                and rate limit. The latest target of a symbol stays
+                pending: run_strategy asks for it again on every tick (or
+                flush) and once an open order is done, so a target that
+                a risk check held back is placed as soon as it passes
+
+A TickRing is a single producer, single consumer ring of fixed size
+records in shared memory. The write and read positions are int64 fields
+in its header that only ever grow and are each written by one side, so
+no lock is needed. When a worker falls a whole ring behind the newest
+ticks are dropped (and counted) instead of blocking the gateway. After
+the records the ring holds the long and short average of each symbol of
+the worker, which the averages of the gateway instruments read, so
+snapshots show what the workers trade on
+
+Workers are started before connecting so no process is forked while the
+reader thread of the gateway is running. A warm start stores the history
+in the gateway and writes it to the ring of the worker ahead of the live
+ticks, so the workers start trading with their averages already filled
+"""
+
+RING_DTYPE = np.dtype([("reqId", "i4"), ("kind", "i4"), ("time", "f8"), ("price", "f8"),
+                       ("size", "f8")])
+
+#Kinds of ring records. A tick has its time, price and size, SIZE sets
+#the size of the last tick (TWS sends it after the price) and the
+#others carry the new setting in "price"
+TICK = 0
+SIZE = 1
+LONG_WINDOW = 2
+SHORT_WINDOW = 3
+MA_TYPE = 4
+
+#MA_TYPE records send the index of the average in this list
+_MA_TYPES = list(INDICATORS)
+
+#Header fields of a TickRing
+_WRITE = 0
+_READ = 1
+_STOP = 2
+_DROPPED = 3
+_HEADER = 8
+
+
+class TickRing:
+
+    def __init__(self, capacity = 65536, name = None, slots = 0):
+
+        self.capacity = capacity
+        offset = _HEADER * 8 + capacity * RING_DTYPE.itemsize
+        size = offset + slots * 2 * 8
+
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create = True, size = size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name = name)
+            self.owner = False
+
+        self.header = np.ndarray((_HEADER,), dtype = np.int64, buffer = self.shm.buf)
+        self.records = np.ndarray((capacity,), dtype = RING_DTYPE, buffer = self.shm.buf,
+                                  offset = _HEADER * 8)
+
+        #Long and short average of each symbol, written by the consumer
+        self.values = np.ndarray((slots, 2), dtype = np.float64, buffer = self.shm.buf,
+                                 offset = offset)
+
+        if self.owner:
+            self.header[:] = 0
+            self.values[:] = np.nan
+
+    @property
+    def name(self):
+
+        return self.shm.name
+
+    @property
+    def stopped(self):
+
+        return bool(self.header[_STOP])
+
+    @property
+    def dropped(self):
+
+        return int(self.header[_DROPPED])
+
+    def __len__(self):
+
+        return int(self.header[_WRITE] - self.header[_READ])
+
+    """
+    Producer side. Returns False if the ring was full and the record dropped
+    """
+    def put(self, reqId, t, price, size = 0.0, kind = TICK):
+
+        header = self.header
+        write = int(header[_WRITE])
+
+        if write - int(header[_READ]) >= self.capacity:
+            header[_DROPPED] += 1
+            return False
+
+        self.records[write % self.capacity] = (reqId, kind, t, price, size)
+
+        #Published only once the record is complete
+        header[_WRITE] = write + 1
+
+        return True
+
+    """
+    Consumer side. Copies out up to "limit" of the waiting records
+    """
+    def take(self, limit = 4096):
+
+        header = self.header
+        read = int(header[_READ])
+        count = min(int(header[_WRITE]) - read, limit)
+
+        if count <= 0:
+            return self.records[:0].copy()
+
+        start = read % self.capacity
+        end = start + count
+
+        if end <= self.capacity:
+            batch = self.records[start:end].copy()
+        else:
+            batch = np.concatenate((self.records[start:], self.records[:end - self.capacity]))
+
+        header[_READ] = read + count
+
+        return batch
+
+    def stop(self):
+
+        self.header[_STOP] = 1
+
+    def close(self):
+
+        #The arrays are views of the buffer and have to go first
+        self.header = None
+        self.records = None
+        self.values = None
+        self.shm.close()
+
+        if self.owner:
+            self.shm.unlink()
+
+
+"""
+Strategy of a gateway instrument: the target is whatever its worker sent
+last
+"""
+class RemoteStrategy(Strategy):
+
+    name = "remote"
+
+    def __init__(self, instrument):
+
+        Strategy.__init__(self, instrument)
+
+        self.latest = None
+
+    def target(self):
+
+        return self.latest
+
+
+"""
+Moving average of a gateway instrument: the value its worker wrote to
+the ring last, NaN (and not ready) until it has one
+"""
+class RemoteAverage:
+
+    def __init__(self, instrument, column):
+
+        self.instrument = instrument
+        self.column = column
+
+    @property
+    def value(self):
+
+        ring = self.instrument.ring
+
+        if ring is None or ring.values is None:
+            return float("nan")
+
+        return float(ring.values[self.instrument.slot, self.column])
+
+    @property
+    def ready(self):
+
+        return not math.isnan(self.value)
+
+
+"""
+Instrument of the gateway. It only stores the ticks, everything that
+changes the averages (ticks, sizes, windows, the kind of average) is
+written to the ring of its worker instead, which keeps the averages
+"""
+class RemoteInstrument(Instrument):
+
+    #Set by GatewayApp.start_workers
+    ring = None
+    slot = None
+
+    def __init__(self, contract, long_window, short_window, quantity, ma_type = "SMA",
+                 tick_retention = 100000, spill_path = None):
+
+        Instrument.__init__(self, contract, long_window, short_window, quantity, ma_type,
+                            tick_retention, spill_path)
+
+        self.long_ma = RemoteAverage(self, 0)
+        self.short_ma = RemoteAverage(self, 1)
+
+    @Instrument.ma_type.setter
+    def ma_type(self, ma_type):
+
+        self._ma_type = ma_type
+        self._send(MA_TYPE, _MA_TYPES.index(ma_type.upper()))
+
+    @Instrument.long_window.setter
+    def long_window(self, window):
+
+        self._long_window = window
+        self._send(LONG_WINDOW, window)
+
+    @Instrument.short_window.setter
+    def short_window(self, window):
+
+        self._short_window = window
+        self._send(SHORT_WINDOW, window)
+
+    def _send(self, kind, value):
+
+        if self.ring is not None:
+            self.ring.put(self.reqId, 0.0, float(value), 0.0, kind)
+
+    def add_tick(self, t, price, size = 0.0):
+
+        self.ticks.append(t, price, size)
+
+        if self.ring is not None:
+            self.ring.put(self.reqId, t, price, size)
+
+    """
+    The size goes to the worker, which runs the strategy again if it
+    moved an average. Nothing changes in the gateway so it returns False
+    """
+    def add_size(self, size):
+
+        if self.ticks.count == 0:
+            return False
+
+        self.ticks.size[self.ticks.count - 1] = size
+
+        if self.ring is not None:
+            self.ring.put(self.reqId, 0.0, 0.0, size, SIZE)
+
+        return False
+
+    """
+    The history of a warm start is stored and sent to the worker like the
+    live prices, which come after it in the ring. At most half a ring of
+    it is sent so the live ticks behind it are not dropped
+    """
+    def seed(self, times, prices, sizes = None):
+
+        if sizes is None:
+            sizes = [0.0] * len(prices)
+
+        for t, price, size in zip(times, prices, sizes):
+            self.ticks.append(t, price, size)
+
+        if self.ring is not None:
+
+            keep = self.ring.capacity // 2
+
+            for t, price, size in zip(times[-keep:], prices[-keep:], sizes[-keep:]):
+                self.ring.put(self.reqId, t, price, size)
+
+
+"""
+Main loop of a worker process
+
+specs holds (reqId, long_window, short_window, ma_type, strategy,
+strategy_params, tick_retention) of every symbol the worker owns, in the
+order of their slots in the ring
+"""
+def _work(ring_name, capacity, specs, intents, idle = 0.0005):
+
+    ring = TickRing(capacity, ring_name, len(specs))
+    instruments = {}
+    slots = {}
+    sent = {}
+
+    for slot, (reqId, long_window, short_window, ma_type, strategy, params,
+               retention) in enumerate(specs):
+
+        instrument = Instrument(None, long_window, short_window, 0, ma_type, retention)
+        instrument.strategy = make_strategy(strategy, instrument, **params)
+        instruments[reqId] = instrument
+        slots[reqId] = slot
+        sent[reqId] = None
+
+    try:
+
+        while not ring.stopped:
+
+            batch = ring.take()
+
+            if len(batch) == 0:
+                time.sleep(idle)
+                continue
+
+            touched = set()
+
+            for reqId, kind, t, price, size in batch.tolist():
+
+                instrument = instruments.get(reqId)
+
+                if instrument is None:
+                    continue
+
+                if kind == TICK:
+                    instrument.add_tick(t, price, size)
+                elif kind == SIZE:
+                    if not instrument.add_size(size):
+                        continue
+                elif kind == LONG_WINDOW:
+                    instrument.long_window = int(price)
+                elif kind == SHORT_WINDOW:
+                    instrument.short_window = int(price)
+                elif kind == MA_TYPE:
+                    instrument.ma_type = _MA_TYPES[int(price)]
+
+                touched.add(reqId)
+
+            #Decides once per batch on the freshest price of each symbol
+            for reqId in touched:
+
+                instrument = instruments[reqId]
+                long_ma, short_ma = instrument.long_ma, instrument.short_ma
+
+                ring.values[slots[reqId]] = (long_ma.value if long_ma.ready else np.nan,
+                                             short_ma.value if short_ma.ready else np.nan)
+
+                target = instrument.strategy.target()
+
+                if target is not None and target != sent[reqId]:
+                    sent[reqId] = target
+                    intents.put((reqId, target))
+
+    finally:
+
+        ring.close()
+
+
+class GatewayApp(TradingApp):
+
+    def __init__(self, contract, long_window, short_window, quantity, workers = None,
+                 ring_size = 65536, **kwargs):
+
+        self.workers = workers or os.cpu_count()
+        self.ring_size = ring_size
+
+        #Filled by start_workers
+        self.rings = []
+        self.processes = []
+        self.intents = None
+
+        #Per instrument the strategy its worker builds and its parameters
+        self.specs = {}
+
+        TradingApp.__init__(self, contract, long_window, short_window, quantity, **kwargs)
+
+    """
+    Overridden function: make_instrument
+
+    Instruments of the gateway only store the ticks, see RemoteInstrument
+    """
+    def make_instrument(self, contract, long_window, short_window, quantity, ma_type):
+
+        return RemoteInstrument(contract, long_window, short_window, quantity, ma_type,
+                                self.tick_retention, self._spill_path(contract))
+
+    """
+    Overridden function: add_instrument
+
+    The instrument of the gateway only takes the targets of its worker,
+    the strategy it was given is built in the worker
+    """
+    def add_instrument(self, contract, long_window, short_window, quantity, ma_type = None,
+                       strategy = None, strategy_params = None):
+
+        if self.processes:
+            raise RuntimeError("instruments have to be added before start_workers")
+
+        instrument = TradingApp.add_instrument(self, contract, long_window, short_window,
+                                               quantity, ma_type, strategy, strategy_params)
+
+        self.specs[instrument.reqId] = (strategy or self.strategy,
+                                        self._strategy_params(strategy, strategy_params))
+        instrument.shard = (instrument.reqId - 1) % self.workers
+        instrument.strategy = RemoteStrategy(instrument)
+
+        return instrument
+
+    """
+    Self Made Function: start_workers
+
+    Creates a ring per worker and starts the worker processes, call it
+    once every instrument is added and before connecting. The workers
+    build their instruments with the windows and average the gateway
+    instruments have now, later changes go through the rings
+    """
+    def start_workers(self):
+
+        self.intents = multiprocessing.Queue()
+
+        for shard in range(self.workers):
+
+            owned = [instrument for instrument in self.instruments if instrument.shard == shard]
+
+            if not owned:
+                continue
+
+            specs = [(i.reqId, i.long_window, i.short_window, i.ma_type) + self.specs[i.reqId]
+                     + (self.tick_retention,) for i in owned]
+
+            ring = TickRing(self.ring_size, slots = len(specs))
+            process = multiprocessing.Process(target = _work, name = "Shard-%d" % shard,
+                                              args = (ring.name, self.ring_size, specs,
+                                                      self.intents),
+                                              daemon = True)
+            process.start()
+
+            self.rings.append(ring)
+            self.processes.append(process)
+
+            for slot, instrument in enumerate(owned):
+                instrument.ring = ring
+                instrument.slot = slot
+
+        return self
+
+    def stop_workers(self):
+
+        for ring in self.rings:
+            ring.stop()
+
+        for process in self.processes:
+            process.join(5)
+
+        for instrument in self.instruments:
+            instrument.ring = None
+
+        for ring in self.rings:
+            ring.close()
+
+        self.rings = []
+        self.processes = []
+
+    """
+    Targets sent by the workers since the last call
+    """
+    def collect_intents(self):
+
+        if self.intents is None:
+            return
+
+        while True:
+
+            try:
+                reqId, target = self.intents.get_nowait()
+            except queue.Empty:
+                return
+
+            instrument = self.byReqId.get(reqId)
+
+            if instrument is not None:
+                instrument.strategy.latest = target
+                self.run_strategy(instrument)
+
+    """
+    Ticks dropped because a worker was a whole ring behind
+    """
+    def dropped(self):
+
+        return sum(ring.dropped for ring in self.rings)
+
+    def msgLoopRec(self):
+
+        self.collect_intents()
+        TradingApp.msgLoopRec(self)
+
+    def msgLoopTmo(self):
+
+        self.collect_intents()
+        TradingApp.msgLoopTmo(self)
+
+    """
+    A target that came in while the order before it was open is placed
+    as soon as that order is done
+    """
+    def _order_changed(self, instrument, state):
+
+        TradingApp._order_changed(self, instrument, state)
+
+        if instrument is not None and instrument.noOpenOrders:
+            self.run_strategy(instrument)
+
+    def disconnect(self):
+
+        TradingApp.disconnect(self)
+        self.stop_workers()
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Run the strategies of many symbols "
+                                                   "on worker processes")
+    parser.add_argument("--symbols", default = "AAPL", help = "comma separated stocks to trade")
+    parser.add_argument("--long", type = int, default = 10, help = "long window")
+    parser.add_argument("--short", type = int, default = 3, help = "short window")
+    parser.add_argument("--quantity", type = int, default = 100, help = "shares per trade")
+    parser.add_argument("--strategy", default = "crossover",
+                        help = "crossover, breakout or meanreversion")
+    parser.add_argument("--workers", type = int, default = None,
+                        help = "worker processes, one per core by default")
+    parser.add_argument("--host", default = "127.0.0.1", help = "TWS host")
+    parser.add_argument("--port", type = int, default = 7497, help = "TWS port")
+    parser.add_argument("--clientId", type = int, default = 0, help = "API client ID")
+    args = parser.parse_args(argv)
+
+    contracts = []
+
+    for symbol in args.symbols.split(","):
+        contract = Contract()
+        contract.symbol = symbol.strip()
+        contract.secType = "STK"
+        contract.exchange = "SMART"
+        contract.currency = "USD"
+        contracts.append(contract)
+
+    app = GatewayApp(contracts[0], args.long, args.short, args.quantity, args.workers,
+                     strategy = args.strategy)
+
+    for contract in contracts[1:]:
+        app.add_instrument(contract, args.long, args.short, args.quantity)
+
+    app.start_workers()
+    app.connect(args.host, args.port, clientId = args.clientId)
+
+    if not app.isConnected():
+        app.stop_workers()
+        return 1
+
+    app.reqMarketDataType(3)
+    app.subscribe()
+    app.reqPositions()
+
+    thread = threading.Thread(target = app.run, name = "Gateway", daemon = True)
+    thread.start()
+
+    try:
+        while thread.is_alive():
+            thread.join(1.0)
+    except KeyboardInterrupt:
+        pass
+
+    app.disconnect()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
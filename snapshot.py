@@ -0,0 +1,255 @@
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from tickstore import TICK_DTYPE
+
+"""
+Snapshots of the trading state for readers on other threads (the GUI)
+
+The trading thread owns every Instrument and mutates it in its callbacks.
+Instead of letting the GUI read those arrays while they are being
+written, the trading thread publishes a Snapshot: read-only copies of the
+state, stamped with a version number. Publishing is a single reference
+assignment, which is atomic in Python, so there is no lock for either
+side to wait on. A reader grabs SnapshotPublisher.latest once and gets a
+consistent state that can never change under it, and compares versions
+to skip work when nothing new was published
+
+Arrays that did not change since the last snapshot (no new execution)
+are shared with it instead of being copied again. Ticks are never copied
+twice: each snapshot only copies the ticks that came in since the one
+before into a Delta, linked to the Delta of that snapshot. A reader that
+knows how many ticks it has seen takes the rest with since(total), so
+publishing costs the number of new ticks however many are held. The
+chain is cut once it covers more than "retention" ticks. An instrument
+trading on bars gets a second chain of the same kind with its closed
+BAR_DTYPE bars (time, open, high, low, close, volume, ticks), plus the
+bar that is still open
+
+Next to the instruments a Snapshot holds copies of the P&L totals of the
+risk book, the counters of the app and the summary of its latency
+histograms, so a reader (the daemon's HTTP server) never needs the live
+objects either
+"""
+
+InstrumentSnapshot = namedtuple("InstrumentSnapshot",
+                                ["symbol", "total", "ticks",
+                                 "long_window", "short_window", "ma_type", "long_ma", "short_ma",
+                                 "quantity", "pos", "currentOrderId", "currentOrderStatus",
+                                 "currentOrderType", "long_trades", "short_trades", "tradeDist",
+                                 "position", "avgCost", "realizedPnl", "unrealizedPnl",
+                                 "bars", "bar"])
+
+Snapshot = namedtuple("Snapshot", ["version", "published", "instruments", "pnl", "counters",
+                                   "latency"])
+
+
+def _frozen(array):
+
+    copy = np.array(array, dtype = np.float64)
+    copy.setflags(write = False)
+
+    return copy
+
+
+"""
+Delta: the records (TICK_DTYPE, or BAR_DTYPE for bars) appended after the
+first "start" ones, linked to the Delta before it ("previous", None where
+the chain was cut)
+"""
+class Delta:
+
+    __slots__ = ("start", "records", "previous")
+
+    def __init__(self, start, records, previous = None):
+
+        self.start = start
+        self.records = records
+        self.previous = previous
+
+    @property
+    def end(self):
+
+        return self.start + len(self.records)
+
+    """
+    Records after the first "total" ones, as far back as the chain goes
+    """
+    def since(self, total):
+
+        parts = []
+        delta = self
+
+        while delta is not None and delta.end > total:
+
+            parts.append(delta.records[max(total - delta.start, 0):])
+
+            if delta.start <= total:
+                break
+
+            delta = delta.previous
+
+        if len(parts) == 1:
+            return parts[0]
+
+        return np.concatenate(parts[::-1]) if parts else self.records[:0]
+
+    """
+    The last n records (fewer if the chain does not go back that far)
+    """
+    def latest(self, n):
+
+        return self.since(self.end - n)
+
+
+"""
+SnapshotPublisher: written by one thread with publish, read by any
+number of threads through latest or pull
+"""
+class SnapshotPublisher:
+
+    def __init__(self, retention = 100000):
+
+        self.version = 0
+        self.latest = None
+        self.retention = retention
+
+        #Per instrument, the tick, execution and bar counts the last
+        #snapshot was taken at, and per chain the Deltas still linked
+        #with their record count
+        self._marks = {}
+        self._chains = {}
+
+    """
+    Copies the state of every instrument into a new Snapshot and makes it
+    the latest one. Must only be called from the thread that updates the
+    instruments
+
+    The position and P&L of each instrument and the totals are read from
+    "risk" (a RiskBook) when one is given. "counters" maps a group name to
+    a dictionary of counters, each is copied, and "latency" is the
+    LatencyMonitor whose snapshot is taken
+    """
+    def publish(self, instruments, risk = None, counters = None, latency = None):
+
+        previous = self.latest
+        snapshots = []
+
+        for i, instrument in enumerate(instruments):
+
+            old = previous.instruments[i] if previous and i < len(previous.instruments) else None
+            ticks = instrument.ticks.total
+            fills = len(instrument.ledger.execIds)
+            marks = self._marks.get(i)
+
+            if old is not None and marks is not None and marks[0] == ticks:
+                delta = old.ticks
+            else:
+                new = min(ticks - (marks[0] if marks else 0), instrument.ticks.count)
+                delta = self._delta((i, "ticks"), ticks, self._ticks(instrument.ticks, new),
+                                    old.ticks if old is not None else None)
+
+            builder = instrument.bars
+            bars = builder.store.total if builder is not None else 0
+
+            if builder is None:
+                barDelta = None
+            elif old is not None and marks is not None and marks[2] == bars:
+                barDelta = old.bars
+            else:
+                store = builder.store
+                new = min(bars - (marks[2] if marks else 0), store.count)
+                barDelta = self._delta((i, "bars"), bars, np.array(store.bars[store.count - new:]),
+                                       old.bars if old is not None else None)
+
+            if old is not None and marks is not None and marks[1] == fills:
+                long_trades, short_trades, tradeDist = old.long_trades, old.short_trades, old.tradeDist
+            else:
+                long_trades = _frozen(instrument.long_trades)
+                short_trades = _frozen(instrument.short_trades)
+                tradeDist = _frozen(instrument.tradeDist)
+
+            self._marks[i] = (ticks, fills, bars)
+
+            long_ma, short_ma = instrument.long_ma, instrument.short_ma
+            held = risk.positions.get(instrument.contract.symbol) if risk is not None else None
+
+            snapshots.append(InstrumentSnapshot(
+                instrument.contract.symbol, ticks, delta,
+                instrument.long_window, instrument.short_window, instrument.ma_type,
+                long_ma.value if long_ma.ready else None,
+                short_ma.value if short_ma.ready else None,
+                instrument.quantity, instrument.pos, instrument.currentOrderId,
+                instrument.currentOrderStatus, instrument.currentOrderType,
+                long_trades, short_trades, tradeDist,
+                held.shares if held else 0.0, held.avgCost if held else 0.0,
+                held.realized if held else 0.0, held.unrealized if held else 0.0,
+                barDelta, builder.current if builder is not None else None))
+
+        pnl = {"realized": risk.realized, "unrealized": risk.unrealized,
+               "total": risk.pnl} if risk is not None else None
+
+        snapshot = Snapshot(self.version + 1, time.time(), tuple(snapshots), pnl,
+                            {group: dict(values) for group, values in (counters or {}).items()},
+                            latency.snapshot() if latency is not None else None)
+
+        #The one assignment readers can see, the snapshot is complete by now
+        self.latest = snapshot
+        self.version = snapshot.version
+
+        return snapshot
+
+    """
+    Copy of the "new" latest ticks of a TickStore as TICK_DTYPE records
+    """
+    def _ticks(self, store, new):
+
+        records = np.empty(max(new, 0), dtype = TICK_DTYPE)
+
+        if new > 0:
+            records["time"] = store.times[-new:]
+            records["price"] = store.prices[-new:]
+            records["size"] = store.sizes[-new:]
+
+        return records
+
+    """
+    Links the new records, the last of "total" so far, into a Delta after
+    "previous" and cuts the chain "key" behind the last retention records
+    """
+    def _delta(self, key, total, records, previous):
+
+        new = len(records)
+
+        if new == 0:
+            return previous
+
+        records.setflags(write = False)
+
+        delta = Delta(total - new, records, previous)
+
+        chain, held = self._chains.get(key) or (deque(), 0)
+        chain.append(delta)
+        held += new
+
+        while len(chain) > 1 and held - len(chain[0].records) >= self.retention:
+            held -= len(chain.popleft().records)
+            chain[0].previous = None
+
+        self._chains[key] = (chain, held)
+
+        return delta
+
+    """
+    Returns the latest snapshot if it is newer than "version", otherwise None
+    """
+    def pull(self, version = 0):
+
+        snapshot = self.latest
+
+        if snapshot is None or snapshot.version == version:
+            return None
+
+        return snapshot
@@ -0,0 +1,381 @@
+import math
+from collections import deque
+
+import numpy as np
+
+from instrument import Instrument
+from indicators import TIE_TOLERANCE, RunningVolatility
+
+"""
+Trading strategies of the Trading Application
+
+A strategy is built for one instrument and sees every price of it twice:
+
+    update(price)   called by Instrument.add_tick (and seed) for every
+                    tick that is stored, keeps whatever running state the
+                    strategy needs in O(1)
+    target()        called by TradingApp.run_strategy when an order may be
+                    placed, returns the position the strategy wants: LONG,
+                    FLAT, or None to keep the one held
+
+TradingApp turns a target that differs from the position into an order,
+so strategies never build orders themselves. The windows, moving
+averages and prices of the instrument are read straight from it, so
+changing a window from the GUI is picked up (reset is called after the
+averages were rebuilt)
+
+The same classes run in batch mode: signals(prices, long_window,
+short_window) returns the position held after each price of an array.
+The base class does this by streaming the prices through a scratch
+Instrument, so any strategy works in the backtester without more code.
+The built-in strategies override it with NumPy versions that make the
+same decisions without a Python loop per price
+"""
+
+LONG = 1
+FLAT = 0
+
+
+"""
+Moving average of every full window, element i is the average of the
+window ending at price i + window - 1. Prices are shifted by the first
+price before the cumulative sum to keep its rounding error small
+"""
+def rolling_mean(prices, window):
+
+    shifted = prices - prices[0]
+    ret = np.cumsum(shifted, dtype = np.float64)
+    ret[window:] = ret[window:] - ret[:-window]
+
+    return ret[window - 1:] / window + prices[0]
+
+
+"""
+Turns signals (1 go long, -1 go flat, 0 nothing) into the position (1
+long, 0 flat) held after each price. The position is the last non zero
+signal seen so far, found with a running maximum over the signal indices
+"""
+def hold_positions(signal):
+
+    last = np.where(signal != 0, np.arange(len(signal)), 0)
+    np.maximum.accumulate(last, out = last)
+
+    return (signal[last] == 1).astype(np.int8)
+
+
+class Strategy:
+
+    name = "strategy"
+
+    def __init__(self, instrument):
+
+        self.instrument = instrument
+
+    """
+    Called after the windows of the instrument changed
+    """
+    def reset(self):
+
+        pass
+
+    def update(self, price):
+
+        pass
+
+    def target(self):
+
+        return None
+
+    """
+    Position (1 long, 0 flat) held after each of the prices, starting flat
+    and filling every order at the price that triggered it
+    """
+    @classmethod
+    def signals(cls, prices, long_window, short_window, ma_type = "SMA", **params):
+
+        prices = np.asarray(prices, dtype = np.float64)
+
+        instrument = Instrument(None, long_window, short_window, 1, ma_type,
+                                tick_retention = max(len(prices), 1))
+        strategy = instrument.strategy = cls(instrument, **params)
+
+        positions = np.zeros(len(prices), dtype = np.int8)
+        pos = FLAT
+
+        for i, price in enumerate(prices.tolist()):
+
+            instrument.add_tick(float(i), price)
+            target = strategy.target()
+
+            if target is not None:
+                pos = target
+
+            positions[i] = pos
+
+        return positions
+
+
+"""
+Moving Average Crossover: long while the short average is above the long
+one, flat while it is below. The averages are the SMA, EMA or VWAP of the
+instrument (its ma_type). Averages within TIE_TOLERANCE of each other
+count as equal and keep the position
+"""
+class Crossover(Strategy):
+
+    name = "crossover"
+
+    def target(self):
+
+        long_ma = self.instrument.long_ma
+        short_ma = self.instrument.short_ma
+
+        if not (long_ma.ready and short_ma.ready):
+            return None
+
+        diff = short_ma.value - long_ma.value
+        tol = TIE_TOLERANCE * abs(long_ma.value)
+
+        if diff > tol:
+            return LONG
+
+        if diff < -tol:
+            return FLAT
+
+        return None
+
+    """
+    Vectorized for simple averages, other averages are recursive and go
+    through the streaming version
+    """
+    @classmethod
+    def signals(cls, prices, long_window, short_window, ma_type = "SMA", **params):
+
+        if ma_type.upper() != "SMA":
+            return super().signals(prices, long_window, short_window, ma_type, **params)
+
+        prices = np.asarray(prices, dtype = np.float64)
+        n = len(prices)
+        start = max(long_window, short_window) - 1
+
+        signal = np.zeros(n, dtype = np.int8)
+
+        if n > start:
+
+            long_ma = rolling_mean(prices, long_window)[start - long_window + 1:]
+            short_ma = rolling_mean(prices, short_window)[start - short_window + 1:]
+
+            diff = short_ma - long_ma
+            tol = TIE_TOLERANCE * np.abs(long_ma)
+            signal[start:] = np.where(diff > tol, 1, np.where(diff < -tol, -1, 0))
+
+        return hold_positions(signal)
+
+
+"""
+Breakout: goes long when a price is above the highest of the long_window
+prices before it and flat when it is below the lowest of the short_window
+prices before it
+
+The highest and lowest prices are kept with monotonic queues, so each
+price is pushed and popped at most once no matter how large the windows
+are
+"""
+class Breakout(Strategy):
+
+    name = "breakout"
+
+    def __init__(self, instrument):
+
+        Strategy.__init__(self, instrument)
+
+        self.reset()
+
+    def reset(self):
+
+        #(index, price) with decreasing prices for the high, increasing
+        #prices for the low
+        self.highs = deque()
+        self.lows = deque()
+        self.count = 0
+        self.signal = None
+
+        for price in self.instrument.prices.tolist():
+            self.update(price)
+
+    def update(self, price):
+
+        long_window = self.instrument.long_window
+        short_window = self.instrument.short_window
+        i = self.count
+        highs = self.highs
+        lows = self.lows
+
+        while highs and highs[0][0] < i - long_window:
+            highs.popleft()
+
+        while lows and lows[0][0] < i - short_window:
+            lows.popleft()
+
+        if i >= max(long_window, short_window):
+
+            if price > highs[0][1]:
+                self.signal = LONG
+            elif price < lows[0][1]:
+                self.signal = FLAT
+            else:
+                self.signal = None
+
+        while highs and highs[-1][1] <= price:
+            highs.pop()
+
+        while lows and lows[-1][1] >= price:
+            lows.pop()
+
+        highs.append((i, price))
+        lows.append((i, price))
+        self.count = i + 1
+
+    def target(self):
+
+        return self.signal
+
+    @classmethod
+    def signals(cls, prices, long_window, short_window, ma_type = "SMA", **params):
+
+        prices = np.asarray(prices, dtype = np.float64)
+        n = len(prices)
+        start = max(long_window, short_window)
+
+        signal = np.zeros(n, dtype = np.int8)
+
+        if n > start:
+
+            windows = np.lib.stride_tricks.sliding_window_view
+            highs = windows(prices, long_window).max(axis = 1)[start - long_window:n - long_window]
+            lows = windows(prices, short_window).min(axis = 1)[start - short_window:n - short_window]
+
+            current = prices[start:]
+            signal[start:] = np.where(current > highs, 1, np.where(current < lows, -1, 0))
+
+        return hold_positions(signal)
+
+
+"""
+Mean Reversion: buys when the price is far below its long average and
+sells once it is back above it
+
+How far is measured against the standard deviation of the log returns
+(the same running volatility the GUI shows) scaled to the long window:
+
+    z = log(price / long average) / (volatility * sqrt(long_window))
+
+The strategy goes long when z is below -entry and flat when z is above
+exit. Like the crossover, a price within TIE_TOLERANCE of a threshold
+counts as on it and keeps the position
+"""
+class MeanReversion(Strategy):
+
+    name = "meanreversion"
+
+    def __init__(self, instrument, entry = 1.0, exit = 0.0):
+
+        Strategy.__init__(self, instrument)
+
+        self.entry = entry
+        self.exit = exit
+        self.volatility = RunningVolatility()
+
+        for price in instrument.prices.tolist():
+            self.volatility.update(price)
+
+    def update(self, price):
+
+        self.volatility.update(price)
+
+    def target(self):
+
+        instrument = self.instrument
+        long_ma = instrument.long_ma
+        volatility = self.volatility.value
+
+        if not long_ma.ready or volatility <= 0 or instrument.ticks.count == 0:
+            return None
+
+        deviation = math.log(instrument.prices[-1] / long_ma.value)
+        band = volatility * math.sqrt(instrument.long_window)
+
+        if deviation < -self.entry * band - TIE_TOLERANCE:
+            return LONG
+
+        if deviation > self.exit * band + TIE_TOLERANCE:
+            return FLAT
+
+        return None
+
+    """
+    Vectorized for simple averages. The volatility after each price comes
+    from cumulative sums instead of Welford's algorithm, the two only
+    differ by rounding, which the TIE_TOLERANCE band around the thresholds
+    absorbs (tests/test_backtest.py checks both make the same decisions)
+    """
+    @classmethod
+    def signals(cls, prices, long_window, short_window, ma_type = "SMA", entry = 1.0, exit = 0.0):
+
+        if ma_type.upper() != "SMA":
+            return super().signals(prices, long_window, short_window, ma_type,
+                                   entry = entry, exit = exit)
+
+        prices = np.asarray(prices, dtype = np.float64)
+        n = len(prices)
+        start = max(long_window, 2) - 1
+
+        signal = np.zeros(n, dtype = np.int8)
+
+        if n > start:
+
+            returns = np.diff(np.log(prices))
+            count = np.arange(1, n)
+            mean = np.cumsum(returns) / count
+            variance = np.maximum(np.cumsum(returns * returns) / count - mean * mean, 0.0)
+
+            volatility = np.sqrt(variance)[start - 1:]
+            long_ma = rolling_mean(prices, long_window)[start - long_window + 1:]
+
+            deviation = np.log(prices[start:] / long_ma)
+            band = volatility * math.sqrt(long_window)
+
+            ready = volatility > 0
+            signal[start:] = np.where(ready & (deviation < -entry * band - TIE_TOLERANCE), 1,
+                                      np.where(ready & (deviation > exit * band + TIE_TOLERANCE),
+                                               -1, 0))
+
+        return hold_positions(signal)
+
+
+STRATEGIES = {cls.name: cls for cls in (Crossover, Breakout, MeanReversion)}
+
+"""
+Strategy class from its name ("crossover", "breakout" or "meanreversion"),
+a Strategy class is returned as it is
+"""
+def strategy_class(strategy):
+
+    if not isinstance(strategy, str):
+        return strategy
+
+    try:
+        return STRATEGIES[strategy.lower()]
+    except KeyError:
+        raise ValueError("unknown strategy %r, expected one of %s"
+                         % (strategy, ", ".join(STRATEGIES))) from None
+
+
+"""
+Builds a strategy for the instrument, see strategy_class. params are
+keyword arguments of the strategy, like the entry and exit of
+MeanReversion
+"""
+def make_strategy(strategy, instrument, **params):
+
+    return strategy_class(strategy)(instrument, **params)
@@ -0,0 +1,98 @@
+from PyQt5 import QtCore
+
+"""
+ExecutionTableModel: the buy or sell executions of the trade ledger as a
+Qt table model, shown in the buyExecTable and sellExecTable views
+
+The model reads the [price, orderId] array of a snapshot (see
+snapshot.py) in place instead of holding a QTableWidgetItem per cell.
+When a snapshot brings new fills only the new rows are announced with
+rowsInserted, and the view asks for the data of the rows that are
+visible, so a day with thousands of fills costs the same to refresh as
+one with a handful
+"""
+class ExecutionTableModel(QtCore.QAbstractTableModel):
+
+    HEADERS = ["OrderID", "Stock", "Buy/Sell?", "Price", "Quantity"]
+
+    def __init__(self, action, parent = None):
+
+        super(ExecutionTableModel, self).__init__(parent)
+
+        #"BOUGHT" or "SOLD", shown in the Buy/Sell? column
+        self.action = action
+
+        self.trades = None
+        self.rows = 0
+        self.symbol = ""
+        self.quantity = ""
+
+    def rowCount(self, parent = QtCore.QModelIndex()):
+
+        return 0 if parent.isValid() else self.rows
+
+    def columnCount(self, parent = QtCore.QModelIndex()):
+
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role = QtCore.Qt.DisplayRole):
+
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.HEADERS[section]
+
+        return super(ExecutionTableModel, self).headerData(section, orientation, role)
+
+    def data(self, index, role = QtCore.Qt.DisplayRole):
+
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+
+        row, column = index.row(), index.column()
+
+        if column == 0:
+            return str(int(self.trades[1, row]))
+        elif column == 1:
+            return self.symbol
+        elif column == 2:
+            return self.action
+        elif column == 3:
+            return str(self.trades[0, row])
+        else:
+            return self.quantity
+
+    """
+    Points the model at the trades of a new snapshot
+
+    Rows that were added are inserted, rows already shown only get a
+    dataChanged for the price column (a partial fill changes the average
+    price of its order). Fewer rows than before (the ledger was replaced)
+    resets the model
+    """
+    def update(self, trades, symbol, quantity):
+
+        if trades is self.trades:
+            return
+
+        count = trades.shape[1]
+        old = self.rows
+
+        self.symbol = symbol
+        self.quantity = str(quantity)
+
+        if count < old:
+
+            self.beginResetModel()
+            self.trades = trades
+            self.rows = count
+            self.endResetModel()
+            return
+
+        self.trades = trades
+
+        if old > 0:
+            self.dataChanged.emit(self.index(0, 1), self.index(old - 1, 4))
+
+        if count > old:
+            self.beginInsertRows(QtCore.QModelIndex(), old, count - 1)
+            self.rows = count
+            self.endInsertRows()
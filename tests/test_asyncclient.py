@@ -0,0 +1,111 @@
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+
+from ibapi.contract import Contract
+from ibapi.errors import CONNECT_FAIL
+
+from asyncclient import AsyncTradingApp
+from fakeserver import FakeTWS
+
+
+def make_app():
+
+    contract = Contract()
+    contract.symbol = "FAKE"
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+
+    app = AsyncTradingApp(contract, 10, 3, 100, spill_dir = None, history_dir = None)
+
+    app.errors = []
+    app.error = lambda reqId, code, text: app.errors.append(code)
+
+    return app
+
+
+def test_connect():
+
+    rng = np.random.default_rng(0)
+    prices = np.round(100 + np.cumsum(rng.normal(0, 0.05, 200)), 2)
+
+    server = FakeTWS(prices, port = 0, rate = 2000, positions = {"FAKE": (300, 99.5)}).start()
+    app = make_app()
+
+    async def session():
+
+        assert await app.connect_async(server.host, server.port, 0, timeout = 5)
+        assert app.isConnected() and app.serverVersion() > 0
+
+        ticks = app.ticks()
+        app.reqMarketDataType(3)
+        app.subscribe()
+
+        first = await asyncio.wait_for(ticks.__anext__(), 5)
+        orderId = await asyncio.wait_for(app.next_order_id(), 5)
+        positions = await asyncio.wait_for(app.positions(), 5)
+
+        app.disconnect()
+        await app.run_async()
+
+        return first, orderId, positions
+
+    try:
+        first, orderId, positions = asyncio.run(session())
+    finally:
+        server.stop()
+
+    assert first.symbol == "FAKE" and first.price in prices.tolist()
+    assert orderId >= 1
+    assert [(p.contract.symbol, p.position) for p in positions] == [("FAKE", 300)]
+    assert app.errors == [] and not app.isConnected()
+
+
+"""
+A server that accepts the connection and never answers the handshake
+fails the connect after the timeout instead of hanging it
+"""
+def test_handshake_timeout():
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    accepted = []
+
+    def accept():
+        try:
+            accepted.append(listener.accept()[0])
+        except OSError:
+            pass
+
+    threading.Thread(target = accept, daemon = True).start()
+
+    app = make_app()
+    start = time.monotonic()
+
+    try:
+        connected = asyncio.run(app.connect_async("127.0.0.1", listener.getsockname()[1], 0,
+                                                  timeout = 0.3))
+    finally:
+        listener.close()
+        for sock in accepted:
+            sock.close()
+
+    assert not connected
+    assert time.monotonic() - start < 5
+    assert app.errors == [CONNECT_FAIL.code()]
+    assert not app.isConnected() and app.conn is None
+
+
+def test_refused():
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    listener.close()
+
+    app = make_app()
+
+    assert not asyncio.run(app.connect_async("127.0.0.1", port, 0, timeout = 5))
+    assert app.errors == [CONNECT_FAIL.code()]
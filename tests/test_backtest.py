@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from backtest import compare
+from strategies import STRATEGIES, Strategy
+
+"""
+Seeded random walks: prices rounded to the cent (equal prices and equal
+averages happen all the time) and unrounded ones
+"""
+def walk(seed, n = 20000, rounded = True):
+
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 0.05, n))
+
+    return np.round(prices, 2) if rounded else prices
+
+
+WINDOWS = [(10, 3), (50, 7), (3, 10), (1, 1), (2, 1), (200, 20)]
+
+
+"""
+The batch version of every built-in strategy makes the same decision as
+the streaming one (Strategy.signals feeds the prices through update and
+target) after every price
+"""
+@pytest.mark.parametrize("name", sorted(STRATEGIES))
+@pytest.mark.parametrize("rounded", [True, False])
+def test_signals_match_streaming(name, rounded):
+
+    cls = STRATEGIES[name]
+
+    for seed, (long_window, short_window) in enumerate(WINDOWS):
+
+        prices = walk(seed, 5000, rounded)
+
+        fast = cls.signals(prices, long_window, short_window)
+        reference = Strategy.signals.__func__(cls, prices, long_window, short_window)
+
+        assert np.array_equal(fast, reference), (long_window, short_window)
+
+
+@pytest.mark.parametrize("name", sorted(STRATEGIES))
+def test_compare(name):
+
+    for seed, (long_window, short_window) in enumerate(WINDOWS):
+
+        matches, fast, reference = compare(walk(100 + seed), long_window, short_window,
+                                           strategy = name)
+
+        assert matches, (long_window, short_window)
+        assert len(reference.tradeDist) > 0 or long_window == short_window == 1
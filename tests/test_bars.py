@@ -0,0 +1,96 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ibapi.contract import Contract
+from ibapi.ticktype import TickTypeEnum
+
+from fakeserver import FakeTWS
+from IBTradingApp import TradingApp
+
+"""
+Bars are built from every tick and trade size whatever the coalescing
+mode, only the strategy runs are coalesced
+"""
+
+
+@pytest.mark.parametrize("coalesce", [None, "latest", "batch"])
+@pytest.mark.parametrize("bar_type, bar_size", [("tick", 10), ("volume", 1000)])
+def test_bars_see_every_tick(coalesce, bar_type, bar_size):
+
+    rng = np.random.default_rng(5)
+    prices = np.round(100 + np.cumsum(rng.normal(0, 0.05, 2000)), 2)
+
+    server = FakeTWS(prices, port = 0).start()
+
+    contract = Contract()
+    contract.symbol = "FAKE"
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+
+    app = TradingApp(contract, 10, 3, 100, spill_dir = None, coalesce = coalesce,
+                     bar_type = bar_type, bar_size = bar_size)
+    app.connect(server.host, server.port, clientId = 0)
+
+    threading.Thread(target = app.run, daemon = True).start()
+
+    app.reqMarketDataType(3)
+    app.subscribe()
+
+    server.done.wait(60)
+
+    while app.msg_queue.qsize() > 0:
+        time.sleep(0.01)
+    time.sleep(0.2)
+
+    app.disconnect()
+    server.stop()
+
+    instrument = app.instruments[0]
+    bars = instrument.bars.store.bars
+
+    #FakeTWS sends a size of 100 with every price
+    assert len(bars) == 200
+    assert bars["ticks"].sum() == len(prices)
+    assert bars["volume"].sum() == 100 * len(prices)
+    assert np.array_equal(bars["close"], instrument.prices)
+
+
+"""
+A trade size that completes a bar while coalescing only queues the
+instrument, the strategy runs on the bar at the next flush
+"""
+@pytest.mark.parametrize("coalesce", ["latest", "batch"])
+def test_bars_closed_by_sizes_are_coalesced(coalesce):
+
+    contract = Contract()
+    contract.symbol = "FAKE"
+
+    app = TradingApp(contract, 3, 1, 100, spill_dir = None, history_dir = None,
+                     coalesce = coalesce, bar_type = "volume", bar_size = 1000)
+
+    runs = []
+    flushing = []
+    flush_ticks = app.flush_ticks
+
+    def flush():
+        flushing.append(True)
+        flush_ticks()
+        flushing.clear()
+
+    app.run_strategy = lambda instrument: runs.append(bool(flushing))
+    app.flush_ticks = flush
+
+    for i in range(100):
+
+        app.tickPrice(1, 68, 100.0 + i % 7, None)
+        app.tickSize(1, TickTypeEnum.LAST_SIZE, 500)
+
+        if i % 10 == 9:
+            app.msgLoopRec()
+
+    assert app.instruments[0].ticks.total == 50
+    assert len(runs) == 10 and all(runs)
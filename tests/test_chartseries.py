@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from ibapi.contract import Contract
+from ibapi.ticktype import TickTypeEnum
+
+from chartseries import ChartSeries
+from IBTradingApp import TradingApp
+
+
+"""
+The chart draws the averages the strategy trades on, whatever their kind,
+also after the kind or a window changes
+"""
+@pytest.mark.parametrize("ma_type", ["SMA", "EMA", "VWAP"])
+def test_chart_matches_strategy(ma_type):
+
+    contract = Contract()
+    contract.symbol = "AAA"
+
+    app = TradingApp(contract, 20, 5, 100, ma_type, spill_dir = None, history_dir = None)
+
+    rng = np.random.default_rng(1)
+    prices = np.round(100 + np.cumsum(rng.normal(0, 0.05, 3000)), 2).tolist()
+    sizes = rng.integers(1, 500, 3000).tolist()
+
+    state = app.publish().instruments[0]
+    chart = ChartSeries(state.long_window, state.short_window, state.ma_type, max_points = 500)
+
+    for i, (price, size) in enumerate(zip(prices, sizes)):
+
+        app.tickPrice(1, 68, price, None)
+        app.tickSize(1, TickTypeEnum.LAST_SIZE, size)
+
+        if i % 700 == 0:
+
+            state = app.publish().instruments[0]
+            chart.update(state)
+
+            if state.long_ma is not None:
+                assert chart.long[-1] == pytest.approx(state.long_ma, rel = 1e-12)
+                assert chart.short[-1] == pytest.approx(state.short_ma, rel = 1e-12)
+
+        if i == 1500:
+            app.instruments[0].ma_type = "EMA" if ma_type != "EMA" else "VWAP"
+            app.instruments[0].long_window = 30
+
+    state = app.publish().instruments[0]
+
+    assert chart.update(state)
+    assert chart.ma_type == state.ma_type and chart.long_window == 30
+    assert chart.long[-1] == pytest.approx(state.long_ma, rel = 1e-12)
+    assert chart.short[-1] == pytest.approx(state.short_ma, rel = 1e-12)
+    assert len(chart.prices) <= 1000 and chart.total == 3000
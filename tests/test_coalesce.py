@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from fakeserver import drive
+
+
+"""
+Ticks replayed by FakeTWS as fast as it can send them, so they queue up
+in the client and the coalescing modes have ticks to fold together
+"""
+@pytest.fixture(scope = "module")
+def prices():
+
+    rng = np.random.default_rng(0)
+
+    return np.round(100 + np.cumsum(rng.normal(0, 0.05, 20000)), 2)
+
+
+def run(prices, coalesce):
+
+    app, stats = drive(prices, rate = None, timeout = 120, coalesce = coalesce)
+
+    counters = app.latency.counters
+    decisions = app.latency.histograms["tick_to_decision"].count
+
+    assert stats["ticks_sent"] == len(prices)
+    assert counters["ticks"] == len(prices)
+    assert counters["dropped"] == 0
+
+    return app, counters, decisions
+
+
+def test_every_tick(prices):
+
+    app, counters, decisions = run(prices, None)
+
+    assert counters["merged"] == 0 and counters["flushes"] == 0
+    assert decisions == len(prices)
+    assert app.instruments[0].ticks.total == len(prices)
+
+    #A tick for a reqId nobody subscribed is dropped
+    app.tickPrice(99, 68, 100.0, None)
+    assert counters["dropped"] == 1 and counters["ticks"] == len(prices)
+
+
+"""
+Every tick either waits for the next flush or is merged into the one
+already waiting, only the last price of each flush is stored
+"""
+def test_latest(prices):
+
+    app, counters, decisions = run(prices, "latest")
+
+    assert counters["merged"] > 0
+    assert counters["merged"] + counters["flushes"] == len(prices)
+    assert decisions == counters["flushes"]
+    assert app.instruments[0].ticks.total == counters["flushes"]
+    assert app.instruments[0].prices[-1] == prices[-1]
+
+
+"""
+Every tick is stored, the strategy runs once per flush
+"""
+def test_batch(prices):
+
+    app, counters, decisions = run(prices, "batch")
+
+    assert counters["merged"] > 0
+    assert counters["merged"] + counters["flushes"] == len(prices)
+    assert decisions == counters["flushes"]
+    assert app.instruments[0].ticks.total == len(prices)
+    assert np.array_equal(app.instruments[0].prices, prices[-len(app.instruments[0].prices):])
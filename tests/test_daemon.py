@@ -0,0 +1,139 @@
+import json
+import urllib.request
+
+from daemon import DEFAULTS, build_app, load_config, serve
+
+CONFIG = {"port": 4002,
+          "instruments": [{"symbol": "AAPL", "long": 10, "short": 3, "quantity": 100,
+                           "ma_type": "EMA"},
+                          {"symbol": "MSFT", "long": 20, "short": 5, "quantity": 50,
+                           "strategy": "breakout"}],
+          "app": {"spill_dir": None, "history_dir": None}}
+
+
+def write_config(tmp_path, config = CONFIG):
+
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+
+    return str(path)
+
+
+def test_config_file(tmp_path):
+
+    config = load_config(write_config(tmp_path))
+
+    assert config["port"] == 4002 and config["host"] == DEFAULTS["host"]
+    assert [spec["symbol"] for spec in config["instruments"]] == ["AAPL", "MSFT"]
+    assert config["http"] == DEFAULTS["http"]
+
+
+"""
+The window and quantity flags change every instrument and keep the list
+"""
+def test_instrument_overrides(tmp_path):
+
+    config = load_config(write_config(tmp_path), {"long": 30, "quantity": 10, "short": None})
+
+    assert [spec["symbol"] for spec in config["instruments"]] == ["AAPL", "MSFT"]
+    assert [spec["long"] for spec in config["instruments"]] == [30, 30]
+    assert [spec["short"] for spec in config["instruments"]] == [3, 5]
+    assert [spec["quantity"] for spec in config["instruments"]] == [10, 10]
+    assert config["instruments"][1]["strategy"] == "breakout"
+
+    #The file (and the defaults) are not changed by the overrides
+    assert load_config(write_config(tmp_path))["instruments"][0]["long"] == 10
+    assert DEFAULTS["instruments"][0]["long"] == 10
+
+
+"""
+--symbol trades that one symbol with the settings of the first instrument
+"""
+def test_symbol_override(tmp_path):
+
+    config = load_config(write_config(tmp_path), {"symbol": "IBM", "short": 4})
+
+    assert config["instruments"] == [{"symbol": "IBM", "long": 10, "short": 4,
+                                      "quantity": 100, "ma_type": "EMA"}]
+
+    config = load_config(None, {"symbol": "IBM"})
+
+    assert config["instruments"] == [dict(DEFAULTS["instruments"][0], symbol = "IBM")]
+
+
+def test_other_overrides(tmp_path):
+
+    config = load_config(write_config(tmp_path), {"clientId": 7, "http_port": 0,
+                                                  "strategy": "meanreversion"})
+
+    assert config["clientId"] == 7
+    assert config["http"]["port"] == 0
+    assert config["app"]["strategy"] == "meanreversion"
+    assert config["app"]["spill_dir"] is None
+
+
+def test_build_app(tmp_path):
+
+    app = build_app(load_config(write_config(tmp_path), {"long": 12}))
+
+    first, second = app.instruments
+
+    assert first.contract.symbol == "AAPL" and first.ma_type == "EMA"
+    assert first.long_window == 12 and second.long_window == 12
+    assert second.contract.symbol == "MSFT" and second.quantity == 50
+    assert second.strategy.name == "breakout"
+
+
+"""
+The strategy parameters of "app" go to every instrument running the
+strategy of the app, an instrument can give its own
+"""
+def test_strategy_params(tmp_path):
+
+    config = {"instruments": [{"symbol": "AAPL", "long": 10, "short": 3, "quantity": 100,
+                               "strategy_params": {"exit": 0.5}},
+                              {"symbol": "MSFT", "long": 20, "short": 5, "quantity": 50},
+                              {"symbol": "IBM", "long": 20, "short": 5, "quantity": 50,
+                               "strategy": "breakout"}],
+              "app": {"spill_dir": None, "history_dir": None, "strategy": "meanreversion"}}
+
+    app = build_app(load_config(write_config(tmp_path, config),
+                                {"strategy_params": {"entry": 2.0}}))
+
+    first, second, third = (instrument.strategy for instrument in app.instruments)
+
+    assert (first.name, first.entry, first.exit) == ("meanreversion", 1.0, 0.5)
+    assert (second.name, second.entry, second.exit) == ("meanreversion", 2.0, 0.0)
+    assert third.name == "breakout"
+
+
+def test_http_state(tmp_path):
+
+    app = build_app(load_config(write_config(tmp_path)))
+
+    for i in range(30):
+        app.tickPrice(1, 68, 100.0 + i, None)
+
+    app.publish()
+
+    server = serve(app, "127.0.0.1", 18765)
+
+    try:
+
+        with urllib.request.urlopen("http://127.0.0.1:18765/state?points=5") as response:
+            current = json.loads(response.read())
+
+        assert current["connected"] is False
+        assert current["instruments"][0]["ticks"] == 30
+        assert current["instruments"][0]["prices"] == [125.0, 126.0, 127.0, 128.0, 129.0]
+        assert current["instruments"][1]["ticks"] == 0
+
+        with urllib.request.urlopen("http://127.0.0.1:18765/metrics") as response:
+            metrics = response.read().decode()
+
+        assert 'tradingapp_instrument_ticks{symbol="AAPL"} 30.0' in metrics
+
+    finally:
+
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,145 @@
+import math
+
+import numpy as np
+import pytest
+
+from indicators import RollingEMA, RollingSMA, RollingVWAP, make_indicator
+
+"""
+Every rolling indicator is checked after every price against the average
+computed from scratch over the prices (and sizes) in its window
+"""
+def walk(seed, n = 3000):
+
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 0.05, n))
+    sizes = rng.integers(0, 500, n).astype(float)
+
+    return prices, sizes
+
+
+def brute_ema(prices, window):
+
+    alpha = 2.0 / (window + 1)
+    values = []
+
+    for i in range(len(prices)):
+        if i < window:
+            values.append(float(np.mean(prices[:i + 1])))
+        else:
+            values.append(values[-1] + alpha * (prices[i] - values[-1]))
+
+    return values
+
+
+WINDOWS = [1, 2, 7, 50, 400]
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_sma(window):
+
+    prices, sizes = walk(window)
+    sma = RollingSMA(window)
+
+    for i, (price, size) in enumerate(zip(prices, sizes)):
+
+        value = sma.update(price, size)
+
+        assert value == pytest.approx(np.mean(prices[max(0, i + 1 - window):i + 1]),
+                                      rel = 1e-12)
+        assert sma.ready == (i + 1 >= window)
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_ema(window):
+
+    prices, sizes = walk(window)
+    ema = RollingEMA(window)
+    expected = brute_ema(prices, window)
+
+    for i, (price, size) in enumerate(zip(prices, sizes)):
+
+        assert ema.update(price, size) == pytest.approx(expected[i], rel = 1e-12)
+        assert ema.ready == (i + 1 >= window)
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_vwap(window):
+
+    prices, sizes = walk(window)
+    vwap = RollingVWAP(window)
+
+    for i, (price, size) in enumerate(zip(prices, sizes)):
+
+        value = vwap.update(price, size)
+
+        lo = max(0, i + 1 - window)
+        volume = sizes[lo:i + 1].sum()
+
+        if volume > 0:
+            expected = (prices[lo:i + 1] * sizes[lo:i + 1]).sum() / volume
+        else:
+            expected = prices[lo:i + 1].mean()
+
+        assert value == pytest.approx(expected, rel = 1e-12)
+        assert vwap.ready == (i + 1 >= window)
+
+
+"""
+The size comes after its price: a VWAP updated with no size and resized
+once the size comes ends up where updating with the size would have
+"""
+@pytest.mark.parametrize("window", WINDOWS)
+def test_vwap_resize(window):
+
+    prices, sizes = walk(window)
+    late = RollingVWAP(window)
+    direct = RollingVWAP(window)
+
+    for price, size in zip(prices, sizes):
+
+        late.update(price, 0.0)
+        changed = late.resize(size)
+
+        direct.update(price, size)
+
+        assert late.value == pytest.approx(direct.value, rel = 1e-12)
+        assert not changed or size > 0
+
+    assert RollingSMA(3).resize(10.0) is False
+    assert RollingEMA(3).resize(10.0) is False
+    assert RollingVWAP(3).resize(10.0) is False
+
+
+"""
+Without any volume in the window (ticks without sizes, history without
+volume) the VWAP is the simple average instead of dividing by zero
+"""
+def test_vwap_zero_volume():
+
+    vwap = RollingVWAP(3)
+
+    for price in (10.0, 11.0, 12.0, 13.0):
+        vwap.update(price, 0.0)
+        assert not math.isnan(vwap.value)
+
+    assert vwap.value == pytest.approx(12.0)
+
+    vwap.update(20.0, 100.0)
+    assert vwap.value == pytest.approx(20.0)
+
+    #The sized tick leaves the window again
+    for price in (1.0, 2.0, 3.0):
+        vwap.update(price, 0.0)
+
+    assert vwap.value == pytest.approx(2.0)
+
+
+def test_make_indicator():
+
+    assert isinstance(make_indicator("sma", 5), RollingSMA)
+    assert isinstance(make_indicator("EMA", 5), RollingEMA)
+    assert isinstance(make_indicator("Vwap", 5), RollingVWAP)
+
+    with pytest.raises(ValueError):
+        make_indicator("WMA", 5)
@@ -0,0 +1,127 @@
+import json
+
+import numpy as np
+import pytest
+
+from latency import LatencyHistogram, LatencyMonitor
+
+
+"""
+Every reported percentile is within the relative error of the buckets
+(1/2**(sub_bits-1)) below the exact one, over values spanning many
+powers of two
+"""
+@pytest.mark.parametrize("sub_bits", [5, 7])
+def test_percentile_accuracy(sub_bits):
+
+    rng = np.random.default_rng(sub_bits)
+    values = np.exp(rng.uniform(0, np.log(1e10), 20000)).astype(np.int64)
+
+    histogram = LatencyHistogram(sub_bits)
+    for value in values.tolist():
+        histogram.record(value)
+
+    error = 1.0 / (1 << (sub_bits - 1))
+    ordered = np.sort(values)
+
+    ps = [0.1, 1, 10, 25, 50, 75, 90, 99, 99.9, 100]
+    reported = histogram.percentiles(*ps)
+
+    for p, value in zip(ps, reported):
+
+        exact = ordered[max(1, int(round(len(values) * p / 100.0))) - 1]
+
+        assert value <= exact
+        assert value >= exact * (1 - error) - 1, p
+        assert histogram.percentile(p) == value
+
+    assert histogram.count == len(values)
+    assert histogram.min == ordered[0] and histogram.max == ordered[-1]
+    assert histogram.summary()["mean_ns"] == pytest.approx(values.mean())
+
+
+def test_small_values_are_exact():
+
+    histogram = LatencyHistogram()
+
+    for value in range(100):
+        histogram.record(value)
+
+    assert histogram.percentiles(1, 50, 100) == [0, 49, 99]
+
+
+def test_clamped_and_empty():
+
+    histogram = LatencyHistogram(max_bits = 20)
+
+    assert histogram.percentiles(50, 99) == [0, 0]
+    assert histogram.summary() == {"count": 0}
+
+    histogram.record(-5)
+    histogram.record(1 << 30)
+
+    assert histogram.min == 0 and histogram.max == (1 << 20) - 1
+
+
+"""
+An order is pending from its submit until it is filled or closed, acked
+once, and counted in exactly one of fills or cancelled
+"""
+def test_order_accounting():
+
+    monitor = LatencyMonitor()
+
+    monitor.tick(1000, queued = 3)
+    monitor.decision(1500)
+
+    for orderId in (1, 2, 3, 4):
+        monitor.submitted(orderId, 2000 + orderId)
+
+    assert monitor.counters["orders"] == 4 and len(monitor.pending) == 4
+
+    monitor.ack(1, 3000)
+    monitor.ack(1, 3500)
+    monitor.ack(2, 3100)
+    monitor.ack(99, 3100)
+
+    assert monitor.counters["acks"] == 2
+    assert monitor.acked == {1, 2}
+
+    monitor.fill(1, 5001)
+    monitor.fill(1, 6000)
+    monitor.closed(2)
+    monitor.closed(2)
+    monitor.fill(3, 4003)
+
+    assert monitor.counters["fills"] == 2
+    assert monitor.counters["cancelled"] == 1
+    assert monitor.pending == {4: 2004}
+    assert monitor.acked == set()
+
+    snapshot = monitor.snapshot()
+
+    assert snapshot["open_orders"] == 1
+    assert snapshot["max_queued"] == 3
+    assert snapshot["latency"]["tick_to_decision"]["p50_ns"] == 500
+    assert snapshot["latency"]["submit_to_ack"]["count"] == 2
+    assert snapshot["latency"]["submit_to_fill"]["min_ns"] == 2000
+    assert snapshot["latency"]["submit_to_fill"]["max_ns"] == 3000
+
+    #An ack after the fill is not counted
+    monitor.ack(3, 9000)
+    assert monitor.counters["acks"] == 2
+
+
+def test_dump(tmp_path):
+
+    monitor = LatencyMonitor()
+    monitor.tick(0)
+    monitor.decision(250)
+
+    path = tmp_path / "latency.json"
+    monitor.dump(str(path), buckets = True)
+
+    result = json.loads(path.read_text())
+
+    assert result["ticks"] == 1
+    assert result["buckets"]["tick_to_decision"] == {"250": 1}
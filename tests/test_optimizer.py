@@ -0,0 +1,119 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import optimizer
+from backtest import run_vectorized
+from optimizer import RESULT_DTYPE, grid, optimize, parse_range, random_sample
+
+SharedMemory = shared_memory.SharedMemory
+
+
+def walk(seed = 0, n = 3000):
+
+    rng = np.random.default_rng(seed)
+
+    return np.round(100 + np.cumsum(rng.normal(0, 0.05, n)), 2)
+
+
+"""
+Records the names of the segments optimize creates, to check that each
+one is gone afterwards
+"""
+@pytest.fixture
+def segments(monkeypatch):
+
+    created = []
+
+    class Recording(SharedMemory):
+
+        def __init__(self, name = None, create = False, size = 0):
+
+            SharedMemory.__init__(self, name, create, size)
+
+            if create:
+                created.append(self.name)
+
+    monkeypatch.setattr(optimizer.shared_memory, "SharedMemory", Recording)
+
+    return created
+
+
+def assert_unlinked(names):
+
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name = name)
+
+
+def test_grid_results(segments):
+
+    prices = walk()
+    combos = grid([5, 10, 20], [2, 5, 10], [100, 200])
+
+    assert (10, 10, 100) not in combos and (20, 10, 200) in combos
+    assert len(combos) == 12
+
+    table = optimize(prices, combos, processes = 2)
+
+    assert table.dtype == RESULT_DTYPE and len(table) == len(combos)
+    assert np.all(np.diff(table["total"]) <= 0)
+
+    for row in table:
+
+        stats = run_vectorized(prices, int(row["long"]), int(row["short"])).stats()
+
+        assert row["trades"] == stats["trades"]
+        assert row["total"] == pytest.approx(stats["total"] * row["quantity"])
+        assert row["max"] == pytest.approx(stats["max"] * row["quantity"])
+
+    #The same sweep gives the same table
+    again = optimize(prices, combos, processes = 1)
+    assert np.array_equal(again, table)
+
+    assert len(segments) == 2
+    assert_unlinked(segments)
+
+
+def test_random_search(segments):
+
+    longs, shorts, quantities = parse_range("5:30:5"), parse_range("2:8:2"), parse_range("100")
+
+    sample = random_sample(longs, shorts, quantities, 8, seed = 3)
+
+    assert sample == random_sample(longs, shorts, quantities, 8, seed = 3)
+    assert len(set(sample)) == 8
+    assert set(sample) <= set(grid(longs, shorts, quantities))
+    assert len(random_sample(longs, shorts, quantities, 1000, seed = 3)) == 22
+
+    prices = walk(1)
+    table = optimize(prices, sample, processes = 2, strategy = "breakout")
+    full = optimize(prices, grid(longs, shorts, quantities), processes = 2, strategy = "breakout")
+
+    #Each sampled row is the row of the full grid
+    rows = {(r["long"], r["short"], r["quantity"]): r for r in full}
+
+    for row in table:
+        assert row == rows[(row["long"], row["short"], row["quantity"])]
+
+    assert_unlinked(segments)
+
+
+"""
+The shared price array is unlinked even when a worker fails
+"""
+def test_unlinked_on_error(segments):
+
+    with pytest.raises(ValueError):
+        optimize(walk(), [(10, 3, 100)], processes = 1, strategy = "unknown")
+
+    assert len(segments) == 1
+    assert_unlinked(segments)
+
+
+def test_parse_range():
+
+    assert parse_range("2:10:4") == [2, 6, 10]
+    assert parse_range("3:5") == [3, 4, 5]
+    assert parse_range("7,1,4") == [7, 1, 4]
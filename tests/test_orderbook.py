@@ -0,0 +1,204 @@
+import time
+
+import numpy as np
+
+from ibapi.contract import Contract
+from ibapi.order import Order
+
+from orderbook import (CANCELLED, FILLED, PARTIAL, QUEUED, SENT, WORKING, OrderBook,
+                       TokenBucket)
+from backtest import BacktestApp
+from IBTradingApp import TradingApp
+
+
+def contract(symbol = "AAA"):
+
+    c = Contract()
+    c.symbol = symbol
+
+    return c
+
+
+def order(action = "BUY", quantity = 100):
+
+    o = Order()
+    o.action = action
+    o.totalQuantity = quantity
+
+    return o
+
+
+def book(rate = None, burst = None):
+
+    sent = []
+
+    return OrderBook(lambda orderId, c, o: sent.append(orderId), rate, burst), sent
+
+
+def test_fill_through_executions():
+
+    orders, sent = book()
+    state = orders.submit(1, contract(), order("BUY", 100))
+
+    assert sent == [1] and state.status == SENT
+    assert orders.exposure("AAA", include_open = True) == 100
+    assert orders.open_orders("AAA") == 1 and not orders.settled("AAA")
+
+    orders.on_open(1)
+    assert state.status == WORKING
+
+    orders.on_execution(1, "e1", 40, 10.0)
+    assert state.status == PARTIAL
+    assert orders.exposure("AAA") == 40
+    assert orders.exposure("AAA", include_open = True) == 100
+
+    #A repeated execution is not counted twice
+    assert orders.on_execution(1, "e1", 40, 10.0) is None
+
+    orders.on_execution(1, "e2", 60, 11.0)
+    assert state.status == FILLED
+    assert state.avgFillPrice == 10.6
+    assert orders.exposure("AAA") == 100 and orders.settled("AAA")
+
+    #Done and fully executed, so the order is dropped and late callbacks
+    #for it are ignored
+    assert orders.get(1) is None
+    assert orders.on_status(1, "Submitted", 100, 10.6) is None
+    assert orders.counters["filled"] == 1
+
+
+"""
+A status can report a fill before its executions come, the order stays
+in the book (and its symbol unsettled) until they do
+"""
+def test_status_before_executions():
+
+    orders, sent = book()
+    state = orders.submit(1, contract(), order("SELL", 50))
+
+    orders.on_status(1, "Filled", 50, 20.0)
+
+    assert state.status == FILLED
+    assert orders.get(1) is state
+    assert not orders.settled("AAA")
+    assert orders.exposure("AAA") == 0
+
+    orders.on_execution(1, "e1", 50, 20.0)
+
+    assert orders.exposure("AAA") == -50
+    assert orders.settled("AAA")
+    assert orders.get(1) is None
+
+
+"""
+Updates only move an order forward, a late status cannot undo a fill
+"""
+def test_no_going_back():
+
+    orders, sent = book()
+    state = orders.submit(1, contract(), order())
+
+    orders.on_status(1, "Submitted", 0, 0.0)
+    orders.on_status(1, "PreSubmitted", 0, 0.0)
+    assert state.status == WORKING
+
+    orders.on_status(1, "Cancelled", 30, 5.0)
+    assert state.status == CANCELLED
+    assert orders.exposure("AAA", include_open = True) == 0
+
+    orders.on_status(1, "Submitted", 30, 5.0)
+    assert state.status == CANCELLED
+
+    orders.on_execution(1, "e1", 30, 5.0)
+    assert state.status == CANCELLED
+    assert orders.exposure("AAA", include_open = True) == 30
+    assert orders.settled("AAA") and orders.get(1) is None
+    assert orders.counters["cancelled"] == 1
+
+
+def test_throttle():
+
+    orders, sent = book(rate = 1000, burst = 3)
+
+    states = [orders.submit(i, contract(), order()) for i in range(10)]
+
+    assert sent == [0, 1, 2]
+    assert [s.status for s in states[3:]] == [QUEUED] * 7
+    assert orders.counters["throttled"] == 7
+    assert orders.counters["max_queued"] == 7
+
+    #Cancelled before it went out, the others keep their turn
+    assert orders.cancel_queued(5) is states[5]
+    assert states[5].status == CANCELLED and orders.get(5) is None
+    assert orders.cancel_queued(0) is None
+
+    deadline = time.monotonic() + 5
+
+    while not orders.pump() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    assert sent == [0, 1, 2, 3, 4, 6, 7, 8, 9]
+    assert orders.counters["sent"] == 9
+    assert orders.open_orders("AAA") == 9
+    assert orders.exposure("AAA", include_open = True) == 900
+
+
+def test_token_bucket():
+
+    bucket = TokenBucket(100, 5)
+
+    assert sum(bucket.take() for _ in range(20)) == 5
+
+    time.sleep(0.05)
+
+    assert 3 <= sum(bucket.take() for _ in range(20)) <= 5
+
+
+"""
+A session of fills leaves no orders behind in the book or in byOrderId
+"""
+def test_app_drops_done_orders():
+
+    rng = np.random.default_rng(3)
+    prices = np.round(100 + np.cumsum(rng.normal(0, 0.05, 5000)), 2)
+
+    app = BacktestApp(contract(), 10, 3, 100)
+
+    for price in prices.tolist():
+        app.tickPrice(1, 68, price, None)
+
+    assert app.orders.counters["filled"] > 50
+    assert app.orders.orders == {} and app.byOrderId == {}
+
+
+"""
+An order the rate limit holds back is cancelled once the strategy wants
+to keep the position held after all
+"""
+def test_app_cancels_queued_order():
+
+    app = TradingApp(contract(), 3, 1, 100, spill_dir = None, history_dir = None,
+                     order_rate = 1)
+    app.nextValidId(1)
+
+    placed = []
+    app.placeOrder = lambda orderId, c, o: placed.append(orderId)
+    app.orders.bucket.tokens = 0
+    app.orders.bucket.rate = 1e-9
+
+    instrument = app.instruments[0]
+
+    for price in (10.0, 10.0, 10.0, 11.0):
+        app.tickPrice(1, 68, price, None)
+
+    assert not instrument.noOpenOrders
+    assert app.orders.get(instrument.currentOrderId).status == QUEUED
+
+    for price in (9.0, 8.0):
+        app.tickPrice(1, 68, price, None)
+
+    assert instrument.noOpenOrders
+    assert instrument.currentOrderStatus == "Cancelled"
+    assert app.orders.counters["cancelled"] == 1
+    assert app.orders.orders == {} and app.byOrderId == {}
+    assert app.orders.pump() and placed == []
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from recorder import Recorder, load_executions, load_ticks
+from tickstore import TICK_DTYPE, TickStore, load_spilled
+from warmstart import HistoryCache
+
+
+def test_round_trip(tmp_path):
+
+    recorder = Recorder(str(tmp_path)).start()
+
+    for i in range(1000):
+        recorder.tick("AAA", 1000.0 + i, 100.0 + i / 100, 0.0)
+        recorder.size("AAA", float(i % 7 + 1))
+
+        if i % 3 == 0:
+            recorder.tick("BBB", 2000.0 + i, 50.0, 5.0)
+
+    recorder.execution("AAA", 1500.0, 7, "0001.01", "BOT", 101.5, 100.0)
+    recorder.flush()
+
+    ticks = load_ticks(recorder.path("AAA"))
+
+    assert len(ticks) == 1000
+    assert np.array_equal(ticks["time"], 1000.0 + np.arange(1000))
+    assert np.allclose(ticks["price"], 100.0 + np.arange(1000) / 100)
+    assert np.array_equal(ticks["size"], np.arange(1000) % 7 + 1.0)
+
+    #A tick without a size is written with the one it was given
+    other = load_ticks(recorder.path("BBB"))
+    assert len(other) == 334 and (other["size"] == 5.0).all()
+
+    execs = load_executions(recorder.path("AAA", "execs"))
+    assert len(execs) == 1
+    assert execs[0]["execId"] == b"0001.01" and execs[0]["side"] == b"BOT"
+    assert execs[0]["price"] == 101.5 and execs[0]["shares"] == 100.0
+
+    recorder.close()
+
+
+"""
+A record torn by a crash is left out when reading, and cut off before
+the next session appends, so the records after it are not shifted
+"""
+def test_torn_tail(tmp_path):
+
+    recorder = Recorder(str(tmp_path)).start()
+    for i in range(10):
+        recorder.tick("AAA", float(i), 100.0, 1.0)
+    recorder.close()
+
+    path = recorder.path("AAA")
+
+    with open(path, "ab") as f:
+        f.write(b"\x01" * (TICK_DTYPE.itemsize // 2))
+
+    assert len(load_ticks(path)) == 10
+
+    recorder = Recorder(str(tmp_path)).start()
+    for i in range(10, 15):
+        recorder.tick("AAA", float(i), 200.0, 2.0)
+    recorder.close()
+
+    ticks = load_ticks(path)
+
+    assert len(ticks) == 15
+    assert np.array_equal(ticks["time"], np.arange(15.0))
+    assert (ticks["price"][10:] == 200.0).all()
+
+
+def test_torn_tail_spill_and_cache(tmp_path):
+
+    spill = str(tmp_path / "spill.bin")
+
+    with open(spill, "wb") as f:
+        f.write(b"\x01" * 5)
+
+    store = TickStore(retention = 4, spill_path = spill)
+    for i in range(12):
+        store.append(float(i), 100.0 + i)
+
+    spilled = load_spilled(spill)
+    assert np.array_equal(spilled["time"], np.arange(float(store.spilled)))
+
+    cache = HistoryCache(str(tmp_path / "history"))
+    bars = np.zeros(3, dtype = TICK_DTYPE)
+    bars["time"] = [1.0, 2.0, 3.0]
+
+    cache.append("AAA", bars)
+    with open(cache.path("AAA"), "ab") as f:
+        f.write(b"\x01" * 7)
+
+    bars["time"] += 3
+    cache.append("AAA", bars)
+
+    assert np.array_equal(cache.load("AAA")["time"], np.arange(1.0, 7.0))
+
+
+"""
+If the writer dies, flush raises its error instead of hanging
+"""
+def test_writer_error(tmp_path):
+
+    recorder = Recorder(str(tmp_path)).start()
+
+    def fail(kind, symbol):
+        raise OSError("disk full")
+
+    recorder._file = fail
+    recorder.tick("AAA", 1.0, 100.0)
+    recorder.size("AAA", 1.0)
+
+    with pytest.raises(RuntimeError) as info:
+        recorder.flush(timeout = 5.0)
+
+    assert isinstance(info.value.__cause__, OSError)
+
+    with pytest.raises(RuntimeError):
+        recorder.close()
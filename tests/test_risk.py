@@ -0,0 +1,120 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ibapi.contract import Contract
+
+from fakeserver import FakeTWS
+from IBTradingApp import TradingApp
+from risk import RiskBook
+
+"""
+The position in the risk book is built from the fills only, whatever
+order TWS sends the position and execution of a fill in and however
+often the executions of the day are replayed
+"""
+
+
+def _prices(n = 400, seed = 11):
+
+    rng = np.random.default_rng(seed)
+
+    return np.round(100 + np.cumsum(rng.normal(0, 0.2, n)), 2)
+
+
+def _settle(app):
+
+    while app.msg_queue.qsize() > 0:
+        time.sleep(0.01)
+
+    time.sleep(0.2)
+
+
+"""
+Runs a TradingApp against the server until every tick was replayed,
+then asks for the day's executions once more before disconnecting
+"""
+def _run(server):
+
+    server.start()
+
+    contract = Contract()
+    contract.symbol = "FAKE"
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+
+    app = TradingApp(contract, 10, 3, 100, spill_dir = None)
+    app.connect(server.host, server.port, clientId = 0)
+
+    threading.Thread(target = app.run, daemon = True).start()
+
+    #Positions first, so the executions replayed by subscribe come after
+    #a position that already holds them
+    app.reqMarketDataType(3)
+    app.reqPositions()
+    app.subscribe()
+
+    server.done.wait(60)
+    _settle(app)
+
+    app.reconcile()
+    _settle(app)
+
+    app.disconnect()
+    server.stop()
+
+    return app, server.sessions[0]
+
+
+@pytest.mark.parametrize("position_first", [False, True])
+def test_position_built_from_fills(position_first):
+
+    app, session = _run(FakeTWS(_prices(), port = 0, rate = 1000, position_first = position_first))
+
+    assert app.orders.counters["filled"] > 2
+    assert app.risk.shares("FAKE") == session.positions["FAKE"][0]
+    assert app.risk.shares("FAKE") == app.orders.exposure("FAKE")
+    assert app.risk.counters["corrected"] == 0
+
+
+@pytest.mark.parametrize("position_first", [False, True])
+def test_executions_before_the_session_are_not_counted_twice(position_first):
+
+    stamp = time.strftime("%Y%m%d  %H:%M:%S", time.localtime(time.time() - 86400))
+    server = FakeTWS(_prices(), port = 0, rate = 1000, position_first = position_first,
+                     positions = {"FAKE": (300, 90.0)},
+                     executions = [(7, "FAKE", "00000007.01", stamp, "BOT", 300, 90.0)])
+
+    app, session = _run(server)
+
+    assert app.orders.counters["filled"] > 2
+    assert app.risk.shares("FAKE") == session.positions["FAKE"][0]
+    assert app.risk.shares("FAKE") == 300 + app.orders.exposure("FAKE")
+    assert app.risk.counters["corrected"] == 0
+
+    #The fill from before the session is still in the ledger
+    assert "00000007.01" in app.ledger.execIds
+
+
+def test_report_checks_settled_positions():
+
+    risk = RiskBook()
+
+    assert risk.report("A", 200, 10.0)
+    assert risk.shares("A") == 200
+    assert risk.counters["corrected"] == 0
+
+    risk.fill("A", 100, 12.0)
+    assert not risk.report("A", 300, 11.0)
+
+    #Sent before the execution of a fill, not compared
+    assert not risk.report("A", 400, 11.0, settled = False)
+    assert risk.shares("A") == 300
+
+    assert risk.report("A", 250, 11.0)
+    assert risk.shares("A") == 250
+    assert risk.get("A").avgCost == 11.0
+    assert risk.counters["corrected"] == 1
@@ -0,0 +1,215 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from ibapi.contract import Contract
+
+from fakeserver import FakeTWS
+from instrument import Instrument
+from shard import (LONG_WINDOW, MA_TYPE, SHORT_WINDOW, SIZE, GatewayApp, TickRing, _MA_TYPES,
+                   _work)
+from strategies import LONG, make_strategy
+
+
+def contract(symbol):
+
+    c = Contract()
+    c.symbol = symbol
+    c.secType = "STK"
+    c.exchange = "SMART"
+    c.currency = "USD"
+
+    return c
+
+
+def walk(seed, n):
+
+    rng = np.random.default_rng(seed)
+
+    return (np.round(100 + np.cumsum(rng.normal(0, 0.05, n)), 2),
+            rng.integers(1, 500, n).astype(float))
+
+
+def test_ring():
+
+    ring = TickRing(8, slots = 2)
+
+    for i in range(10):
+        ring.put(i, float(i), 100.0 + i)
+
+    assert len(ring) == 8 and ring.dropped == 2
+    assert ring.take(5)["reqId"].tolist() == [0, 1, 2, 3, 4]
+
+    ring.put(20, 1.0, 1.0, 7.0, SIZE)
+    ring.put(21, 1.0, 1.0)
+
+    batch = ring.take()
+
+    assert batch["reqId"].tolist() == [5, 6, 7, 20, 21]
+    assert batch["kind"].tolist() == [0, 0, 0, SIZE, 0]
+    assert batch["size"][3] == 7.0
+    assert np.isnan(ring.values).all() and ring.values.shape == (2, 2)
+
+    ring.close()
+
+
+"""
+A worker run on a thread keeps the same averages and targets as an
+Instrument fed the same ticks, sizes and settings directly
+"""
+def test_worker():
+
+    specs = [(1, 10, 3, "SMA", "crossover", {}, 2000),
+             (2, 20, 5, "VWAP", "meanreversion", {"entry": 0.5, "exit": 0.2}, 2000)]
+
+    ring = TickRing(1024, slots = len(specs))
+    intents = queue.Queue()
+
+    thread = threading.Thread(target = _work, args = (ring.name, 1024, specs, intents))
+    thread.start()
+
+    reference = {}
+
+    for reqId, long_window, short_window, ma_type, strategy, params, retention in specs:
+        instrument = Instrument(None, long_window, short_window, 0, ma_type, retention)
+        instrument.strategy = make_strategy(strategy, instrument, **params)
+        reference[reqId] = instrument
+
+    prices, sizes = walk(0, 1500)
+
+    for i, (price, size) in enumerate(zip(prices.tolist(), sizes.tolist())):
+
+        if i == 700:
+            ring.put(1, 0.0, 25.0, 0.0, LONG_WINDOW)
+            ring.put(1, 0.0, _MA_TYPES.index("EMA"), 0.0, MA_TYPE)
+            ring.put(2, 0.0, 8.0, 0.0, SHORT_WINDOW)
+            reference[1].long_window = 25
+            reference[1].ma_type = "EMA"
+            reference[2].short_window = 8
+
+        for reqId, instrument in reference.items():
+            ring.put(reqId, float(i), price)
+            ring.put(reqId, 0.0, 0.0, size, SIZE)
+            instrument.add_tick(float(i), price)
+            instrument.add_size(size)
+
+        while len(ring) > 512:
+            time.sleep(0.001)
+
+    deadline = time.monotonic() + 10
+
+    while len(ring) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    time.sleep(0.2)
+
+    latest = {}
+
+    while not intents.empty():
+        reqId, target = intents.get()
+        latest[reqId] = target
+
+    for slot, (reqId, instrument) in enumerate(reference.items()):
+
+        assert ring.values[slot, 0] == instrument.long_ma.value
+        assert ring.values[slot, 1] == instrument.short_ma.value
+
+        target = instrument.strategy.target()
+        if target is not None:
+            assert latest[reqId] == target
+
+    assert ring.dropped == 0
+
+    ring.stop()
+    thread.join(5)
+    ring.close()
+
+
+"""
+The latest target of the worker stays pending in the gateway, one a risk
+check held back is placed on a later tick
+"""
+def test_rejected_target_is_placed_later():
+
+    app = GatewayApp(contract("AAA"), 10, 3, 100, workers = 1, spill_dir = None,
+                     history_dir = None, order_rate = None, max_position = 50)
+    app.nextValidId(1)
+
+    placed = []
+    app.placeOrder = lambda orderId, c, o: placed.append(orderId)
+
+    instrument = app.instruments[0]
+    app.tickPrice(1, 68, 100.0, None)
+
+    instrument.strategy.latest = LONG
+    app.run_strategy(instrument)
+
+    assert placed == [] and app.risk.counters["rejected"] == 1
+
+    app.risk.max_position = None
+    app.tickPrice(1, 68, 100.5, None)
+
+    assert placed == [1]
+
+
+"""
+Against FakeTWS: every tick reaches the workers, the gateway shows the
+averages they computed and a window change reaches them
+"""
+def test_gateway():
+
+    prices, sizes = walk(2, 2000)
+
+    server = FakeTWS(prices, port = 0, rate = 2000).start()
+
+    app = GatewayApp(contract("A"), 10, 3, 100, workers = 2, spill_dir = None,
+                     history_dir = None, tick_retention = 5000)
+    app.add_instrument(contract("B"), 20, 5, 100, "VWAP")
+    app.start_workers()
+
+    try:
+
+        app.connect(server.host, server.port, clientId = 0)
+        threading.Thread(target = app.run, daemon = True).start()
+
+        app.reqMarketDataType(3)
+        app.subscribe()
+
+        assert server.done.wait(60)
+
+        app.post(setattr, app.instruments[0], "long_window", 30)
+
+        deadline = time.monotonic() + 10
+
+        while (any(len(ring) for ring in app.rings) or not app.msg_queue.empty()) \
+                and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        time.sleep(0.5)
+
+        assert app.dropped() == 0
+
+        for instrument in app.instruments:
+
+            reference = Instrument(None, instrument.long_window, instrument.short_window, 0,
+                                   instrument.ma_type, 5000)
+
+            for t, price, size in zip(instrument.times.tolist(), instrument.prices.tolist(),
+                                      instrument.ticks.sizes.tolist()):
+                reference.add_tick(t, price, size)
+
+            assert instrument.long_ma.ready and instrument.short_ma.ready
+            assert abs(instrument.long_ma.value - reference.long_ma.value) < 1e-9
+            assert abs(instrument.short_ma.value - reference.short_ma.value) < 1e-9
+
+        assert app.instruments[0].long_window == 30
+
+        snapshot = app.publish()
+        assert snapshot.instruments[1].long_ma == app.instruments[1].long_ma.value
+
+    finally:
+
+        app.disconnect()
+        server.stop()
@@ -0,0 +1,141 @@
+import numpy as np
+
+from ibapi.contract import Contract
+
+from instrument import Instrument
+from snapshot import Delta, SnapshotPublisher
+from tickstore import load_spilled
+
+
+def make_instrument(retention, spill_path = None):
+
+    contract = Contract()
+    contract.symbol = "AAA"
+
+    return Instrument(contract, 10, 3, 100, tick_retention = retention, spill_path = spill_path)
+
+
+def ticks(seed, n):
+
+    rng = np.random.default_rng(seed)
+
+    return (np.round(100 + np.cumsum(rng.normal(0, 0.05, n)), 2),
+            rng.integers(1, 500, n).astype(float))
+
+
+def test_delta_since():
+
+    first = Delta(0, np.arange(5.0))
+    second = Delta(5, np.arange(5.0, 8.0), first)
+    third = Delta(8, np.arange(8.0, 12.0), second)
+
+    assert third.end == 12
+    assert third.since(0).tolist() == list(range(12))
+    assert third.since(6).tolist() == list(range(6, 12))
+    assert third.since(8).tolist() == list(range(8, 12))
+    assert third.since(12).tolist() == []
+    assert third.latest(3).tolist() == [9, 10, 11]
+
+    #Cut chain: only what it still holds
+    second.previous = None
+    assert third.since(2).tolist() == list(range(5, 12))
+
+
+"""
+A reader that takes the new ticks after every publish gets the full tick
+sequence, in order, across spills of the TickStore. Ticks that arrive
+faster than the store holds them between two publishes are skipped, and
+whatever the reader gets is still the right part of the sequence
+"""
+def test_incremental_reader(tmp_path):
+
+    spill = str(tmp_path / "AAA_ticks.bin")
+    instrument = make_instrument(64, spill)
+    publisher = SnapshotPublisher(retention = 1000)
+
+    prices, sizes = ticks(0, 5000)
+    rng = np.random.default_rng(1)
+
+    seen = 0
+    fed = 0
+    gaps = 0
+
+    while fed < len(prices):
+
+        burst = int(rng.integers(0, 100))
+        if rng.random() < 0.1:
+            burst = 200
+
+        for price, size in zip(prices[fed:fed + burst].tolist(), sizes[fed:fed + burst].tolist()):
+            instrument.add_tick(float(fed), price, size)
+            fed += 1
+
+        state = publisher.publish([instrument]).instruments[0]
+
+        assert state.total == fed
+
+        if state.ticks is None:
+            continue
+
+        records = state.ticks.since(seen)
+        start = state.total - len(records)
+
+        assert start >= seen
+        gaps += start > seen
+
+        assert np.array_equal(records["price"], prices[start:state.total])
+        assert np.array_equal(records["size"], sizes[start:state.total])
+        assert np.array_equal(records["time"], np.arange(start, state.total, dtype = float))
+
+        seen = state.total
+
+    #Only the bursts above the retention of the store left gaps
+    assert gaps > 0
+    assert instrument.ticks.spilled > 0
+
+    #The spill file and the last snapshot together hold every tick
+    spilled = load_spilled(spill)
+    held = state.ticks.since(instrument.ticks.spilled)
+
+    assert np.array_equal(spilled["price"], prices[:len(spilled)])
+    assert np.array_equal(np.concatenate((spilled["price"], held["price"])),
+                          prices[:len(spilled) + len(held)])
+    assert len(spilled) + len(held) == len(prices)
+
+
+"""
+Without gaps the reader gets every tick exactly once, and one that only
+reads the latest snapshot now and then gets the ticks still held by the
+chain, which is cut behind "retention" records
+"""
+def test_lagging_reader():
+
+    instrument = make_instrument(10000)
+    publisher = SnapshotPublisher(retention = 300)
+
+    prices, sizes = ticks(2, 3000)
+    collected = []
+    seen = 0
+
+    for i, (price, size) in enumerate(zip(prices.tolist(), sizes.tolist())):
+
+        instrument.add_tick(float(i), price, size)
+
+        if i % 37 == 0:
+
+            state = publisher.publish([instrument]).instruments[0]
+            collected.append(state.ticks.since(seen)["price"])
+            seen = state.total
+
+            if i % 370 == 0:
+                lagging = state.ticks.since(0)
+                assert len(lagging) >= min(300, state.total)
+                assert np.array_equal(lagging["price"], prices[state.total - len(lagging):state.total])
+
+    state = publisher.publish([instrument]).instruments[0]
+    collected.append(state.ticks.since(seen)["price"])
+
+    assert np.array_equal(np.concatenate(collected), prices)
+
+    #Nothing new: the same Delta is handed out again
+    assert publisher.publish([instrument]).instruments[0].ticks is state.ticks
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from tickstore import TICK_DTYPE, TickStore, load_spilled
+
+
+def fill(store, n, start = 0):
+
+    for i in range(start, start + n):
+        store.append(float(i), 100.0 + i, float(i % 5))
+
+
+"""
+Once the arrays (twice the retention) are full the oldest half goes to
+the spill file and the newest "retention" ticks move to the front
+"""
+def test_spill_half(tmp_path):
+
+    path = str(tmp_path / "ticks" / "AAA_ticks.bin")
+    store = TickStore(retention = 4, spill_path = path)
+
+    fill(store, 8)
+
+    assert store.count == 8 and store.spilled == 0
+    assert not (tmp_path / "ticks").exists()
+
+    fill(store, 1, 8)
+
+    assert store.count == 5 and store.spilled == 4 and store.total == 9
+    assert store.times.tolist() == [4.0, 5.0, 6.0, 7.0, 8.0]
+    assert store.prices.tolist() == [104.0, 105.0, 106.0, 107.0, 108.0]
+    assert store.sizes.tolist() == [4.0, 0.0, 1.0, 2.0, 3.0]
+
+    fill(store, 100, 9)
+
+    spilled = load_spilled(path)
+
+    assert store.total == 109
+    assert 4 <= store.count <= 8
+    assert len(spilled) == store.spilled
+    assert np.array_equal(spilled["time"], np.arange(store.spilled, dtype = float))
+    assert np.array_equal(np.concatenate((spilled["price"], store.prices)),
+                          100.0 + np.arange(109))
+    assert np.array_equal(spilled["size"], np.arange(store.spilled) % 5.0)
+
+
+def test_spill_dropped_without_path():
+
+    store = TickStore(retention = 3)
+
+    fill(store, 20)
+
+    assert store.total == 20 and store.count >= 3
+    assert store.times.tolist() == [float(i) for i in range(20 - store.count, 20)]
+
+
+"""
+The spill file holds epoch times (origin added back), so spills of one
+session after another only ever grow
+"""
+def test_epoch_origin(tmp_path):
+
+    path = str(tmp_path / "AAA_ticks.bin")
+
+    first = TickStore(retention = 2, spill_path = path, origin = 1000.0)
+    fill(first, 5)
+
+    second = TickStore(retention = 2, spill_path = path, origin = 2000.0)
+    fill(second, 5)
+
+    spilled = load_spilled(path)
+
+    assert spilled["time"].tolist() == [1000.0, 1001.0, 2000.0, 2001.0]
+    assert np.all(np.diff(spilled["time"]) > 0)
+
+    #In memory the times stay relative to the origin
+    assert first.times.tolist() == [2.0, 3.0, 4.0]
+    assert spilled.dtype == TICK_DTYPE
+
+
+def test_latest():
+
+    store = TickStore(retention = 4)
+
+    times, prices, sizes = store.latest(3)
+    assert len(times) == len(prices) == len(sizes) == 0
+
+    fill(store, 2)
+    times, prices, sizes = store.latest(3)
+    assert times.tolist() == [0.0, 1.0] and prices.tolist() == [100.0, 101.0]
+
+    fill(store, 7, 2)
+    times, prices, sizes = store.latest(3)
+    assert times.tolist() == [6.0, 7.0, 8.0]
+    assert prices.tolist() == [106.0, 107.0, 108.0]
+    assert sizes.tolist() == [1.0, 2.0, 3.0]
+
+    #Views of the arrays, no copies
+    assert np.shares_memory(prices, store.price)
+
+    times, prices, sizes = store.latest(100)
+    assert len(times) == store.count
+
+
+def test_retention_checked():
+
+    with pytest.raises(ValueError):
+        TickStore(retention = 0)
+
+    assert len(load_spilled("does-not-exist.bin")) == 0
@@ -0,0 +1,96 @@
+import numpy as np
+
+from tradeledger import TradeLedger, execution_time
+
+
+"""
+Adds (side, execId, orderId, price, time) executions of 100 shares
+"""
+def fill(ledger, executions):
+
+    return [ledger.add_execution(side, execId, orderId, price, 100.0, t)
+            for side, execId, orderId, price, t in executions]
+
+
+DAY = [("BOT", "1.01", 1, 10.0, 100.0),
+       ("SLD", "2.01", 2, 11.0, 200.0),
+       ("BOT", "3.01", 3, 12.0, 300.0),
+       ("SLD", "4.01", 4, 15.0, 400.0),
+       ("BOT", "5.01", 5, 14.0, 500.0),
+       ("SLD", "6.01", 6, 13.0, 600.0)]
+
+
+def test_in_order():
+
+    ledger = TradeLedger()
+    fill(ledger, DAY)
+
+    assert np.allclose(ledger.trade_dist, [1.0, 3.0, -1.0])
+    assert ledger.long_trades[1].tolist() == [1, 3, 5]
+    assert ledger.short_trades[1].tolist() == [2, 4, 6]
+
+
+def test_out_of_order_matches_in_order():
+
+    expected = TradeLedger()
+    fill(expected, DAY)
+
+    #The session's own fills first, the earlier ones of the day once
+    #reconcile asks for them
+    for order in ([2, 3, 4, 5, 0, 1], [5, 4, 3, 2, 1, 0], [3, 0, 5, 1, 4, 2]):
+
+        ledger = TradeLedger(capacity = 1)
+        fill(ledger, [DAY[i] for i in order])
+
+        assert np.allclose(ledger.trade_dist, expected.trade_dist), order
+        assert np.array_equal(ledger.long_trades, expected.long_trades), order
+        assert np.array_equal(ledger.short_trades, expected.short_trades), order
+
+
+def test_sells_before_first_buy_are_skipped():
+
+    executions = [("SLD", "0.01", 9, 20.0, 50.0)] + DAY
+
+    expected = TradeLedger()
+    fill(expected, executions)
+
+    late = TradeLedger()
+    fill(late, executions[1:] + executions[:1])
+
+    assert expected.offset == late.offset == 1
+    assert np.allclose(late.trade_dist, [1.0, 3.0, -1.0])
+    assert np.allclose(late.trade_dist, expected.trade_dist)
+
+
+def test_duplicates_are_ignored():
+
+    ledger = TradeLedger()
+
+    assert all(fill(ledger, DAY))
+    assert not any(fill(ledger, DAY[::-1]))
+    assert len(ledger.long) == len(ledger.short) == 3
+    assert np.allclose(ledger.trade_dist, [1.0, 3.0, -1.0])
+
+
+def test_partial_fills_of_a_late_order():
+
+    ledger = TradeLedger()
+    fill(ledger, DAY[2:])
+
+    #Order 1 and 2 filled in two parts each, reported after the rest
+    ledger.add_execution("SLD", "2.01", 2, 11.0, 50.0, 200.0)
+    ledger.add_execution("BOT", "1.01", 1, 10.0, 50.0, 100.0)
+    ledger.add_execution("BOT", "1.02", 1, 12.0, 50.0, 101.0)
+    ledger.add_execution("SLD", "2.02", 2, 13.0, 50.0, 201.0)
+
+    assert ledger.long_trades[1].tolist() == [1, 3, 5]
+    assert np.allclose(ledger.trade_dist, [1.0, 3.0, -1.0])
+
+
+def test_execution_time():
+
+    assert execution_time("20240102  09:30:00") == execution_time("20240102 09:30:00")
+    assert execution_time("20240102  09:30:01") - execution_time("20240102  09:30:00") == 1.0
+    assert execution_time("20240102-14:30:00") == execution_time("20240102 14:30:00 UTC")
+    assert execution_time("", 5.0) == 5.0
+    assert execution_time("not a time") is None
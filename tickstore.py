@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+
+"""
+Record layout of a single tick. Used for the arrays held in memory as
+well as for the ticks that get spilled to disk, so a spill file can be
+read straight back with np.fromfile or np.memmap
+"""
+TICK_DTYPE = np.dtype([("time", "f8"), ("price", "f8"), ("size", "f8")])
+
+"""
+TickStore holds the ticks of a session in preallocated NumPy arrays
+with a fixed memory footprint
+
+The arrays are twice the size of "retention". Ticks are appended at the
+end, and once the arrays are full the oldest half is written to the
+spill file and the newest "retention" ticks are moved to the front.
+That keeps every append O(1) amortized, keeps at least "retention" of
+the latest ticks in memory, and means the latest N ticks are always
+one contiguous block so they can be handed out as views (no copies)
+
+If spill_path is None the oldest ticks are dropped instead of written
+
+The times held in memory are relative to the start of the session, the
+ones written to the spill file have "origin" (the epoch time they are
+measured from) added back. A spill file kept over several sessions then
+holds them one after the other with epoch times that only ever grow
+
+A spill moves the ticks held in memory to the front of the arrays, so
+views handed out before it (times, prices, sizes, latest) then point at
+other ticks. Copy what has to outlive the next append
+"""
+class TickStore:
+
+    def __init__(self, retention = 100000, spill_path = None, origin = 0.0):
+
+        if retention < 1:
+            raise ValueError("retention must be at least 1, got %r" % (retention,))
+
+        self.retention = retention
+        self.capacity = 2 * retention
+        self.spill_path = spill_path
+        self.origin = origin
+
+        self.time = np.empty(self.capacity, dtype = np.float64)
+        self.price = np.empty(self.capacity, dtype = np.float64)
+        self.size = np.empty(self.capacity, dtype = np.float64)
+
+        #Number of ticks currently in memory and number written to disk
+        self.count = 0
+        self.spilled = 0
+
+    def __len__(self):
+
+        return self.count
+
+    """
+    Total number of ticks seen, including the ones spilled to disk
+    """
+    @property
+    def total(self):
+
+        return self.spilled + self.count
+
+    """
+    Views over every tick that is still held in memory, valid until the
+    next spill
+    """
+    @property
+    def times(self):
+
+        return self.time[:self.count]
+
+    @property
+    def prices(self):
+
+        return self.price[:self.count]
+
+    @property
+    def sizes(self):
+
+        return self.size[:self.count]
+
+    def append(self, t, price, size = 0.0):
+
+        if self.count == self.capacity:
+            self._spill()
+
+        i = self.count
+        self.time[i] = t
+        self.price[i] = price
+        self.size[i] = size
+        self.count = i + 1
+
+    """
+    Returns (times, prices, sizes) views of the latest n ticks in memory
+    """
+    def latest(self, n):
+
+        start = max(self.count - n, 0)
+
+        return (self.time[start:self.count],
+                self.price[start:self.count],
+                self.size[start:self.count])
+
+    def _spill(self):
+
+        n = self.count - self.retention
+
+        if self.spill_path is not None:
+
+            records = np.empty(n, dtype = TICK_DTYPE)
+            records["time"] = self.time[:n] + self.origin
+            records["price"] = self.price[:n]
+            records["size"] = self.size[:n]
+
+            directory = os.path.dirname(self.spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok = True)
+
+            with append_records(self.spill_path, TICK_DTYPE) as f:
+                records.tofile(f)
+
+        self.time[:self.retention] = self.time[n:self.count]
+        self.price[:self.retention] = self.price[n:self.count]
+        self.size[:self.retention] = self.size[n:self.count]
+
+        self.count = self.retention
+        self.spilled += n
+
+
+"""
+Opens a file of fixed width records to append to. A record cut short at
+the end of the file (a crash in the middle of a write) is cut off first,
+otherwise every record appended after it would be read back shifted
+"""
+def append_records(path, dtype):
+
+    f = open(path, "ab")
+
+    size = f.tell()
+    torn = size % dtype.itemsize
+
+    if torn:
+        f.truncate(size - torn)
+
+    return f
+
+
+"""
+Memory maps a spill file written by TickStore. Returns a record array
+with "time" (epoch seconds), "price" and "size" fields, or an empty
+array if nothing has been spilled yet. A record cut short at the end of
+the file is left out
+"""
+def load_spilled(path):
+
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    count = size // TICK_DTYPE.itemsize
+
+    if count == 0:
+        return np.empty(0, dtype = TICK_DTYPE)
+
+    return np.memmap(path, dtype = TICK_DTYPE, mode = "r", shape = (count,))
@@ -0,0 +1,258 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+"""
+TradeColumns stores one side of the ledger (buys or sells) as a
+columnar array with one row per order:
+
+    row 0: average fill price
+    row 1: orderId
+    row 2: shares filled
+    row 3: time of the first fill (epoch seconds)
+
+Orders are kept sorted by time. The array doubles in capacity when it
+fills up, so appending an order is O(1) amortized instead of copying the
+whole array like np.insert does. Only an order older than the last one
+(executions of earlier in the day requested after the session's own) is
+inserted in between, which moves the orders after it. Partial fills of
+an order already in the ledger are folded into its average price through
+the orderId -> column index
+"""
+class TradeColumns:
+
+    def __init__(self, capacity = 64):
+
+        self.data = np.zeros((4, max(capacity, 1)), dtype = np.float64)
+        self.count = 0
+        self.index = {}
+
+    def __len__(self):
+
+        return self.count
+
+    """
+    View of the [price, orderId] rows, same layout as the old 2xN arrays
+    """
+    @property
+    def trades(self):
+
+        return self.data[:2, :self.count]
+
+    @property
+    def times(self):
+
+        return self.data[3, :self.count]
+
+    """
+    Adds a fill and returns (column it was stored in, True if the order
+    was inserted in front of orders already held)
+    """
+    def add(self, orderId, price, shares, t):
+
+        col = self.index.get(orderId)
+
+        if col is not None:
+
+            filled = self.data[2, col]
+            total = filled + shares
+
+            if total > 0:
+                self.data[0, col] = (self.data[0, col] * filled + price * shares) / total
+
+            self.data[2, col] = total
+
+            return col, False
+
+        if self.count == self.data.shape[1]:
+            grown = np.zeros((4, 2 * self.count), dtype = np.float64)
+            grown[:, :self.count] = self.data
+            self.data = grown
+
+        col = self.count
+        inserted = col > 0 and t < self.data[3, col - 1]
+
+        if inserted:
+
+            #Orders with the same time keep the order they came in
+            col = int(np.searchsorted(self.data[3, :self.count], t, side = "right"))
+            self.data[:, col + 1:self.count + 1] = self.data[:, col:self.count]
+
+            for k in range(col + 1, self.count + 1):
+                self.index[self.data[1, k]] = k
+
+        self.data[:, col] = (price, orderId, shares, t)
+        self.index[orderId] = col
+        self.count += 1
+
+        return col, inserted
+
+
+"""
+Time of an execution in epoch seconds from the time field TWS sends,
+"yyyymmdd  hh:mm:ss" in the time zone of TWS (optionally followed by the
+name of the zone) or "yyyymmdd-hh:mm:ss" in UTC. Returns default when it
+cannot be read
+"""
+def execution_time(stamp, default = None):
+
+    parts = (stamp or "").split()
+
+    try:
+
+        if len(parts) == 1:
+            moment = datetime.strptime(parts[0], "%Y%m%d-%H:%M:%S").replace(tzinfo = timezone.utc)
+        elif len(parts) >= 2:
+            moment = datetime.strptime(parts[0] + " " + parts[1], "%Y%m%d %H:%M:%S")
+        else:
+            return default
+
+    except ValueError:
+        return default
+
+    if len(parts) > 2 and ZoneInfo is not None:
+        try:
+            moment = moment.replace(tzinfo = ZoneInfo(parts[2]))
+        except (KeyError, ValueError):
+            pass
+
+    return moment.timestamp()
+
+
+"""
+TradeLedger keeps the buys and sells of one contract along with the
+profit of every closed round trip
+
+Executions are de-duplicated by execId with a set, so requesting the
+day's executions again does not add anything twice
+
+Buys and sells are paired by the time they were executed, not the order
+they came in: the n-th buy is closed by the n-th sell made after the
+first buy. Sells made before any buy (selling a position held from
+before the session) are skipped. A fill that comes in after the ones
+made later than it only touches its own pair, so keeping the profit per
+trade ("trade_dist") up to date is O(1) per fill. A fill made before ones
+already held moves the pairs after it, which are then worked out again
+"""
+class TradeLedger:
+
+    def __init__(self, capacity = 64):
+
+        self.long = TradeColumns(capacity)
+        self.short = TradeColumns(capacity)
+        self.execIds = set()
+
+        self.pnl = np.zeros(max(capacity, 1), dtype = np.float64)
+        self.closed = 0
+
+        #Number of sells that happened before the first buy
+        self.offset = 0
+
+    @property
+    def long_trades(self):
+
+        return self.long.trades
+
+    @property
+    def short_trades(self):
+
+        return self.short.trades
+
+    @property
+    def trade_dist(self):
+
+        return self.pnl[:self.closed]
+
+    def has_execution(self, execId):
+
+        return execId in self.execIds
+
+    """
+    Records an execution. "side" is the IB execution side, "BOT" or "SLD",
+    and "t" the time it was made (see execution_time), executions without
+    one count as made after every one before them
+
+    Returns False if the execution was already in the ledger
+    """
+    def add_execution(self, side, execId, orderId, price, shares, t = None):
+
+        if execId in self.execIds:
+            return False
+
+        if side not in ("BOT", "SLD"):
+            raise ValueError("unknown execution side %r" % (side,))
+
+        columns = self.long if side == "BOT" else self.short
+
+        if t is None:
+            t = np.nextafter(max(self.long.data[3, self.long.count - 1] if self.long.count else 0.0,
+                                 self.short.data[3, self.short.count - 1] if self.short.count else 0.0),
+                             np.inf)
+
+        first = side == "BOT" and len(self.long) == 0
+        new = orderId not in columns.index
+        col, inserted = columns.add(orderId, price, shares, t)
+
+        self.execIds.add(execId)
+
+        #The first buy decides which sells came before it, a fill made
+        #before others moves every pair after it
+        if inserted or first or (side == "SLD" and len(self.long) and t < self.long.data[3, 0]):
+            self._pair()
+            return True
+
+        if side == "SLD" and len(self.long) == 0 and new:
+            self.offset += 1
+
+        pair = col if side == "BOT" else col - self.offset
+
+        #A new fill can close at most one more round trip, a partial fill
+        #of an order that is already paired only changes its own profit
+        closed = max(0, min(len(self.long), len(self.short) - self.offset))
+
+        if closed > self.closed:
+
+            self._grow(closed)
+
+            for k in range(self.closed, closed):
+                self._close(k)
+
+            self.closed = closed
+
+        if 0 <= pair < self.closed:
+            self._close(pair)
+
+        return True
+
+    """
+    Works out the offset and the profit of every pair again
+    """
+    def _pair(self):
+
+        if len(self.long):
+            self.offset = int(np.searchsorted(self.short.times, self.long.data[3, 0], side = "left"))
+        else:
+            self.offset = len(self.short)
+
+        closed = max(0, min(len(self.long), len(self.short) - self.offset))
+
+        self._grow(closed)
+        self.pnl[:closed] = (self.short.data[0, self.offset:self.offset + closed]
+                             - self.long.data[0, :closed])
+        self.closed = closed
+
+    def _grow(self, closed):
+
+        if closed > len(self.pnl):
+            grown = np.zeros(max(2 * len(self.pnl), closed), dtype = np.float64)
+            grown[:self.closed] = self.pnl[:self.closed]
+            self.pnl = grown
+
+    def _close(self, k):
+
+        self.pnl[k] = self.short.data[0, k + self.offset] - self.long.data[0, k]
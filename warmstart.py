@@ -0,0 +1,264 @@
+import math
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from tickstore import TICK_DTYPE, append_records
+from recorder import load_ticks
+
+"""
+Warm start of the strategy from historical bars
+
+Without it run_strategy waits for long_window live ticks after every
+start. WarmStart loads recent bars for each instrument when it is
+subscribed and puts their closes into the tick store and moving averages
+ahead of the live ticks, so the first live tick can already be traded on
+
+Bars are kept in an on-disk cache, one TICK_DTYPE file per symbol (time
+of the bar, close, volume). On a restart the cached bars are used and
+only the bars since the last cached one are requested from TWS with
+reqHistoricalData. If the cache is less than a bar old nothing is
+requested at all. Bars older than the lookback ("duration") are dropped
+from the cache on every start, so it never holds more than that. Live
+ticks that arrive while the request is out are held by the instrument
+and added right after the history
+
+The closes are only a stand-in for the prices the strategy sees when it
+trades on every tick, or on time bars of the same length as the history
+bars. Instruments that trade on other bars (see bars.py) are not warm
+started
+"""
+
+#Length of each bar size TWS accepts that warm starts are used with
+BAR_SECONDS = {"1 secs": 1, "5 secs": 5, "10 secs": 10, "15 secs": 15, "30 secs": 30,
+               "1 min": 60, "2 mins": 120, "3 mins": 180, "5 mins": 300, "10 mins": 600,
+               "15 mins": 900, "20 mins": 1200, "30 mins": 1800, "1 hour": 3600,
+               "2 hours": 7200, "3 hours": 10800, "4 hours": 14400, "8 hours": 28800,
+               "1 day": 86400}
+
+#Seconds in each durationStr unit
+DURATION_SECONDS = {"S": 1, "D": 86400, "W": 7 * 86400, "M": 30 * 86400, "Y": 365 * 86400}
+
+#reqIds of the historical data requests, offset from the market data
+#reqId of the instrument so the two can never collide
+HISTORY_REQ_OFFSET = 10000
+
+
+"""
+durationStr for reqHistoricalData covering at least "seconds" seconds
+"""
+def duration_for(seconds):
+
+    seconds = max(int(math.ceil(seconds)), 1)
+
+    if seconds <= 86400:
+        return "%d S" % seconds
+
+    return "%d D" % int(math.ceil(seconds / 86400))
+
+
+"""
+Seconds covered by a durationStr such as "1 D" or "3600 S"
+"""
+def duration_seconds(duration):
+
+    number, unit = duration.split()
+
+    return int(number) * DURATION_SECONDS[unit.upper()]
+
+
+"""
+Time of a bar in epoch seconds. Intraday bars come as epoch seconds with
+formatDate 2, daily bars as yyyymmdd
+"""
+def bar_time(date):
+
+    date = date.strip()
+
+    try:
+        return float(date)
+    except ValueError:
+        pass
+
+    for layout in ("%Y%m%d  %H:%M:%S", "%Y%m%d %H:%M:%S", "%Y%m%d"):
+        try:
+            return datetime.strptime(date, layout).timestamp()
+        except ValueError:
+            pass
+
+    raise ValueError("unknown bar date %r" % (date,))
+
+
+"""
+HistoryCache: bars per symbol in <directory>/<symbol>_bars.bin
+"""
+class HistoryCache:
+
+    def __init__(self, directory):
+
+        self.directory = directory
+
+    def path(self, symbol):
+
+        return os.path.join(self.directory, symbol + "_bars.bin")
+
+    """
+    Cached bars of the symbol, copied into memory so the file is not held
+    open
+    """
+    def load(self, symbol):
+
+        return np.array(load_ticks(self.path(symbol)))
+
+    """
+    Drops the cached bars from before "after" and returns the ones kept
+    """
+    def trim(self, symbol, after):
+
+        bars = self.load(symbol)
+        kept = bars[bars["time"] > after]
+
+        if len(kept) < len(bars):
+
+            path = self.path(symbol)
+
+            kept.tofile(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+        return kept
+
+    """
+    Appends the bars that are newer than the last one already cached
+    """
+    def append(self, symbol, bars, after = None):
+
+        if after is not None:
+            bars = bars[bars["time"] > after]
+
+        if len(bars):
+
+            os.makedirs(self.directory, exist_ok = True)
+
+            with append_records(self.path(symbol), TICK_DTYPE) as f:
+                bars.tofile(f)
+
+        return len(bars)
+
+
+class WarmStart:
+
+    def __init__(self, app, cache_dir = "history", bar_size = "1 min", duration = "1 D",
+                 whatToShow = "TRADES", useRTH = 1):
+
+        self.app = app
+        self.cache = HistoryCache(cache_dir) if cache_dir else None
+        self.bar_size = bar_size
+        self.bar_seconds = BAR_SECONDS[bar_size]
+        self.duration = duration
+        self.lookback = duration_seconds(duration)
+        self.whatToShow = whatToShow
+        self.useRTH = useRTH
+
+        #reqId -> (instrument, cached bars, bars received)
+        self.requests = {}
+
+    """
+    True if the instrument can be seeded with the history bars: it trades
+    on every tick, or on time bars of the same length
+    """
+    def fits(self, instrument):
+
+        bars = instrument.bars
+
+        return bars is None or (bars.bar_type == "time" and bars.bar_size == self.bar_seconds)
+
+    """
+    Seeds the instrument from the cache and requests whatever is missing
+    """
+    def start(self, instrument):
+
+        if not self.fits(instrument):
+            return
+
+        symbol = instrument.contract.symbol
+        now = time.time()
+
+        if self.cache is not None:
+            cached = self.cache.trim(symbol, now - self.lookback)
+        else:
+            cached = np.empty(0, dtype = TICK_DTYPE)
+
+        if len(cached) and now - cached["time"][-1] < 2 * self.bar_seconds:
+            self.seed(instrument, cached)
+            return
+
+        if len(cached):
+            duration = duration_for(now - cached["time"][-1] + self.bar_seconds)
+        else:
+            duration = self.duration
+
+        reqId = HISTORY_REQ_OFFSET + instrument.reqId
+        self.requests[reqId] = (instrument, cached, [])
+        instrument.warming = True
+
+        self.app.reqHistoricalData(reqId, instrument.contract, "", duration, self.bar_size,
+                                   self.whatToShow, self.useRTH, 2, False, [])
+
+    def owns(self, reqId):
+
+        return reqId in self.requests
+
+    def bar(self, reqId, bar):
+
+        self.requests[reqId][2].append((bar_time(bar.date), bar.close, float(bar.volume)))
+
+    """
+    Called on historicalDataEnd, or on an error for the request in which
+    case only the bars received so far (and the cache) are used
+    """
+    def end(self, reqId):
+
+        instrument, cached, received = self.requests.pop(reqId)
+        bars = np.array(received, dtype = TICK_DTYPE)
+
+        if len(cached):
+            bars = bars[bars["time"] > cached["time"][-1]]
+
+        #The last bar can still be in progress, it is used but not cached
+        if self.cache is not None:
+            complete = bars[bars["time"] + self.bar_seconds <= time.time()]
+            self.cache.append(instrument.contract.symbol, complete)
+
+        self.seed(instrument, np.concatenate((np.asarray(cached), bars)))
+
+    """
+    Puts the bars into the instrument, then the live ticks held while
+    waiting, and lets the strategy decide straight away
+
+    An instrument trading on time bars builds the bar that is still in
+    progress from the live ticks, so only complete history bars go in
+    """
+    def seed(self, instrument, bars):
+
+        if instrument.bars is not None:
+            bars = bars[bars["time"] + self.bar_seconds <= time.time()]
+
+        bars = bars[-instrument.ticks.retention:]
+        current_time = self.app.current_time
+
+        self.app.seed(instrument, (bars["time"] - current_time).tolist(), bars["price"].tolist(),
+                      bars["size"].tolist())
+
+        pending, instrument.pending = instrument.pending, []
+        instrument.warming = False
+
+        #Trade sizes are held as (None, size) after their price
+        for t, value in pending:
+            if t is None:
+                self.app.store_size(instrument, value)
+            else:
+                self.app.store_tick(instrument, t, value)
+
+        self.app.run_strategy(instrument)